@@ -0,0 +1,382 @@
+#!/usr/bin/env python2
+
+import hashlib
+import random
+import socket
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+if sys.version_info[0] < 3:
+    from urllib import quote
+    from urllib2 import urlopen, Request, HTTPError
+    from urlparse import urlparse
+else:
+    from urllib.request import urlopen, Request
+    from urllib.error import HTTPError
+    from urllib.parse import urlparse, quote
+
+from marionette_driver.errors import NoSuchElementException
+
+from bench.server import HEADER_SAVED, HEADER_RENDER_DELAY, HEADER_MISSING, HEADER_IN_APP, SESSION_COOKIE
+from utils.marionette import PREFETCH_SCRIPT, LOADED_SCRIPT, USER_AGENT_SCRIPT, IN_APP_SCRIPT, LOCATION_SCRIPT, FRESH, \
+    READY_STATE_SCRIPT, BLANK_URL, MEMORY_SCRIPT, MINIMIZE_MEMORY_SCRIPT
+from utils.lean import PAGE_WEIGHT_SCRIPT
+from utils.waits import WAIT_SCRIPT
+from utils.places import place_key
+
+
+LEGACY_SAVE_BUTTON = ".section-entity-action-save-button"
+SAVE_BUTTON = "[data-value='Save']"
+SAVED_MARKER = "[data-value='Saved']"
+ACTION_MENU_ITEM = "#action-menu [data-index='{}']"
+
+# The stand-in doesn't load resources, a real place page adds about this many
+# bytes of tiles, photos and fonts unless images are blocked
+SIMULATED_RESOURCE_BYTES = 1500 * 1024
+
+# Interval (in seconds) the simulated wait script checks the elements at
+WAIT_POLL_INTERVAL = 0.005
+
+# Simulated memory of Firefox: the browser itself and what every page leaves behind in its tab
+SIMULATED_BASE_MEMORY = 300 * 1024 * 1024
+SIMULATED_PAGE_MEMORY = 1024 * 1024
+
+
+def maps_location(url):
+    """
+    Google Maps rewrites the location to the place it shows, with its feature ID. A URL
+    without a CID gets one derived from its key, the stand-in doesn't know the real one.
+    @return: The location of the place of the URL
+    """
+    key = place_key(url)
+    cid = int(key[4:]) if key.startswith("cid:") else int(hashlib.md5(key.encode("utf-8")).hexdigest()[:15], 16)
+    return "https://www.google.com/maps/place/data=!4m2!3m1!1s0x0:0x{:x}".format(cid)
+
+
+def split_selector(selector):
+    """
+    @return: The selector without the FRESH suffix and whether or not it had one
+    """
+    if selector.endswith(FRESH):
+        return selector[:-len(FRESH)], True
+    return selector, False
+
+
+class FakeElement:
+    """
+    An element of the simulated page.
+    """
+
+    def __init__(self, client, selector):
+        self.client = client
+        self.selector = split_selector(selector)[0]
+
+    @property
+    def text(self):
+        return self.client.elements[self.selector]["text"]
+
+    def click(self):
+        self.client.click(self.selector)
+
+
+class FakeTab:
+    """
+    A tab of the stand-in, it holds the simulated elements of its page.
+    """
+
+    def __init__(self):
+        self.url = None
+        self.page_source = u""
+        # Simulated elements by selector: text and the time they appear
+        self.elements = {}
+        self.loaded = True
+        # Number of pages the tab loaded, every one makes the next slower
+        self.loads = 0
+
+
+class FakeMarionette:
+    """
+    A stand-in for marionette_driver.marionette.Marionette. Instead of rendering
+    pages it requests them from the mock server, which injects the latencies and
+    failures, and simulates the few elements MarionetteHelper interacts with.
+    A tab slows down with every page it loaded by the leak latency and the
+    connection drops on a share of the navigations, the disconnect rate.
+    """
+
+    CONTEXT_CHROME = "chrome"
+    CONTEXT_CONTENT = "content"
+
+    # Seconds every page load takes longer per page the tab loaded before
+    leak_latency = 0.0
+    disconnect_rate = 0.0
+    rnd = random.Random(0)
+
+    def __init__(self, base_url, host=None, port=None):
+        self.base_url = base_url
+        self.host = host
+        self.port = port
+        self.tabs = {"tab-0": FakeTab()}
+        self.opened = 1
+        self.prefs = {}
+        self.current_window_handle = "tab-0"
+        self.context = self.CONTEXT_CONTENT
+        # Whether or not the connection dropped
+        self.dropped = False
+
+    @property
+    def tab(self):
+        return self.tabs[self.current_window_handle]
+
+    @property
+    def url(self):
+        return self.tab.url
+
+    @property
+    def page_source(self):
+        return self.tab.page_source
+
+    @property
+    def elements(self):
+        return self.tab.elements
+
+    @property
+    def window_handles(self):
+        return sorted(self.tabs)
+
+    def start_session(self):
+        return {}
+
+    def delete_session(self, send_request=True):
+        pass
+
+    def get_pref(self, pref, default_branch=False, value_type="unspecified"):
+        return self.prefs.get(pref)
+
+    def set_pref(self, pref, value, default_branch=False):
+        self.prefs[pref] = value
+
+    def set_prefs(self, prefs, default_branch=False):
+        self.prefs.update(prefs)
+
+    def clear_pref(self, pref):
+        self.prefs.pop(pref, None)
+
+    def get_cookies(self):
+        return [{"name": SESSION_COOKIE, "value": "bench", "domain": ".google.com", "path": "/"}]
+
+    @contextmanager
+    def using_context(self, context):
+        previous, self.context = self.context, context
+        try:
+            yield
+        finally:
+            self.context = previous
+
+    def open(self, type=None, focus=False):
+        handle = "tab-{}".format(self.opened)
+        self.opened += 1
+        self.tabs[handle] = FakeTab()
+        return {"handle": handle, "type": "tab"}
+
+    def switch_to_window(self, handle, focus=True):
+        self.current_window_handle = handle
+
+    def close(self):
+        del self.tabs[self.current_window_handle]
+        return self.window_handles
+
+    def rewrite(self, url):
+        """
+        Point a Google URL to the mock server.
+        @return: The URL of the mock server
+        """
+        parsed = urlparse(url)
+        if parsed.path.startswith("/bookmarks"):
+            return "{}/bookmarks/?{}".format(self.base_url, parsed.query)
+        return "{}/maps?{}".format(self.base_url, parsed.query)
+
+    def load(self, tab, url, in_app=False):
+        """
+        Load a page into a tab, the running app only requests the place.
+        @return: -
+        """
+        tab.loads += 1
+        if self.leak_latency > 0:
+            time.sleep(tab.loads * self.leak_latency)
+        response = urlopen(Request(self.rewrite(url), headers={HEADER_IN_APP: "1" if in_app else "0"}))
+        page_source = response.read().decode("utf-8")
+        elements = {}
+        headers = response.info()
+        if headers.get(HEADER_SAVED) is not None and headers.get(HEADER_MISSING) != "1":
+            # A place page, the buttons show up after rendering
+            appears = time.time() + float(headers.get(HEADER_RENDER_DELAY))
+            saved = headers.get(HEADER_SAVED) == "1"
+            elements[LEGACY_SAVE_BUTTON] = {"text": "SAVED" if saved else "SAVE", "appears": appears}
+            elements[SAVED_MARKER if saved else SAVE_BUTTON] = {"text": "Saved" if saved else "Save", "appears": appears}
+        tab.url, tab.page_source, tab.elements, tab.loaded = url, page_source, elements, True
+
+    def navigate(self, url):
+        """
+        Load a page, it blocks until the mock server responded like Marionette
+        blocks until the page is loaded.
+        @return: -
+        """
+        self.check_connection()
+        if self.disconnect_rate > 0 and self.rnd.random() < self.disconnect_rate:
+            self.dropped = True
+            self.check_connection()
+        if url == BLANK_URL:
+            self.tabs[self.current_window_handle] = FakeTab()
+            return
+        self.load(self.tab, url)
+
+    def prefetch(self, url):
+        """
+        Load a page in the background, like setting 'window.location.href'.
+        @return: -
+        """
+        tab = self.tab
+        tab.loaded = False
+        thread = threading.Thread(target=self.load, args=(tab, url))
+        thread.daemon = True
+        thread.start()
+
+    def navigate_in_app(self, url):
+        """
+        Show another place in the running app, like IN_APP_SCRIPT. The elements of
+        the current place are marked stale until the ones of the next replace them.
+        @return: Whether or not an app was running
+        """
+        tab = self.tab
+        if tab.url is None or urlparse(tab.url).path.startswith("/bookmarks"):
+            return False
+        for element in tab.elements.values():
+            element["stale"] = True
+        thread = threading.Thread(target=self.load, args=(tab, url, True))
+        thread.daemon = True
+        thread.start()
+        return True
+
+    def check_connection(self):
+        """
+        Fail like the socket of Marionette once the connection dropped.
+        @return: -
+        """
+        if self.dropped:
+            raise socket.error("Connection reset by peer")
+
+    def memory(self):
+        """
+        @return: The simulated memory (in bytes) of Firefox
+        """
+        return SIMULATED_BASE_MEMORY + sum(tab.loads for tab in self.tabs.values()) * SIMULATED_PAGE_MEMORY
+
+    def element(self, selector):
+        """
+        @return: The element matching a selector, stale ones only match without FRESH, or None
+        """
+        selector, fresh = split_selector(selector)
+        element = self.elements.get(selector)
+        if element is None or (fresh and element.get("stale")):
+            return None
+        return element
+
+    def save(self):
+        """
+        Save the current place on the mock server.
+        @return: Whether or not the place was saved
+        """
+        request = Request("{}/save?place={}".format(self.base_url, quote(self.url, safe="")), data=b"")
+        try:
+            urlopen(request).read()
+            return True
+        except HTTPError:
+            return False
+
+    def click(self, selector):
+        """
+        Simulate a click on an element.
+        @return: -
+        """
+        selector = split_selector(selector)[0]
+        if selector == LEGACY_SAVE_BUTTON:
+            if self.save():
+                self.elements[selector]["text"] = "SAVED"
+        elif selector == SAVE_BUTTON:
+            now = time.time()
+            for index in (1, 2):
+                self.elements[ACTION_MENU_ITEM.format(index)] = {"text": "", "appears": now}
+        elif selector.startswith("#action-menu"):
+            if self.save():
+                now = time.time()
+                for key in list(self.elements):
+                    if key.startswith("#action-menu") or key == SAVE_BUTTON:
+                        del self.elements[key]
+                self.elements[SAVED_MARKER] = {"text": "Saved", "appears": now}
+
+    def find_element(self, by, value):
+        """
+        Find an element which already appeared.
+        @return: The element
+        """
+        element = self.element(value)
+        if element is None or element["appears"] > time.time():
+            raise NoSuchElementException("Unable to locate element: {}".format(value))
+        return FakeElement(self, value)
+
+    def wait(self, conditions, timeout):
+        """
+        Simulate the wait script of utils.waits, it resolves when the first of the
+        conditions is met or after the timeout. The elements are checked repeatedly,
+        as a page loading in the background replaces them.
+        @return: Index of the met condition and the text of its element, or None
+        """
+        end = time.time() + timeout
+        while True:
+            now = time.time()
+            best = None
+            for index, condition in enumerate(conditions):
+                element = self.element(condition["selector"])
+                if element is None:
+                    continue
+                if condition["text"] is not None and element["text"].upper() != condition["text"].upper():
+                    continue
+                if best is None or element["appears"] < best[0]:
+                    best = (element["appears"], index, element["text"])
+            if best is not None and best[0] <= now:
+                return [best[1], best[2]]
+            if now >= end:
+                return None
+            time.sleep(min(WAIT_POLL_INTERVAL if best is None else max(0, best[0] - now), end - now))
+
+    def execute_async_script(self, script, script_args=(), new_sandbox=True, sandbox="default", script_timeout=None):
+        self.check_connection()
+        if script == MEMORY_SCRIPT and self.context == self.CONTEXT_CHROME:
+            return self.memory()
+        if script == MINIMIZE_MEMORY_SCRIPT and self.context == self.CONTEXT_CHROME:
+            return True
+        if script == WAIT_SCRIPT:
+            return self.wait(script_args[0], script_args[1] / 1000.0)
+        return None
+
+    def execute_script(self, script, script_args=(), new_sandbox=True, sandbox="default", script_timeout=None):
+        self.check_connection()
+        if script == PREFETCH_SCRIPT:
+            return self.prefetch(script_args[0])
+        if script == IN_APP_SCRIPT:
+            return self.navigate_in_app(script_args[0])
+        if script == READY_STATE_SCRIPT:
+            return "complete" if self.tab.loaded else "loading"
+        if script == LOCATION_SCRIPT:
+            return maps_location(self.url) if self.url else BLANK_URL
+        if script == LOADED_SCRIPT:
+            return self.tab.loaded
+        if script == USER_AGENT_SCRIPT:
+            return "spi-bench"
+        if script == PAGE_WEIGHT_SCRIPT:
+            weight = len(self.page_source.encode("utf-8"))
+            return weight if self.prefs.get("permissions.default.image") == 2 else weight + SIMULATED_RESOURCE_BYTES
+        return None
+
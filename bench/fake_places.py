@@ -0,0 +1,21 @@
+#!/usr/bin/env python2
+
+import hashlib
+import time
+
+
+class FakePlacesClient:
+    """
+    A stand-in for googlemaps.Client, every place search finds exactly the place
+    searched for at the center of the location bias, after the passed latency.
+    """
+
+    def __init__(self, latency=0.0):
+        self.latency = latency
+
+    def find_place(self, input, input_type, fields=None, location_bias=None, language=None):
+        time.sleep(self.latency)
+        # The bias is 'circle:radius@lat,lon'
+        lat, lon = [float(value) for value in location_bias.split("@", 1)[1].split(",")]
+        place_id = "bench-" + hashlib.md5(input.encode("utf-8")).hexdigest()
+        return {"candidates": [{"place_id": place_id, "name": input, "geometry": {"location": {"lat": lat, "lng": lon}}}]}
@@ -0,0 +1,386 @@
+#!/usr/bin/env python2
+# encoding: utf-8
+"""
+Offline benchmark of batch imports. It serves a mock Google Maps place page and
+a mock Google Bookmarks API locally, drives SavedPlacesImporter through a
+Marionette stand-in against them and reports places per second and the latency
+of every phase. With '--baseline' it fails if throughput regressed. With
+'--export' it exports the bookmarks of the mock account instead and imports
+the export file again.
+"""
+
+import argparse
+import json
+import logging
+import os
+import random
+import resource
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+
+from spi import SavedPlacesImporter  # noqa: E402
+from utils.marionette import MarionetteHelper  # noqa: E402
+from utils.http_backend import HttpBackend  # noqa: E402
+from bench.fake_marionette import FakeMarionette  # noqa: E402
+from bench.fake_places import FakePlacesClient  # noqa: E402
+from bench.server import MockConfig, MockState, start_server  # noqa: E402
+from utils.sources import ImportStream, import_format  # noqa: E402
+from utils.constants import LIST_STARRED_PLACES  # noqa: E402
+
+
+# Spans reported per run
+REPORTED_SPANS = (
+    "get_existing_bookmarks",
+    "add_feature",
+    "add_feature_2",
+    "add_feature/navigate",
+    "add_feature_2/navigate",
+    "add_feature/navigate_in_app",
+    "add_feature_2/navigate_in_app",
+    "add_feature/wait_prefetched",
+    "add_feature/wait_save_button",
+    "add_feature/click",
+    "add_feature/wait_saved",
+    "add_feature/save",
+    "recycle",
+    "add_feature/reconnect",
+    "export",
+    "export/navigate",
+    "export/request",
+    "export/parse",
+    "export/write",
+)
+
+# Share of the features at the start and the end of a run whose throughput is compared
+EDGE_SHARE = 0.1
+
+
+class BenchHelper(MarionetteHelper):
+    """
+    A MarionetteHelper talking to the Marionette stand-in instead of Firefox.
+    """
+
+    base_url = None
+
+    def connect(self):
+        return FakeMarionette(self.base_url, self.host, self.port)
+
+    def reachable(self):
+        return True
+
+
+class BenchImporter(SavedPlacesImporter):
+    """
+    A SavedPlacesImporter using BenchHelper for every worker and the Places API stand-in,
+    it keeps the time every feature completed at.
+    """
+
+    lookup_latency = 0.0
+
+    def __init__(self, args):
+        SavedPlacesImporter.__init__(self, args)
+        self.completed = []
+
+    def init_places_api(self):
+        if self.gm is None:
+            self.gm = FakePlacesClient(self.lookup_latency)
+        return True
+
+    def record_result(self, nums, i, num_features, feature, ret):
+        self.completed.append(time.time())
+        SavedPlacesImporter.record_result(self, nums, i, num_features, feature, ret)
+
+    def create_helper(self, port):
+        return BenchHelper(self.logger, self.success_symbol, self.failure_symbol, self.timing, port=port)
+
+    def create_http_backend(self):
+        cookies, user_agent = self.marionette.get_session_cookies()
+        return HttpBackend(self.logger, self.timing, cookies, user_agent, base_url=BenchHelper.base_url,
+                           pool_size=self.workers)
+
+
+def place_url(i):
+    """
+    @return: The Google Maps URL of the i-th synthetic place
+    """
+    return "http://maps.google.com/?cid={}".format(10 ** 15 + i)
+
+
+def bookmark_url(i, rnd):
+    """
+    @return: The Google Maps URL of the i-th synthetic bookmark, every other one has coordinates
+    """
+    if i % 2 == 0:
+        return place_url(i)
+    return "{}&ll={:.6f},{:.6f}".format(place_url(i), rnd.uniform(-80, 80), rnd.uniform(-180, 180))
+
+
+def generate_geo_json(path, size, seed):
+    """
+    Write a synthetic GeoJSON file in the format of Google Takeout.
+    @return: -
+    """
+    rnd = random.Random(seed)
+    with open(path, "w") as f:
+        f.write('{\n  "type" : "FeatureCollection",\n  "features" : [')
+        for i in range(size):
+            lat, lon = rnd.uniform(-80, 80), rnd.uniform(-180, 180)
+            feature = {
+                "geometry": {"coordinates": [lon, lat], "type": "Point"},
+                "properties": {
+                    "Google Maps URL": place_url(i),
+                    "Location": {"Latitude": "{:.6f}".format(lat), "Longitude": "{:.6f}".format(lon)},
+                    "Title": "Place {}".format(i),
+                },
+                "type": "Feature",
+            }
+            f.write("{} {}".format("," if i > 0 else "", json.dumps(feature)))
+        f.write(" ]\n}\n")
+
+
+def edge_throughput(completed):
+    """
+    Compare the throughput of the first and the last features of a run, e.g. to see if it degrades.
+    @return: Tuple of the places per second at the start and at the end
+    """
+    count = int(len(completed) * EDGE_SHARE)
+    if count < 2:
+        return 0.0, 0.0
+    first, last = completed[count - 1] - completed[0], completed[-1] - completed[-count]
+    return (count - 1) / first if first > 0 else 0.0, (count - 1) / last if last > 0 else 0.0
+
+
+def run(size, args):
+    """
+    Run one benchmark, i.e. import a synthetic GeoJSON file with the passed number of features.
+    @return: A dictionary of the results
+    """
+    tmp = tempfile.mkdtemp(prefix="spi-bench-")
+    try:
+        import_file = os.path.join(tmp, "bench-{}.json".format(size))
+        generate_geo_json(import_file, size, args.seed)
+        config = MockConfig(
+            page_latency=args.page_latency, save_latency=args.save_latency, render_delay=args.render_delay,
+            jitter=args.jitter, failure_rate=args.failure_rate, missing_rate=args.missing_rate, seed=args.seed,
+            boot_latency=args.boot_latency, legacy_latency=args.legacy_latency
+        )
+        existing = int(size * args.existing)
+        state = MockState((place_url(i), place_url(i)) for i in random.Random(args.seed).sample(range(size), existing))
+        server = start_server(config, state)
+        BenchHelper.base_url = server.base_url
+        FakeMarionette.leak_latency = args.leak_latency
+        FakeMarionette.disconnect_rate = args.disconnect_rate
+        FakeMarionette.rnd.seed(args.seed)
+        BenchImporter.lookup_latency = args.lookup_latency
+        importer = BenchImporter(argparse.Namespace(
+            import_files=[import_file], dry_run=False, compare=False, list_add=LIST_STARRED_PLACES,
+            workers=args.workers, marionette_ports=list(range(2828, 2828 + args.workers)),
+            resume=False, journal_file=os.path.join(tmp, "journal.sqlite"),
+            bookmarks_file=os.path.join(tmp, "bookmarks.json"), refresh_bookmarks=False,
+            max_rate=args.max_rate, metrics_file=None, tabs=args.tabs, backend=args.backend, lean=args.lean,
+            in_app=args.in_app, retries=args.retries, retry_backoff=args.retry_backoff,
+            recycle_every=args.recycle_every, memory_limit=args.memory_limit, resolve_places=args.resolve_places,
+        ))
+        # Logging every feature would dominate the measurement
+        logging.getLogger().setLevel(logging.DEBUG if args.verbose else logging.WARNING)
+        start = time.time()
+        nums, times = importer.process()
+        elapsed = time.time() - start
+        connections = server.connections
+        server.shutdown()
+        server.server_close()
+    finally:
+        shutil.rmtree(tmp)
+    return {
+        "size": size,
+        "elapsed": elapsed,
+        "places_per_second": size / elapsed if elapsed > 0 else 0,
+        "edge_places_per_second": edge_throughput(importer.completed),
+        "results": nums,
+        "connections": connections,
+        "spans": dict((name, times["spans"][name]) for name in REPORTED_SPANS if name in times["spans"]),
+    }
+
+
+def run_export(size, args):
+    """
+    Run one export benchmark, i.e. export a mock account with the passed number of
+    bookmarks and import the export file again.
+    @return: A dictionary of the results
+    """
+    tmp = tempfile.mkdtemp(prefix="spi-bench-")
+    try:
+        export_file = os.path.join(tmp, "export-{}.{}".format(size, args.export))
+        config = MockConfig(page_latency=args.page_latency, jitter=args.jitter, seed=args.seed)
+        rnd = random.Random(args.seed)
+        state = MockState((u"Place {} \u2713".format(i), bookmark_url(i, rnd)) for i in range(size))
+        server = start_server(config, state)
+        BenchHelper.base_url = server.base_url
+        FakeMarionette.leak_latency = 0.0
+        FakeMarionette.disconnect_rate = 0.0
+        importer = BenchImporter(argparse.Namespace(
+            export_file=export_file, backend=args.backend, metrics_file=None,
+        ))
+        logging.getLogger().setLevel(logging.DEBUG if args.verbose else logging.WARNING)
+        start = time.time()
+        nums, times = importer.process()
+        elapsed = time.time() - start
+        server.shutdown()
+        server.server_close()
+        # The export file has to read like an import file, with the bookmarks as places again
+        stream = ImportStream([(export_file, import_format(export_file))])
+        nums["imported"] = sum(1 for feature in stream if not feature.is_waypoint)
+    finally:
+        shutil.rmtree(tmp)
+    return {
+        "size": size,
+        "elapsed": elapsed,
+        "places_per_second": size / elapsed if elapsed > 0 else 0,
+        # Kilobytes on Linux
+        "max_rss": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+        "results": nums,
+        "spans": dict((name, times["spans"][name]) for name in REPORTED_SPANS if name in times["spans"]),
+    }
+
+
+def report_export(result):
+    """
+    Print the results of one export benchmark.
+    @return: -
+    """
+    print(u" > [BENCH] {} bookmarks: {:.2f}s, {:.1f} places/s, max RSS {:.1f} MB, {}".format(
+        result["size"], result["elapsed"], result["places_per_second"], result["max_rss"] / 1024.0,
+        ", ".join("{} {}".format(key, value) for key, value in sorted(result["results"].items()))
+    ))
+    for name in REPORTED_SPANS:
+        if name in result["spans"]:
+            span = result["spans"][name]
+            print(u" > [BENCH]   {}: p50 {:.4f}s, p95 {:.4f}s, p99 {:.4f}s".format(
+                name, span["p50"], span["p95"], span["p99"]
+            ))
+
+
+def report(result):
+    """
+    Print the results of one benchmark.
+    @return: -
+    """
+    print(u" > [BENCH] {} features: {:.2f}s, {:.1f} places/s, {} connections, {}".format(
+        result["size"], result["elapsed"], result["places_per_second"], result["connections"],
+        ", ".join("{} {}".format(key, value) for key, value in sorted(result["results"].items()))
+    ))
+    first, last = result["edge_places_per_second"]
+    print(u" > [BENCH]   first {:.0f}%: {:.1f} places/s, last {:.0f}%: {:.1f} places/s".format(
+        100 * EDGE_SHARE, first, 100 * EDGE_SHARE, last
+    ))
+    for name in REPORTED_SPANS:
+        if name in result["spans"]:
+            span = result["spans"][name]
+            print(u" > [BENCH]   {}: p50 {:.4f}s, p95 {:.4f}s, p99 {:.4f}s".format(
+                name, span["p50"], span["p95"], span["p99"]
+            ))
+
+
+def check_regressions(results, baseline, tolerance):
+    """
+    Compare the throughput with the baseline.
+    @return: List of regressions
+    """
+    regressions = []
+    for result in results:
+        expected = baseline.get(str(result["size"]))
+        if expected is not None and result["places_per_second"] < expected * (1 - tolerance):
+            regressions.append(u"{} features: {:.1f} places/s, baseline {:.1f} places/s".format(
+                result["size"], result["places_per_second"], expected
+            ))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", default="1000,10000",
+                        help="comma separated numbers of features to import (default: '1000,10000')")
+    parser.add_argument("--workers", type=int, default=1, help="number of parallel workers")
+    parser.add_argument("--backend", choices=["browser", "http"], default="browser",
+                        help="save through the Marionette stand-in or over HTTP (default: 'browser')")
+    parser.add_argument("--lean", action="store_true", default=False, help="import with the lean preferences")
+    parser.add_argument("--in-app", action="store_true", default=False, dest="in_app",
+                        help="move the running app from place to place")
+    parser.add_argument("--resolve-places", action="store_true", default=False, dest="resolve_places",
+                        help="resolve the legacy URLs to place IDs ahead")
+    parser.add_argument("--export", choices=["json", "gpx", "csv"], default=None,
+                        help="export a mock account with as many bookmarks to this format instead of importing")
+    parser.add_argument("--tabs", type=int, default=1, help="number of tabs to prefetch places in")
+    parser.add_argument("--max-rate", type=float, default=0, dest="max_rate",
+                        help="throttle to this many places per second, 0 disables throttling (default)")
+    parser.add_argument("--retries", type=int, default=2, help="number of times failed features are retried")
+    parser.add_argument("--retry-backoff", type=float, default=0.5, dest="retry_backoff",
+                        help="seconds to wait before the first retry")
+    parser.add_argument("--recycle-every", type=int, default=500, dest="recycle_every",
+                        help="replace the tab after this many places, 0 disables it")
+    parser.add_argument("--memory-limit", type=int, default=2048, dest="memory_limit",
+                        help="replace the tab once Firefox outgrows this many MB, 0 disables it")
+    parser.add_argument("--page-latency", type=float, default=0.0, dest="page_latency",
+                        help="latency of a page load in seconds")
+    parser.add_argument("--boot-latency", type=float, default=0.0, dest="boot_latency",
+                        help="seconds a place page takes to load the app on top of the page latency")
+    parser.add_argument("--legacy-latency", type=float, default=0.0, dest="legacy_latency",
+                        help="seconds a legacy URL takes to reach the place on top of the page latency")
+    parser.add_argument("--lookup-latency", type=float, default=0.0, dest="lookup_latency",
+                        help="latency of a Places API lookup in seconds")
+    parser.add_argument("--save-latency", type=float, default=0.0, dest="save_latency",
+                        help="latency of a save in seconds")
+    parser.add_argument("--render-delay", type=float, default=0.0, dest="render_delay",
+                        help="delay until the save button shows up in seconds")
+    parser.add_argument("--jitter", type=float, default=0.0, help="random variation of every latency, e.g. 0.2")
+    parser.add_argument("--failure-rate", type=float, default=0.0, dest="failure_rate",
+                        help="share of saves which fail")
+    parser.add_argument("--missing-rate", type=float, default=0.0, dest="missing_rate",
+                        help="share of place pages without a save button")
+    parser.add_argument("--leak-latency", type=float, default=0.0, dest="leak_latency",
+                        help="seconds every page load of a tab takes longer per page it loaded before")
+    parser.add_argument("--disconnect-rate", type=float, default=0.0, dest="disconnect_rate",
+                        help="share of navigations on which the Marionette connection drops")
+    parser.add_argument("--existing", type=float, default=0.0,
+                        help="share of the features which are already saved")
+    parser.add_argument("--seed", type=int, default=0, help="seed of the synthetic data and failures")
+    parser.add_argument("--baseline", default=None, help="fail if throughput is below this baseline file")
+    parser.add_argument("--tolerance", type=float, default=0.2,
+                        help="allowed throughput drop against the baseline (default: 0.2)")
+    parser.add_argument("--save-baseline", default=None, dest="save_baseline",
+                        help="write the throughput of this run as baseline file")
+    parser.add_argument("--output", default=None, help="write all results to this JSON file")
+    parser.add_argument("--verbose", action="store_true", default=False, help="log every feature")
+    args = parser.parse_args()
+
+    results = []
+    for size in [int(size) for size in args.sizes.split(",") if size.strip()]:
+        if args.export:
+            result = run_export(size, args)
+            report_export(result)
+        else:
+            result = run(size, args)
+            report(result)
+        results.append(result)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+    if args.save_baseline:
+        with open(args.save_baseline, "w") as f:
+            json.dump(dict((str(result["size"]), result["places_per_second"]) for result in results), f, indent=2)
+    if args.baseline:
+        with open(args.baseline, "r") as f:
+            regressions = check_regressions(results, json.load(f), args.tolerance)
+        for regression in regressions:
+            print(u" > [BENCH] Regression: {}".format(regression))
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,304 @@
+#!/usr/bin/env python2
+
+import random
+import sys
+import threading
+import time
+
+if sys.version_info[0] < 3:
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+    from SocketServer import ThreadingMixIn
+    from urlparse import urlparse, parse_qs
+    from cgi import escape
+else:
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+    from socketserver import ThreadingMixIn
+    from urllib.parse import urlparse, parse_qs
+    from html import escape
+
+from utils.places import place_key
+
+
+# The place page, it contains the elements MarionetteHelper looks for in both the
+# layout of add_feature() and the one of add_feature_2(). Saving works in a real
+# browser, too, by posting to '/save'.
+PLACE_PAGE = """<!DOCTYPE html>
+<html>
+<head><meta charset="utf-8"><title>{title}</title></head>
+<body>
+<h1>{title}</h1>
+<button class="section-entity-action-save-button" style="display: none">{legacy_text}</button>
+<button data-value="{value}" style="display: none">{value}</button>
+<ul id="action-menu" style="display: none">
+  <li data-index="1">Want to go</li>
+  <li data-index="2">Starred places</li>
+</ul>
+<script>
+let place = {place};
+function save(after) {{
+  fetch("/save?place=" + encodeURIComponent(place), {{method: "POST"}}).then(response => {{
+    if (response.ok) {{
+      after();
+    }}
+  }});
+}}
+let legacy = document.querySelector(".section-entity-action-save-button");
+let button = document.querySelector("[data-value]");
+let menu = document.getElementById("action-menu");
+setTimeout(() => {{
+  legacy.style.display = "";
+  button.style.display = "";
+}}, {render_delay});
+legacy.addEventListener("click", () => save(() => legacy.textContent = "SAVED"));
+button.addEventListener("click", () => menu.style.display = "");
+for (let item of menu.querySelectorAll("li")) {{
+  item.addEventListener("click", () => save(() => {{
+    menu.style.display = "none";
+    button.dataset.value = button.textContent = "Saved";
+  }}));
+}}
+</script>
+</body>
+</html>
+"""
+
+# The cookie of a logged in session and the signature the Google Bookmarks API expects
+SESSION_COOKIE = "SID"
+SIGNATURE = "bench-signature"
+
+# Header telling the Marionette stand-in how the place page renders
+HEADER_SAVED = "X-Place-Saved"
+HEADER_RENDER_DELAY = "X-Render-Delay"
+HEADER_MISSING = "X-Save-Button-Missing"
+# Header of the requests of the running app, they skip loading the app
+HEADER_IN_APP = "X-In-App"
+
+
+class MockConfig:
+    """
+    Latencies (in seconds) and failure rates of the mock server.
+    """
+
+    def __init__(self, page_latency=0.0, save_latency=0.0, render_delay=0.0, jitter=0.0,
+                 failure_rate=0.0, missing_rate=0.0, seed=0, boot_latency=0.0, legacy_latency=0.0):
+        self.page_latency = page_latency
+        # Redirects and the search step of a legacy URL ('?cid=...') on top of the page latency,
+        # a place ID URL ('?api=1&query_place_id=...') skips it
+        self.legacy_latency = legacy_latency
+        # Loading and starting the app on top of the page latency, in-app navigation skips it
+        self.boot_latency = boot_latency
+        self.save_latency = save_latency
+        self.render_delay = render_delay
+        # Every latency is varied randomly by up to this fraction
+        self.jitter = jitter
+        # Share of saves which fail
+        self.failure_rate = failure_rate
+        # Share of place pages which never show a save button
+        self.missing_rate = missing_rate
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+
+    def latency(self, value):
+        """
+        @return: The passed latency varied by the jitter
+        """
+        with self.lock:
+            return value * (1 + self.jitter * (2 * self.random.random() - 1))
+
+    def chance(self, rate):
+        """
+        @return: True with the passed probability
+        """
+        with self.lock:
+            return self.random.random() < rate
+
+
+class MockState:
+    """
+    The bookmarks of the mock account.
+    """
+
+    def __init__(self, bookmarks=()):
+        """
+        Initialise the state with the passed (title, url) bookmarks.
+        """
+        self.lock = threading.Lock()
+        self.bookmarks = []
+        self.keys = set()
+        for title, url in bookmarks:
+            self.add(title, url)
+
+    def add(self, title, url):
+        """
+        Add a bookmark, newest first like the Google Bookmarks API.
+        @return: -
+        """
+        with self.lock:
+            key = place_key(url)
+            if key not in self.keys:
+                self.keys.add(key)
+                # Microseconds, strictly increasing
+                timestamp = max(int(time.time() * 1000000), self.bookmarks[0][2] + 1 if self.bookmarks else 0)
+                self.bookmarks.insert(0, (title, url, timestamp))
+
+    def is_saved(self, url):
+        """
+        @return: Whether or not the place of the passed URL is saved
+        """
+        with self.lock:
+            return place_key(url) in self.keys
+
+    def page(self, start, num):
+        """
+        @return: A page of bookmarks
+        """
+        with self.lock:
+            return list(self.bookmarks[start:start + num])
+
+
+class MockHandler(BaseHTTPRequestHandler):
+    """
+    Serves '/maps' (a place page), '/bookmarks/' (the Google Bookmarks XML and RSS
+    output), '/save' (saves a place like the place page) and '/bookmarks/mark' (saves
+    a place like the Google Bookmarks API). The query string of '/maps' is the one of
+    the Google Maps URL of the place.
+    """
+
+    protocol_version = "HTTP/1.1"
+    # Headers are written one by one, Nagle's algorithm would delay kept alive connections
+    disable_nagle_algorithm = True
+
+    def setup(self):
+        BaseHTTPRequestHandler.setup(self)
+        # Every connection gets its own handler, i.e. this counts connections not requests
+        with self.server.lock:
+            self.server.connections += 1
+
+    def log_message(self, *args):
+        pass
+
+    def send(self, status, body, content_type, headers=()):
+        """
+        Send a complete response.
+        @return: -
+        """
+        body = body.encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in headers:
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def place_url(self, query):
+        """
+        @return: The Google Maps URL of a place from the query string of the mock
+        """
+        return "http://maps.google.com/?{}".format(query)
+
+    def do_GET(self):
+        parsed = urlparse(self.path)
+        config = self.server.config
+        if parsed.path == "/maps":
+            time.sleep(config.latency(config.page_latency))
+            if self.headers.get(HEADER_IN_APP) != "1":
+                time.sleep(config.latency(config.boot_latency))
+            if "query_place_id" not in parse_qs(parsed.query):
+                time.sleep(config.latency(config.legacy_latency))
+            url = self.place_url(parsed.query)
+            saved = self.server.state.is_saved(url)
+            render_delay = config.latency(config.render_delay)
+            missing = config.chance(config.missing_rate)
+            self.send(200, PLACE_PAGE.format(
+                title=escape(url), place=repr(str(url)), render_delay=int(render_delay * 1000),
+                legacy_text="SAVED" if saved else "SAVE", value="Saved" if saved else "Save"
+            ), "text/html; charset=utf-8", [
+                (HEADER_SAVED, "1" if saved else "0"),
+                (HEADER_RENDER_DELAY, "{:.6f}".format(render_delay)),
+                (HEADER_MISSING, "1" if missing else "0"),
+            ])
+        elif parsed.path == "/bookmarks/":
+            params = parse_qs(parsed.query)
+            if params.get("output") == ["rss"]:
+                self.send(200, u"<?xml version=\"1.0\" encoding=\"UTF-8\"?><rss version=\"2.0\" "
+                               u"xmlns:smh=\"http://www.google.com/history/\"><channel>"
+                               u"<smh:signature>{}</smh:signature></channel></rss>".format(SIGNATURE),
+                          "text/xml; charset=utf-8")
+                return
+            start = int(params.get("start", ["0"])[0])
+            num = int(params.get("num", ["25"])[0])
+            time.sleep(config.latency(config.page_latency))
+            items = []
+            for title, url, timestamp in self.server.state.page(start, num):
+                items.append(
+                    u"<bookmark><title>{}</title><url>{}</url><timestamp>{}</timestamp>"
+                    u"<id>{}</id><labels></labels></bookmark>".format(escape(title), escape(url), timestamp, timestamp)
+                )
+            self.send(200, u"<?xml version=\"1.0\" encoding=\"UTF-8\"?><xml_api_reply version=\"1\"><bookmarks>{}"
+                           u"</bookmarks></xml_api_reply>".format(u"".join(items)), "text/xml; charset=utf-8")
+        else:
+            self.send(404, u"Not found", "text/plain")
+
+    def do_POST(self):
+        parsed = urlparse(self.path)
+        config = self.server.config
+        length = int(self.headers.get("Content-Length") or 0)
+        body = self.rfile.read(length).decode("utf-8") if length else u""
+        if parsed.path == "/bookmarks/mark":
+            form = parse_qs(body)
+            if "{}=".format(SESSION_COOKIE) not in (self.headers.get("Cookie") or ""):
+                # Not logged in, Google redirects to the login page
+                self.send(302, u"", "text/plain", [("Location", "/ServiceLogin")])
+                return
+            if form.get("sig") != [SIGNATURE]:
+                self.send(403, u"Invalid signature", "text/plain")
+                return
+            time.sleep(config.latency(config.save_latency))
+            if config.chance(config.failure_rate):
+                self.send(500, u"Failed", "text/plain")
+                return
+            url = form.get("bkmk", [""])[0]
+            self.server.state.add(form.get("title", [url])[0], url)
+            self.send(200, u"Saved", "text/plain")
+        elif parsed.path == "/save":
+            time.sleep(config.latency(config.save_latency))
+            if config.chance(config.failure_rate):
+                self.send(500, u"Failed", "text/plain")
+                return
+            url = parse_qs(parsed.query).get("place", [""])[0]
+            self.server.state.add(url, url)
+            self.send(200, u"Saved", "text/plain")
+        else:
+            self.send(404, u"Not found", "text/plain")
+
+
+class MockServer(ThreadingMixIn, HTTPServer):
+    """
+    The threaded mock server, every connection is handled in its own thread.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, config, state, port=0):
+        HTTPServer.__init__(self, ("127.0.0.1", port), MockHandler)
+        self.config = config
+        self.state = state
+        self.lock = threading.Lock()
+        self.connections = 0
+
+    @property
+    def base_url(self):
+        return "http://127.0.0.1:{}".format(self.server_address[1])
+
+
+def start_server(config, state, port=0):
+    """
+    Start the mock server in a background thread.
+    @return: The server
+    """
+    server = MockServer(config, state, port)
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    return server
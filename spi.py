@@ -5,17 +5,34 @@ import argparse
 import logging
 import json
 import os
+import sqlite3
+import time
 import urllib
+from collections import Counter
 
-import inquirer
-import googlemaps
-
+from utils.deps import require
 from utils.timing import Timing
-from utils.marionette import MarionetteHelper
-from utils.parse import parse_geo_json, parse_gpx
-from utils.constants import APP_NAME, \
+from utils.backend import BACKENDS, BACKEND_BROWSER, BACKEND_HTTP, BOOKMARKS_PAGE_SIZE
+from utils.pool import WorkerPool
+from utils.journal import Journal
+from utils.bookmarks import BookmarkSnapshot
+from utils.places import PlaceIndex, is_search_url
+from utils.throttle import AdaptiveThrottle
+from utils.cache import PlacesCache, CachedPlacesClient
+from utils.pipeline import prefetch_pipeline
+from utils.resolve import PlaceResolver
+from utils.retry import RetryQueue
+from utils.watchdog import SessionWatchdog
+from utils.sources import ImportStream, expand_import_files, feature_key
+from utils.store import FeatureStore
+from utils.export import EXPORT_FORMATS, export_format
+from utils.constants import APP_NAME, MARIONETTE_PORT, \
     LIST_STARRED_PLACES, LIST_WANT_TO_GO, \
-    MODE_GPX, MODE_GEO_JSON, MODE_BATCH, MODE_INTERACTIVE
+    ADD_FEATURE_SUCCESS, ADD_FEATURE_FAILURE, ADD_FEATURE_ALREADY_ADDED, ADD_FEATURE_UNKNOWN_ERROR, \
+    ADD_FEATURE_SKIPPED, DEFAULT_MAX_RATE, DEFAULT_MATCH_DISTANCE, DEFAULT_RETRIES, DEFAULT_RETRY_BACKOFF, \
+    DEFAULT_RECYCLE_EVERY, DEFAULT_MEMORY_LIMIT, FAILURE_UNKNOWN, \
+    JOURNAL_FILE, BOOKMARKS_SNAPSHOT_FILE, PLACES_CACHE_FILE, REVIEW_FILE, \
+    MODE_BATCH, MODE_INTERACTIVE, MODE_EXPORT
 
 
 def init_logging():
@@ -32,6 +49,26 @@ def init_logging():
     return logger
 
 
+def port_list(value):
+    """
+    Parses a comma separated list of ports, e.g. '2828,2829'.
+    @return: List of ports
+    """
+    try:
+        return [int(port) for port in value.split(",") if port.strip()]
+    except ValueError:
+        raise argparse.ArgumentTypeError("invalid list of ports: '{}'".format(value))
+
+
+def progress(i, num_features=None):
+    """
+    @return: The position of a feature, together with the number of features if it's known
+    """
+    if num_features is None:
+        return u"{:3d}".format(i)
+    return u"{:3d}/{}".format(i, num_features)
+
+
 class SavedPlacesImporter:
 
     def __init__(self, args):
@@ -46,32 +83,112 @@ class SavedPlacesImporter:
         # String to print in case a command fails
         self.failure_symbol = u"\u2717"
         # The passed arguments
-        self.import_file = args.import_file if "import_file" in args else ""
+        self.import_files = args.import_files if "import_files" in args else []
+        self.export_file = args.export_file if "export_file" in args else None
         self.dry_run = args.dry_run if "dry_run" in args else False
         self.compare = args.compare if "compare" in args else False
         self.list_add = args.list_add if "list_add" in args else None
+        self.marionette_ports = args.marionette_ports if "marionette_ports" in args else [MARIONETTE_PORT]
+        # Default to one worker per Marionette port
+        self.workers = args.workers if "workers" in args and args.workers else len(self.marionette_ports)
+        self.resume = args.resume if "resume" in args else False
+        self.journal_file = args.journal_file if "journal_file" in args and args.journal_file else \
+            os.path.join(os.path.dirname(os.path.realpath(__file__)), JOURNAL_FILE)
+        # The journal recording the outcome of every feature, opened for imports only
+        self.journal = None
+        self.bookmarks_file = args.bookmarks_file if "bookmarks_file" in args and args.bookmarks_file else \
+            os.path.join(os.path.dirname(os.path.realpath(__file__)), BOOKMARKS_SNAPSHOT_FILE)
+        self.refresh_bookmarks = args.refresh_bookmarks if "refresh_bookmarks" in args else False
+        self.max_rate = args.max_rate if "max_rate" in args else 0
+        self.metrics_file = args.metrics_file if "metrics_file" in args else None
+        self.tabs = args.tabs if "tabs" in args else 1
+        self.match_distance = args.match_distance if "match_distance" in args else DEFAULT_MATCH_DISTANCE
+        self.backend_name = args.backend if "backend" in args else BACKEND_BROWSER
+        self.lean = args.lean if "lean" in args else False
+        self.in_app = args.in_app if "in_app" in args else False
+        self.offline = args.offline if "offline" in args else False
+        # Features which failed for a transient reason are retried at the end
+        self.retries = RetryQueue(
+            args.retries if "retries" in args else DEFAULT_RETRIES,
+            args.retry_backoff if "retry_backoff" in args else DEFAULT_RETRY_BACKOFF,
+        )
+        # Places after which the tab of a browser is replaced and the memory (in MB) of Firefox beyond which it's
+        # replaced early, see utils.watchdog
+        self.recycle_every = args.recycle_every if "recycle_every" in args else DEFAULT_RECYCLE_EVERY
+        self.memory_limit = args.memory_limit if "memory_limit" in args else DEFAULT_MEMORY_LIMIT
+        # Weight (in bytes) of a sample place page without the lean preferences
+        self.lean_baseline = None
+        self.resolve = args.resolve if "resolve" in args else False
+        self.resolve_places = args.resolve_places if "resolve_places" in args else False
+        self.review_file = args.review_file if "review_file" in args and args.review_file else REVIEW_FILE
+        # The resolver of GPX waypoints and legacy place URLs, only used with '--resolve' or '--resolve-places'
+        self.resolver = None
+        # The throttle deciding when the browser may be used next, disabled with a maximum rate of 0
+        self.throttle = AdaptiveThrottle(self.logger, self.max_rate, self.workers) if self.max_rate > 0 else None
         # The mode to operate in
-        self.mode = MODE_BATCH if "import_file" in args else MODE_INTERACTIVE
-        # The Marionette instance, wrapped by our own helper class
-        self.marionette = MarionetteHelper(self.logger, self.success_symbol, self.failure_symbol)
-        # A set of existing bookmarks to check later if a bookmark was already saved
-        self.bookmarks = set()
-        # Initialise Google Maps API
+        if "import_files" in args:
+            self.mode = MODE_BATCH
+        elif "export_file" in args:
+            self.mode = MODE_EXPORT
+        else:
+            self.mode = MODE_INTERACTIVE
+        # Initialise timing
+        self.timing = Timing(self.logger)
+        # The Marionette instance, wrapped by our own helper class, created by init_browser()
+        self.marionette = None
+        # The helpers of the workers, created by the first parallel import
+        self.helpers = None
+        # The backend bookmarks are fetched and places are saved through, the
+        # browser unless the HTTP backend is selected
+        self.backend = None
+        # An index of existing bookmarks to check later if a bookmark was already saved,
+        # it matches the different URL styles Google Maps uses for the same place
+        self.bookmarks = PlaceIndex()
+        # Waypoints which are added interactively once the places were added, see set_aside_waypoints()
+        self.waypoints = None
+        # The Google Maps API, created by init_places_api()
+        self.places_cache = None
+        self.gm = None
+
+    def init_browser(self):
+        """
+        Creates the helper of the first Firefox instance, only the modes which
+        need a browser load Marionette.
+        @return: The helper
+        """
+        if self.marionette is None:
+            self.marionette = self.create_helper(self.marionette_ports[0])
+            self.marionette.in_app = self.in_app
+            self.marionette.watchdog = self.create_watchdog()
+            if self.backend is None:
+                self.backend = self.marionette
+        return self.marionette
+
+    def init_places_api(self):
+        """
+        Initialises the Google Maps API with the key in 'gm-api-key.json', only
+        the modes which need it load the client.
+        @return: Whether or not the API is available
+        """
+        if self.gm is not None:
+            return True
+        path = os.path.dirname(os.path.realpath(__file__))
+        key_file = "gm-api-key.json"
         try:
-            path = os.path.dirname(os.path.realpath(__file__))
-            key_file = "gm-api-key.json"
             with open("{}/{}".format(path, key_file), "r") as f:
                 data = json.load(f)
-                self.gm = googlemaps.Client(key=data["key"])
         except IOError:
             self.logger.error(
                 u" > [ERROR] Unable to open '{}', Google Maps API disabled {}".format(
                         key_file, self.failure_symbol
                     )
             )
-            self.gm = None
-        # Initialise timing
-        self.timing = Timing(self.logger)
+            return False
+        googlemaps = require("googlemaps")
+        # Repeated lookups are answered from the cache
+        self.places_cache = PlacesCache("{}/{}".format(path, PLACES_CACHE_FILE))
+        self.gm = CachedPlacesClient(googlemaps.Client(key=data["key"]), self.places_cache)
+        return True
 
     def interactive_loop(self):
         # Choices "Main Menu"
@@ -89,6 +206,7 @@ class SavedPlacesImporter:
             ("Add point of interest", CHOICE_POINT_OF_INTEREST),
             ("Exit", CHOICE_EXIT),
         ]
+        inquirer = require("inquirer")
         choice = ""
         while choice != CHOICE_EXIT:
             choice = inquirer.list_input(
@@ -103,6 +221,7 @@ class SavedPlacesImporter:
                 self.interactive_loop_add_point_of_interest()
 
     def interactive_loop_add_point_of_interest(self):
+        inquirer = require("inquirer")
         CHOICE_CANCEL = "CANCEL"
         choice = ""
         while choice != "Back":
@@ -137,6 +256,7 @@ class SavedPlacesImporter:
             )
 
     def interactive_loop_add_airport(self):
+        inquirer = require("inquirer")
         CHOICE_CANCEL = "CANCEL"
         choice = ""
         while choice != "Back":
@@ -171,6 +291,7 @@ class SavedPlacesImporter:
             )
 
     def interactive_loop_add_city(self):
+        inquirer = require("inquirer")
         CHOICE_CANCEL = "CANCEL"
         choice = ""
         while choice != "Back":
@@ -204,124 +325,606 @@ class SavedPlacesImporter:
                 choices=["Add another city", "Back"]
             )
 
+    def create_helper(self, port):
+        """
+        Creates the helper for the Marionette session of the Firefox instance at the passed port.
+        @return: The helper
+        """
+        from utils.marionette import MarionetteHelper
+        return MarionetteHelper(self.logger, self.success_symbol, self.failure_symbol, self.timing, port=port)
+
+    def create_watchdog(self):
+        """
+        Creates the watchdog of a browser session, unless recycling is disabled.
+        @return: The watchdog or None
+        """
+        if self.recycle_every <= 0 and self.memory_limit <= 0:
+            return None
+        return SessionWatchdog(self.recycle_every, self.memory_limit)
+
+    def create_http_backend(self):
+        """
+        Creates the HTTP backend with the cookies of the Google session of Firefox,
+        it has one pooled connection per worker.
+        @return: The backend
+        """
+        from utils.http_backend import HttpBackend
+        cookies, user_agent = self.marionette.get_session_cookies()
+        return HttpBackend(self.logger, self.timing, cookies, user_agent, pool_size=self.workers)
+
+    def log_lean_summary(self):
+        """
+        Print the average weight of the imported place pages and how much
+        the lean mode saved compared to the sample page.
+        @return: -
+        """
+        histogram = self.timing.sizes.get("page_bytes")
+        if histogram is None or histogram.count == 0:
+            return
+        mean = histogram.mean()
+        self.logger.info(u" > [LEAN] {:.1f} KB per place".format(mean / 1024.0))
+        if self.lean_baseline:
+            saved = self.lean_baseline - mean
+            self.logger.info(u" > [LEAN] {:.1f} KB ({:.0f}%) saved per place, {:.1f} KB without '--lean'".format(
+                saved / 1024.0, 100.0 * saved / self.lean_baseline, self.lean_baseline / 1024.0
+            ))
+
+    def log_watchdog_summary(self):
+        """
+        Logs how often the tabs of the browsers were recycled and the connections restored.
+        @return: -
+        """
+        if self.backend_name != BACKEND_BROWSER or self.marionette is None:
+            return
+        helpers = self.helpers if self.helpers is not None else [self.marionette]
+        recycles = Counter()
+        for helper in helpers:
+            if helper.watchdog is not None:
+                recycles.update(helper.watchdog.recycles)
+        reconnects = sum(helper.reconnects for helper in helpers)
+        if recycles:
+            self.logger.info(u" > [WATCHDOG] Tabs recycled: {} {}".format(u", ".join(
+                u"{} {}".format(count, reason) for reason, count in sorted(recycles.items())
+            ), self.success_symbol))
+        if reconnects > 0:
+            self.logger.info(u" > [WATCHDOG] Reconnected {} times {}".format(reconnects, self.success_symbol))
+
+    def log_cache_summary(self):
+        """
+        Print the hits and misses of the Google Maps API cache, if it was used.
+        @return: -
+        """
+        if self.places_cache is not None and self.places_cache.hits + self.places_cache.misses > 0:
+            self.logger.info(u" > [CACHE] {} hits, {} misses".format(self.places_cache.hits, self.places_cache.misses))
+
+    def record_result(self, nums, i, num_features, feature, ret):
+        """
+        Do some bookkeeping with the return value of adding a feature.
+        @return: -
+        """
+        if ret == ADD_FEATURE_SUCCESS:
+            ret_string = self.success_symbol
+            nums["success"] += 1
+            # A duplicate later in the import is then recognised as already added
+            self.bookmarks.add(feature.url, feature.lat, feature.lon)
+        elif ret == ADD_FEATURE_FAILURE:
+            ret_string = self.failure_symbol
+            nums["failure"] += 1
+        elif ret == ADD_FEATURE_ALREADY_ADDED:
+            ret_string = u"-"
+            nums["already_added"] += 1
+        elif ret == ADD_FEATURE_SKIPPED:
+            ret_string = u"~"
+            nums["skipped"] += 1
+        else:
+            ret_string = u"?"
+            nums["unknown_error"] += 1
+        self.logger.debug(u" > {} {} {}".format(progress(i, num_features), ret_string, feature))
+        # Skipped features keep the outcome of the run which completed them
+        if self.journal is not None and ret != ADD_FEATURE_SKIPPED:
+            self.journal.record(feature.url, ret)
+
+    def is_completed(self, feature):
+        """
+        Check if a feature was completed by a previous run and can be skipped.
+        @return: Whether or not the feature can be skipped
+        """
+        return self.resume and self.journal is not None and self.journal.is_completed(feature.url)
+
+    def needs_browser(self, feature):
+        """
+        Check if a feature has to be added with the browser, i.e. it's neither
+        completed by a previous run nor already added. Waypoints are added
+        interactively and never need it ahead.
+        @return: Whether or not the feature needs the browser
+        """
+        if feature.is_waypoint:
+            return False
+        return not self.is_completed(feature) and feature.url not in self.bookmarks
+
+    def add_feature_worker(self, helper, feature):
+        """
+        Adds a single feature with the helper (i.e. Marionette session) of a worker,
+        the throttle decides when the browser may be used next.
+        @return: Tuple of the ADD_FEATURE_* result and, if it failed, the FAILURE_* reason
+        """
+        if self.is_completed(feature):
+            return ADD_FEATURE_SKIPPED, None
+        if feature.url in self.bookmarks:
+            return ADD_FEATURE_ALREADY_ADDED, None
+        if self.throttle is not None:
+            self.throttle.acquire()
+        start = time.time()
+        if is_search_url(feature.url):
+            # Places resolved from waypoints open like in the interactive mode
+            ret = helper.add_feature_2(feature.url, self.list_add)
+        else:
+            ret = helper.add_feature(feature.url)
+        duration = time.time() - start
+        self.timing.add_interim(duration)
+        if self.throttle is not None:
+            self.throttle.report(ret, duration)
+        helper.check_health(ret, duration)
+        if ret in (ADD_FEATURE_FAILURE, ADD_FEATURE_UNKNOWN_ERROR):
+            return ret, helper.pop_failure()
+        return ret, None
+
+    def settle_result(self, nums, i, num_features, feature, ret, reason):
+        """
+        Records the result of a feature, unless it failed for a transient
+        reason and is deferred to the retry queue.
+        @return: -
+        """
+        if reason is not None and self.retries.defer(feature, reason):
+            self.logger.debug(u" > {} deferred ({}) {}".format(progress(i, num_features), reason, feature))
+            return
+        if ret == ADD_FEATURE_SUCCESS and self.retries.round > 0:
+            self.retries.recovered += 1
+        self.record_result(nums, i, num_features, feature, ret)
+
+    def create_worker_helpers(self):
+        """
+        Creates the helpers of the workers, every worker owns its own Marionette
+        session, i.e. its own Firefox instance, or they share the connection
+        pool of the HTTP backend.
+        @return: List of helpers
+        """
+        if self.backend_name == BACKEND_HTTP:
+            helpers = [self.backend] * self.workers
+        else:
+            helpers = [self.marionette]
+            for port in self.marionette_ports[1:self.workers]:
+                helper = self.create_helper(port)
+                helper.in_app = self.in_app
+                helper.watchdog = self.create_watchdog()
+                helper.init_ff()
+                if self.lean:
+                    helper.enable_lean()
+                helpers.append(helper)
+        self.logger.info(u" > Importing with {} workers {}".format(len(helpers), self.success_symbol))
+        return helpers
+
+    def add_features_parallel(self, features, num_features, nums):
+        """
+        Adds the features with a pool of workers, see create_worker_helpers().
+        @return: Number of processed features
+        """
+        if self.helpers is None:
+            self.helpers = self.create_worker_helpers()
+        pool = WorkerPool(self.logger, self.helpers)
+        i = 0
+        for feature, result, error, duration in pool.map(self.add_feature_worker, features):
+            i += 1
+            if error is not None:
+                self.logger.error(u" > [ERROR] Feature: '{}' {} {}".format(feature, error, self.failure_symbol))
+                result = ADD_FEATURE_UNKNOWN_ERROR, FAILURE_UNKNOWN
+            self.settle_result(nums, i, num_features, feature, *result)
+        return i
+
+    def add_features_sequential(self, features, num_features, nums):
+        """
+        Adds the features one after another, waypoints interactively. If tabs were
+        opened, the pages of the next features are loaded in them ahead.
+        @return: Number of processed features
+        """
+        if self.marionette is not None and self.marionette.free_tabs is not None:
+            features = prefetch_pipeline(self.marionette, features, self.tabs - 1, self.needs_browser)
+        i = 0
+        for feature in features:
+            i += 1
+            if self.dry_run:
+                self.logger.info(u" > [DRY RUN] {} {}".format(progress(i, num_features), feature))
+            elif not feature.is_waypoint:
+                # Skips features which were completed before or already
+                # exist, i.e. if the bookmark / place was already added previously
+                ret, reason = self.add_feature_worker(self.backend, feature)
+                self.settle_result(nums, i, num_features, feature, ret, reason)
+            else:
+                self.logger.debug(u" > {} {}".format(progress(i, num_features), feature))
+                self.marionette.interactive_add_feature((feature.lat, feature.lon))
+        return i
+
+    def set_aside_waypoints(self, features):
+        """
+        Passes the places on and keeps the waypoints in a store, so neither the workers
+        nor the tabs wait for input. They are added by add_waypoints() at the end.
+        @return: Generator of features (places)
+        """
+        for feature in features:
+            if not feature.is_waypoint:
+                yield feature
+                continue
+            if self.waypoints is None:
+                self.waypoints = FeatureStore()
+            self.waypoints.append(feature)
+
+    def add_waypoints(self):
+        """
+        Adds the waypoints kept by set_aside_waypoints() interactively, one after another.
+        @return: -
+        """
+        if self.waypoints is None:
+            return
+        self.waypoints.seal()
+        self.logger.info(u" > Adding {} waypoints interactively {}".format(len(self.waypoints), self.success_symbol))
+        for i, feature in enumerate(self.waypoints, 1):
+            self.logger.debug(u" > {} {}".format(progress(i, len(self.waypoints)), feature))
+            self.marionette.interactive_add_feature((feature.lat, feature.lon))
+
+    def retry_features(self, nums, parallel):
+        """
+        Retries the features deferred to the retry queue, round by round. Every
+        helper drops the state of the previous adds first, e.g. the loaded page.
+        @return: -
+        """
+        for attempt, features in self.retries.rounds():
+            self.logger.info(u" > [RETRY] Attempt {} of {}: {} features {}".format(
+                attempt, self.retries.retries, len(features), self.success_symbol
+            ))
+            helpers = self.helpers if parallel else [self.backend]
+            with self.timing.span("reset"):
+                for helper in set(helpers):
+                    helper.reset()
+            if parallel:
+                self.add_features_parallel(features, len(features), nums)
+            else:
+                self.add_features_sequential(features, len(features), nums)
+
+    def compare_features(self, features, num_features, nums):
+        """
+        Compares the features with the existing bookmarks. A feature counts as already
+        added if it points to the same place or, if it has coordinates, if a bookmark
+        lies within the match distance of it. The spatial index, with cells of about the
+        match distance, keeps this at a few lookups per feature instead of a scan over
+        all bookmarks.
+        @return: Number of compared features
+        """
+        i = 0
+        nearby = 0
+        for feature in features:
+            i += 1
+            if self.bookmarks.contains_key(feature_key(feature)):
+                nums["already_added"] += 1
+                continue
+            if self.match_distance > 0 and feature.has_coordinates:
+                if self.bookmarks.within(feature.lat, feature.lon, self.match_distance):
+                    self.logger.debug(u" > [COMPARE] {} {} matched within {} m".format(
+                        progress(i, num_features), feature, self.match_distance
+                    ))
+                    nums["already_added"] += 1
+                    nearby += 1
+                    continue
+            self.logger.info(u" > [COMPARE] {} {}".format(progress(i, num_features), feature))
+        if nearby > 0:
+            self.logger.info(u" > {} bookmarks / places matched by coordinates within {} m".format(nearby, self.match_distance))
+        return i
+
+    def export_bookmarks(self):
+        """
+        Streams the existing bookmarks page by page into the export file, in a format the
+        batch mode imports again. Only one page of bookmarks is held in memory at a time.
+        @return: A tuple of the export counters and the timing summary, None if the run stopped early
+        """
+        writer_class = export_format(self.export_file)
+        if writer_class is None:
+            self.logger.error(u" > [ERROR] Unknown export format of '{}', please use one of {} {}".format(
+                self.export_file, ", ".join(suffix for suffix, writer in EXPORT_FORMATS), self.failure_symbol
+            ))
+            return
+        self.init_browser().init_ff()
+        if self.backend_name == BACKEND_HTTP:
+            self.backend = self.create_http_backend()
+        try:
+            writer = writer_class(self.export_file)
+        except IOError as e:
+            self.logger.error(u" > [ERROR] Unable to open file '{}' {}".format(e.filename, self.failure_symbol))
+            exit(1)
+        try:
+            with self.timing.span("export"):
+                for page in self.backend.iter_bookmark_pages(BOOKMARKS_PAGE_SIZE):
+                    with self.timing.span("write"):
+                        for bookmark in page:
+                            writer.write(bookmark)
+                    self.logger.debug(u" > [EXPORT] {} bookmarks".format(writer.exported + writer.skipped))
+        except BaseException:
+            # An incomplete export doesn't replace a previous one
+            writer.abort()
+            raise
+        writer.close()
+        self.backend.close()
+        nums = {
+            "exported": writer.exported,
+            "skipped": writer.skipped,
+        }
+        self.logger.info(u" > Exported {} bookmarks to '{}' {}".format(
+            nums["exported"], self.export_file, self.success_symbol
+        ))
+        if nums["skipped"] > 0:
+            self.logger.info(u" > Skipped {} bookmarks without coordinates, which GPX can't hold {}".format(
+                nums["skipped"], self.failure_symbol
+            ))
+        times = self.timing.get_summary()
+        if self.metrics_file:
+            self.timing.export(self.metrics_file, times)
+        return nums, times
+
     def process(self):
+        """
+        Runs the mode selected by the arguments.
+        @return: A tuple of the result counters and the timing summary of a batch
+                 run, None if the run stopped early
+        """
         # Start processing
         self.logger.info(u" > Start of {}".format(APP_NAME))
         self.logger.debug(u" > [ARGS] dry_run: {}".format(self.dry_run))
         self.logger.debug(u" > [ARGS] compare: {}".format(self.compare))
-        self.logger.debug(u" > [ARGS] import_file: {}".format(self.import_file))
+        self.logger.debug(u" > [ARGS] import_files: {}".format(self.import_files))
+        self.logger.debug(u" > [ARGS] export_file: {}".format(self.export_file))
         self.logger.debug(u" > [ARGS] list_add: {}".format(self.list_add))
+        self.logger.debug(u" > [ARGS] workers: {}".format(self.workers))
+        self.logger.debug(u" > [ARGS] marionette_ports: {}".format(self.marionette_ports))
+        self.logger.debug(u" > [ARGS] resume: {}".format(self.resume))
+        self.logger.debug(u" > [ARGS] journal_file: {}".format(self.journal_file))
+        self.logger.debug(u" > [ARGS] bookmarks_file: {}".format(self.bookmarks_file))
+        self.logger.debug(u" > [ARGS] refresh_bookmarks: {}".format(self.refresh_bookmarks))
+        self.logger.debug(u" > [ARGS] max_rate: {}".format(self.max_rate))
+        self.logger.debug(u" > [ARGS] metrics_file: {}".format(self.metrics_file))
+        self.logger.debug(u" > [ARGS] tabs: {}".format(self.tabs))
+        self.logger.debug(u" > [ARGS] match_distance: {}".format(self.match_distance))
+        self.logger.debug(u" > [ARGS] backend: {}".format(self.backend_name))
+        self.logger.debug(u" > [ARGS] lean: {}".format(self.lean))
+        self.logger.debug(u" > [ARGS] in_app: {}".format(self.in_app))
+        self.logger.debug(u" > [ARGS] offline: {}".format(self.offline))
+        self.logger.debug(u" > [ARGS] retries: {}".format(self.retries.retries))
+        self.logger.debug(u" > [ARGS] retry_backoff: {}".format(self.retries.backoff))
+        self.logger.debug(u" > [ARGS] recycle_every: {}".format(self.recycle_every))
+        self.logger.debug(u" > [ARGS] memory_limit: {}".format(self.memory_limit))
+        self.logger.debug(u" > [ARGS] resolve: {}".format(self.resolve))
+        self.logger.debug(u" > [ARGS] resolve_places: {}".format(self.resolve_places))
+        self.logger.debug(u" > [ARGS] review_file: {}".format(self.review_file))
 
         # Check for interactive mode
         if self.mode == MODE_INTERACTIVE:
             self.logger.debug(u" > [ARGS] mode: {}".format(self.mode))
-            self.marionette.init_ff()
+            self.init_places_api()
+            self.init_browser().init_ff()
             self.interactive_loop()
+            self.log_cache_summary()
             exit(0)
 
+        # Check for export mode
+        if self.mode == MODE_EXPORT:
+            self.logger.debug(u" > [ARGS] mode: {}".format(self.mode))
+            return self.export_bookmarks()
+
         # Check arguments
-        if not self.import_file.endswith("gpx") and not self.import_file.endswith("json"):
-            self.logger.error(u" > [ERROR] Unknown file format supplied {}".format(self.failure_symbol))
+        try:
+            import_files = expand_import_files(self.import_files)
+        except ValueError as ve:
+            self.logger.error(u" > [ERROR] {} {}".format(ve.message, self.failure_symbol))
+            return
+        if not import_files:
+            self.logger.error(u" > [ERROR] No files to import found {}".format(self.failure_symbol))
             return
         if self.dry_run and self.compare:
             self.logger.error(u" > [ERROR] Please select either '--dry_run' or '--compare' {}".format(self.failure_symbol))
             return
+        if self.tabs > 1 and self.workers > 1:
+            self.logger.error(u" > [ERROR] Please select either '--tabs' or several workers {}".format(self.failure_symbol))
+            return
+        if self.tabs > 1 and self.backend_name != BACKEND_BROWSER:
+            self.logger.error(u" > [ERROR] Tabs are only used by the browser backend {}".format(self.failure_symbol))
+            return
+        if self.lean and self.backend_name != BACKEND_BROWSER:
+            self.logger.error(u" > [ERROR] '--lean' is only used by the browser backend {}".format(self.failure_symbol))
+            return
+        if self.in_app and self.backend_name != BACKEND_BROWSER:
+            self.logger.error(u" > [ERROR] '--in-app' is only used by the browser backend {}".format(self.failure_symbol))
+            return
+        if self.in_app and self.tabs > 1:
+            self.logger.error(u" > [ERROR] Please select either '--tabs' or '--in-app' {}".format(self.failure_symbol))
+            return
+        if self.offline and not self.compare:
+            self.logger.error(u" > [ERROR] '--offline' only works with '--compare' {}".format(self.failure_symbol))
+            return
+        if self.list_add == LIST_WANT_TO_GO and self.backend_name != BACKEND_BROWSER:
+            self.logger.error(u" > [ERROR] The HTTP backend only saves to '{}' {}".format(
+                LIST_STARRED_PLACES, self.failure_symbol
+            ))
+            return
+        if self.resolve_places and self.backend_name != BACKEND_BROWSER:
+            self.logger.error(u" > [ERROR] '--resolve-places' is only used by the browser backend {}".format(
+                self.failure_symbol
+            ))
+            return
+        if self.workers < 1 or (self.backend_name == BACKEND_BROWSER and self.workers > len(self.marionette_ports)):
+            self.logger.error(
+                u" > [ERROR] Every worker needs its own Marionette port, please pass "
+                "{} ports with '--marionette-ports' {}".format(self.workers, self.failure_symbol)
+            )
+            return
 
-        # Parse GeoJSON
-        if self.import_file.endswith("json"):
-            self.mode = MODE_GEO_JSON
-            self.logger.debug(u" > [ARGS] mode: {}".format(self.mode))
-            try:
-                features = parse_geo_json(self.import_file)
-            except IOError:
-                self.logger.error(u" > [ERROR] Unable to open GeoJSON file '{}' {}".format(self.import_file, self.failure_symbol))
-                exit(1)
-            except ValueError as ve:
-                self.logger.error(u" > [ERROR] {} {}".format(ve.message, self.failure_symbol))
-                exit(1)
+        # The files and archives are read while the features are imported, one after another
+        stream = ImportStream(import_files)
+        features = stream
+        # Waypoints are added interactively unless they are resolved to places
+        resolve = self.resolve and not self.compare
+        # Legacy place URLs are resolved to place ID URLs, which open the place page directly
+        resolve_places = self.resolve_places and not self.compare
+        if (resolve or resolve_places) and not self.init_places_api():
+            self.logger.error(u" > [ERROR] Resolving {} needs the Google Maps API {}".format(
+                "waypoints" if resolve else "places", self.failure_symbol
+            ))
+            return
+        self.logger.info(u" > Found {} files to import {}".format(len(import_files), self.success_symbol))
 
-        # Parse GPX
-        if self.import_file.endswith("gpx"):
-            self.mode = MODE_GPX
-            self.logger.debug(u" > [ARGS] mode: {}".format(self.mode))
+        # Look up the places of the waypoints and the place IDs of the places ahead, concurrently
+        if resolve or resolve_places:
+            self.resolver = PlaceResolver(
+                self.logger, self.gm, self.review_file, waypoints=resolve, places=resolve_places,
+                needs_lookup=self.needs_browser
+            )
+            features = self.resolver.resolve_all(features)
+
+        # Record the outcome of every feature, so an interrupted import can be resumed
+        if not self.dry_run and not self.compare:
             try:
-                features = parse_gpx(self.import_file)
-            except IOError:
-                self.logger.error(u" > [ERROR] Unable to open GPX file '{}' {}".format(self.import_file, self.failure_symbol))
+                self.journal = Journal(self.journal_file, [path for path, reader in import_files])
+            except sqlite3.Error as e:
+                self.logger.error(u" > [ERROR] Unable to open journal '{}': {} {}".format(self.journal_file, e, self.failure_symbol))
                 exit(1)
+            if self.resume:
+                self.logger.info(u" > Resuming, {} features already completed {}".format(
+                    self.journal.count_completed(), self.success_symbol
+                ))
 
-        # Check number of features returned
-        num_features = len(features)
-        if num_features == 0:
-            self.logger.error(u" > [ERROR] No features to import found {}".format(self.failure_symbol))
-        else:
-            self.logger.info(u" > Found {} features to import {}".format(num_features, self.success_symbol))
-
-        if not self.dry_run:
-            self.marionette.init_ff()
-            self.bookmarks = self.marionette.get_existing_bookmarks()
+        if self.offline:
+            # Compare against the bookmarks as they were fetched last, without Firefox
+            snapshot = BookmarkSnapshot(self.bookmarks_file)
+            if snapshot.fetched == 0:
+                self.logger.error(u" > [ERROR] No bookmark snapshot '{}' found, please compare once without "
+                                  "'--offline' {}".format(self.bookmarks_file, self.failure_symbol))
+                exit(1)
+            self.bookmarks = PlaceIndex(snapshot.urls())
+            self.logger.info(u" > Found {} bookmarks in the snapshot of {} {}".format(
+                len(self.bookmarks), time.strftime("%Y-%m-%d %H:%M", time.localtime(snapshot.fetched)),
+                self.success_symbol
+            ))
+        elif not self.dry_run:
+            self.init_browser().init_ff()
+            if self.backend_name == BACKEND_HTTP:
+                self.backend = self.create_http_backend()
+            if self.lean and not self.compare:
+                # Measure a place page as it's loaded without the lean preferences first
+                with self.timing.span("lean_sample"):
+                    self.lean_baseline = self.marionette.sample_page_weight()
+                self.marionette.enable_lean()
+            self.bookmarks = self.backend.get_existing_bookmarks(
+                BookmarkSnapshot(self.bookmarks_file), self.refresh_bookmarks
+            )
             self.logger.info(u" > Found {} existing bookmarks {}".format(len(self.bookmarks), self.success_symbol))
 
         # Add the features
-        i = 1
         nums = {
             "success": 0,
             "failure": 0,
             "already_added": 0,
             "unknown_error": 0,
+            "skipped": 0,
         }
-        for feature in features:
-            if self.dry_run:
-                self.logger.info(u" > [DRY RUN] {:3d}/{} {}".format(i, num_features, feature))
-            elif self.compare:
-                if self.mode == MODE_GEO_JSON:
-                    if feature in self.bookmarks:
-                        nums["already_added"] += 1
-                    else:
-                        self.logger.info(u" > [COMPARE] {:3d}/{} {}".format(i, num_features, feature))
-                elif self.mode == MODE_GPX:
-                    self.logger.info(u" > [COMPARE] Compare not supported for GPX mode")
+        # The number of features is only known once they were read, resolving drops the waypoints which
+        # need a review
+        num_features = 0
+        failed = False
+        try:
+            if self.compare:
+                with self.timing.span("compare"):
+                    num_features = self.compare_features(features, None, nums)
             else:
-                if self.mode == MODE_GEO_JSON:
-                    # Check if feature already exists, i.e. if the
-                    # bookmark / place was already added previously
-                    if feature not in self.bookmarks:
-                        self.timing.start_interim()
-                        ret = self.marionette.add_feature(feature)
-                        self.timing.stop_interim()
-                    else:
-                        ret = ADD_FEATURE_ALREADY_ADDED
-                    # Do some bookkeeping with the return value
-                    if ret == ADD_FEATURE_SUCCESS:
-                        ret_string = self.success_symbol
-                        nums["success"] += 1
-                    elif ret == ADD_FEATURE_FAILURE:
-                        ret_string = self.failure_symbol
-                        nums["failure"] += 1
-                    elif ret == ADD_FEATURE_ALREADY_ADDED:
-                        ret_string = u"-"
-                        nums["already_added"] += 1
-                    elif ret == ADD_FEATURE_UNKNOWN_ERROR:
-                        ret_string = u"?"
-                        nums["unknown_error"] += 1
-                    self.logger.debug(u" > {:3d}/{} {} {}".format(i, num_features, ret_string, feature))
-                elif self.mode == MODE_GPX:
-                    self.logger.debug(u" > {:3d}/{} {}".format(i, num_features, feature))
-                    self.marionette.interactive_add_feature(feature)
-            i += 1
+                parallel = not self.dry_run and self.workers > 1
+                if not self.dry_run and (parallel or self.tabs > 1):
+                    features = self.set_aside_waypoints(features)
+                if parallel:
+                    num_features = self.add_features_parallel(features, None, nums)
+                else:
+                    if not self.dry_run and self.tabs > 1:
+                        # Load the next places in background tabs while the current one is saved
+                        self.marionette.init_tabs(self.tabs)
+                    num_features = self.add_features_sequential(features, None, nums)
+                self.retry_features(nums, parallel)
+                self.add_waypoints()
+        except ValueError as ve:
+            # Reading an import file failed, the features imported so far are kept in the journal
+            self.logger.error(u" > [ERROR] {} {}".format(ve.message, self.failure_symbol))
+            failed = True
+        finally:
+            # The preferences are stored in the profile, so they are restored in any case
+            if self.marionette is not None:
+                self.marionette.disable_lean()
+            if self.helpers is not None and self.backend_name == BACKEND_BROWSER:
+                for helper in self.helpers[1:]:
+                    helper.disable_lean()
+        for (path, reader), num in zip(import_files, stream.counts):
+            self.logger.debug(u" > [FILE] {}: {} features".format(path, num))
+        if len(stream) == 0 and not failed:
+            self.logger.error(u" > [ERROR] No features to import found {}".format(self.failure_symbol))
+        else:
+            self.logger.info(u" > Read {} features from {} files {}".format(
+                len(stream), len(stream.counts), self.success_symbol
+            ))
+        if stream.duplicates > 0:
+            self.logger.info(u" > Dropped {} duplicate features {}".format(stream.duplicates, self.success_symbol))
+        if self.retries.failures:
+            self.logger.info(u" > [RETRY] Failures: {}".format(u", ".join(
+                u"{} {}".format(count, reason) for reason, count in sorted(self.retries.failures.items())
+            )))
+            self.logger.info(u" > [RETRY] {} features saved by a retry {}".format(self.retries.recovered, self.success_symbol))
+        if self.resolver is not None:
+            self.resolver.close()
+            if self.resolver.waypoints:
+                self.logger.info(u" > [RESOLVE] {} waypoints resolved {}".format(self.resolver.resolved, self.success_symbol))
+            if self.resolver.reviews > 0:
+                self.logger.info(u" > [RESOLVE] {} waypoints written to '{}' for review {}".format(
+                    self.resolver.reviews, self.review_file, self.failure_symbol
+                ))
+            if self.resolver.places:
+                self.logger.info(u" > [RESOLVE] {} of {} places resolved to place IDs {}".format(
+                    self.resolver.places_resolved, self.resolver.place_lookups, self.success_symbol
+                ))
         if not self.dry_run and not self.compare:
             self.logger.info(u" > Summary:")
             self.logger.info(u" > Success: {:3d}".format(nums["success"]))
             self.logger.info(u" > Failure: {:3d}".format(nums["failure"]))
             self.logger.info(u" > Already added: {:3d}".format(nums["already_added"]))
             self.logger.info(u" > Unknown error: {:3d}".format(nums["unknown_error"]))
+            if self.resume:
+                self.logger.info(u" > Skipped (resumed): {:3d}".format(nums["skipped"]))
+            if self.throttle is not None:
+                self.logger.info(u" > [THROTTLE] Final rate: {:.2f} places/s".format(self.throttle.rate))
         elif self.compare:
             if nums["already_added"] == num_features:
                 self.logger.info(u" > All bookmarks / places already added / saved!")
             else:
                 self.logger.info(u" > {} bookmarks / places already added / saved".format(nums["already_added"]))
                 self.logger.info(u" > {} bookmarks / places need to be added / saved".format(num_features - nums["already_added"]))
-        self.timing.get_summary()
+        if self.journal is not None:
+            self.journal.close()
+        if self.waypoints is not None:
+            self.waypoints.close()
+        if self.backend is not None:
+            self.backend.close()
+        self.log_lean_summary()
+        self.log_cache_summary()
+        self.log_watchdog_summary()
+        times = self.timing.get_summary()
+        if self.metrics_file:
+            self.timing.export(self.metrics_file, times)
+        if failed:
+            self.logger.error(u" > [ERROR] The import stopped, please fix the file{} {}".format(
+                " and continue with '--resume'" if self.journal is not None else "", self.failure_symbol
+            ))
+            exit(1)
+        return nums, times
 
 
 if __name__ == "__main__":
@@ -347,9 +950,177 @@ if __name__ == "__main__":
         help="only compare which bookmarks / places are already added / saved",
     )
     batch_mode_parser.add_argument(
-        dest="import_file",
+        "--resolve",
+        action="store_true",
+        dest="resolve",
+        default=False,
+        help="resolve GPX waypoints to places with the Google Maps API and save them unattended, "
+             "waypoints without a unique match are written to the review file",
+    )
+    batch_mode_parser.add_argument(
+        "--resolve-places",
+        action="store_true",
+        dest="resolve_places",
+        default=False,
+        help="resolve the legacy URLs of places ('?cid=...', '?q=...&ftid=...') to place IDs by their titles and "
+             "coordinates with the Google Maps API ahead, so the browser opens their place pages directly",
+    )
+    batch_mode_parser.add_argument(
+        "--review-file",
+        dest="review_file",
         default=None,
-        help="the file to import (currently GeoJSON & GPX are supported)",
+        help="the file waypoints which couldn't be resolved are written to (default: '{}')".format(REVIEW_FILE),
+    )
+    batch_mode_parser.add_argument(
+        "--list",
+        choices=[LIST_STARRED_PLACES, LIST_WANT_TO_GO],
+        dest="list_add",
+        default=LIST_STARRED_PLACES,
+        help="which list to add resolved waypoints to, the HTTP backend only saves to '{}'".format(LIST_STARRED_PLACES)
+    )
+    batch_mode_parser.add_argument(
+        "--match-distance",
+        type=float,
+        dest="match_distance",
+        default=DEFAULT_MATCH_DISTANCE,
+        help="with '--compare', a feature also counts as already added if a bookmark lies within "
+             "this many metres of it, 0 only matches by place (default: {})".format(DEFAULT_MATCH_DISTANCE),
+    )
+    batch_mode_parser.add_argument(
+        "--offline",
+        action="store_true",
+        dest="offline",
+        default=False,
+        help="with '--compare', compare against the bookmark snapshot of the last run instead of "
+             "fetching the bookmarks, Firefox isn't needed",
+    )
+    batch_mode_parser.add_argument(
+        "--backend",
+        choices=BACKENDS,
+        dest="backend",
+        default=BACKEND_BROWSER,
+        help="save places by clicking through Google Maps in Firefox ('browser') or by requesting "
+             "the Google Bookmarks API directly with the cookies of the Firefox session ('http')",
+    )
+    batch_mode_parser.add_argument(
+        "--lean",
+        action="store_true",
+        dest="lean",
+        default=False,
+        help="don't load images, fonts, map tiles, photos and telemetry while importing, "
+             "the weight of every place page is measured",
+    )
+    batch_mode_parser.add_argument(
+        "--in-app",
+        action="store_true",
+        dest="in_app",
+        default=False,
+        help="load Google Maps once and move the running app from place to place instead of "
+             "loading every place page, a page is only loaded if the app doesn't reach the place",
+    )
+    batch_mode_parser.add_argument(
+        "--workers",
+        type=int,
+        dest="workers",
+        default=None,
+        help="number of parallel workers, with the browser backend each needs its own Firefox instance "
+             "(default: one per port)",
+    )
+    batch_mode_parser.add_argument(
+        "--marionette-ports",
+        type=port_list,
+        dest="marionette_ports",
+        default=[MARIONETTE_PORT],
+        help="comma separated Marionette ports of the Firefox instances, e.g. '2828,2829'",
+    )
+    batch_mode_parser.add_argument(
+        "--tabs",
+        type=int,
+        dest="tabs",
+        default=1,
+        help="number of tabs, the pages of the next places are loaded in the background "
+             "while the current one is saved (default: 1, i.e. no prefetching)",
+    )
+    batch_mode_parser.add_argument(
+        "--retries",
+        type=int,
+        dest="retries",
+        default=DEFAULT_RETRIES,
+        help="number of times features which failed for a transient reason, e.g. a timeout, are "
+             "retried at the end of the import, 0 disables retrying (default: {})".format(DEFAULT_RETRIES),
+    )
+    batch_mode_parser.add_argument(
+        "--retry-backoff",
+        type=float,
+        dest="retry_backoff",
+        default=DEFAULT_RETRY_BACKOFF,
+        help="seconds to wait before the first retry, doubled for every further one "
+             "(default: {})".format(DEFAULT_RETRY_BACKOFF),
+    )
+    batch_mode_parser.add_argument(
+        "--recycle-every",
+        type=int,
+        dest="recycle_every",
+        default=DEFAULT_RECYCLE_EVERY,
+        help="replace the browser tab with a new one after this many places, it's replaced early if "
+             "saving slows down or Firefox outgrows '--memory-limit', 0 replaces it only then "
+             "(default: {})".format(DEFAULT_RECYCLE_EVERY),
+    )
+    batch_mode_parser.add_argument(
+        "--memory-limit",
+        type=int,
+        dest="memory_limit",
+        default=DEFAULT_MEMORY_LIMIT,
+        help="memory of Firefox in MB beyond which the tab is replaced, 0 doesn't measure it, "
+             "together with '--recycle-every 0' tabs are never replaced (default: {})".format(DEFAULT_MEMORY_LIMIT),
+    )
+    batch_mode_parser.add_argument(
+        "--resume",
+        action="store_true",
+        dest="resume",
+        default=False,
+        help="skip features which were already imported by a previous, interrupted run",
+    )
+    batch_mode_parser.add_argument(
+        "--journal",
+        dest="journal_file",
+        default=None,
+        help="the journal recording the outcome of every feature (default: '{}')".format(JOURNAL_FILE),
+    )
+    batch_mode_parser.add_argument(
+        "--bookmarks-snapshot",
+        dest="bookmarks_file",
+        default=None,
+        help="the local snapshot of the existing bookmarks (default: '{}')".format(BOOKMARKS_SNAPSHOT_FILE),
+    )
+    batch_mode_parser.add_argument(
+        "--refresh-bookmarks",
+        action="store_true",
+        dest="refresh_bookmarks",
+        default=False,
+        help="fetch all existing bookmarks instead of only the ones added since the last run",
+    )
+    batch_mode_parser.add_argument(
+        "--max-rate",
+        type=float,
+        dest="max_rate",
+        default=DEFAULT_MAX_RATE,
+        help="maximum number of places saved per second and worker, the actual rate adapts to "
+             "failures and slow saves, 0 disables throttling (default: {})".format(DEFAULT_MAX_RATE),
+    )
+    batch_mode_parser.add_argument(
+        "--metrics-file",
+        dest="metrics_file",
+        default=None,
+        help="export the timing metrics of every phase at the end of the run, "
+             "as Prometheus textfile if it ends with '.prom', as JSON otherwise",
+    )
+    batch_mode_parser.add_argument(
+        dest="import_files",
+        nargs="+",
+        metavar="import_file",
+        help="the files, directories or glob patterns to import (GeoJSON, GPX, KML, CSV and Google Takeout "
+             "archives, i.e. ZIP, KMZ and tar files), places found in several files are imported once",
     )
     interactive_mode_parser = subparsers.add_parser(
         "interactive", help="Interactive mode, via menu"
@@ -362,6 +1133,31 @@ if __name__ == "__main__":
         help="which list to add bookmarks / places to"
     )
 
+    export_mode_parser = subparsers.add_parser(
+        "export", help="Export mode, writes the existing bookmarks to a file"
+    )
+    export_mode_parser.add_argument(
+        "--backend",
+        choices=BACKENDS,
+        dest="backend",
+        default=BACKEND_BROWSER,
+        help="fetch the bookmarks in Firefox ('browser') or by requesting the Google Bookmarks "
+             "API directly with the cookies of the Firefox session ('http')",
+    )
+    export_mode_parser.add_argument(
+        "--metrics-file",
+        dest="metrics_file",
+        default=None,
+        help="export the timing metrics at the end of the run, "
+             "as Prometheus textfile if it ends with '.prom', as JSON otherwise",
+    )
+    export_mode_parser.add_argument(
+        dest="export_file",
+        metavar="export_file",
+        help="the file to write, GeoJSON ('.json'), GPX ('.gpx') or CSV ('.csv') by its suffix, "
+             "it can be imported again in batch mode",
+    )
+
     # Parse the arguments
     args = parser.parse_args()
 
@@ -0,0 +1,71 @@
+#!/usr/bin/env python2
+
+import logging
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+from utils.backend import Backend, BOOKMARKS_DELTA_PAGE_SIZE
+from utils.bookmarks import Bookmark, BookmarkSnapshot
+from utils.timing import Timing
+
+
+def bookmark(i):
+    """
+    @return: The i-th bookmark, newer ones have higher numbers
+    """
+    return Bookmark(u"Place {}".format(i), u"http://maps.google.com/?cid={}".format(i), 1000 + i, [])
+
+
+class ListBackend(Backend):
+    """
+    A backend paging through a list of bookmarks, newest first.
+    """
+
+    def __init__(self, bookmarks):
+        self.logger = logging.getLogger()
+        self.timing = Timing(self.logger)
+        self.bookmarks = sorted(bookmarks, key=lambda b: b.timestamp, reverse=True)
+        self.pages = 0
+
+    def iter_bookmark_pages(self, page_size):
+        for start in range(0, len(self.bookmarks) + 1, page_size):
+            self.pages += 1
+            page = self.bookmarks[start:start + page_size]
+            yield page
+            if len(page) < page_size:
+                return
+
+
+class GetExistingBookmarksTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp(prefix="spi-test-")
+        self.snapshot = BookmarkSnapshot(os.path.join(self.tmp, "bookmarks.json"))
+        self.snapshot.update(bookmark(i) for i in range(10))
+        self.snapshot.fetched = time.time()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def test_incremental_refresh_reads_every_new_page(self):
+        # More new bookmarks than fit on one page of an incremental refresh
+        new = [bookmark(i) for i in range(10, 10 + 2 * BOOKMARKS_DELTA_PAGE_SIZE + 50)]
+        backend = ListBackend([bookmark(i) for i in range(10)] + new)
+        index = backend.get_existing_bookmarks(self.snapshot)
+        self.assertEqual(len(self.snapshot), 10 + len(new))
+        self.assertEqual(len(index), 10 + len(new))
+        self.assertEqual(backend.pages, 3)
+
+    def test_incremental_refresh_stops_at_known_bookmark(self):
+        backend = ListBackend([bookmark(i) for i in range(10 + BOOKMARKS_DELTA_PAGE_SIZE * 3)])
+        self.snapshot.update(bookmark(i) for i in range(10, 10 + BOOKMARKS_DELTA_PAGE_SIZE * 3 - 5))
+        backend.get_existing_bookmarks(self.snapshot)
+        self.assertEqual(len(self.snapshot), 10 + BOOKMARKS_DELTA_PAGE_SIZE * 3)
+        self.assertEqual(backend.pages, 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
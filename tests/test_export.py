@@ -0,0 +1,89 @@
+#!/usr/bin/env python2
+# -*- coding: utf-8 -*-
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from utils.bookmarks import Bookmark
+from utils.export import CsvWriter, GeoJsonWriter, GpxWriter, export_format
+from utils.sources import ImportStream, import_format
+from utils.store import KIND_PLACE
+
+
+BOOKMARKS = [
+    Bookmark(u"Café \"Zur Post\" & Bar", u"http://maps.google.com/?cid=1&q=52.5,13.4", 1500000000000000,
+             [u"Berlin", u"Café"]),
+    Bookmark(u"清水寺", u"https://www.google.com/maps/place/Kiyomizu/@34.9948561,135.7850463,17z", None, []),
+    # No coordinates, GPX can't hold it
+    Bookmark(None, u"http://maps.google.com/?cid=3", 1500000001000000, [u"Later"]),
+]
+
+
+class ExportTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp(prefix="spi-test-")
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def round_trip(self, name):
+        """
+        Exports the bookmarks and imports the export file again.
+        @return: The writer and the features read
+        """
+        path = os.path.join(self.tmp, name)
+        writer = export_format(path)(path)
+        for bookmark in BOOKMARKS:
+            writer.write(bookmark)
+        writer.close()
+        self.assertFalse(os.path.exists(writer.tmp_path))
+        return writer, list(ImportStream([(path, import_format(path))]))
+
+    def check(self, features, bookmarks):
+        self.assertEqual([f.kind for f in features], [KIND_PLACE] * len(bookmarks))
+        self.assertEqual([f.url for f in features], [b.url for b in bookmarks])
+        self.assertEqual([f.title for f in features], [b.title for b in bookmarks])
+        self.assertEqual((features[0].lat, features[0].lon), (52.5, 13.4))
+        self.assertEqual((features[1].lat, features[1].lon), (34.9948561, 135.7850463))
+
+    def test_geo_json(self):
+        writer, features = self.round_trip("bookmarks.json")
+        self.assertIsInstance(writer, GeoJsonWriter)
+        self.assertEqual((writer.exported, writer.skipped), (3, 0))
+        self.check(features, BOOKMARKS)
+
+    def test_gpx(self):
+        writer, features = self.round_trip("bookmarks.gpx")
+        self.assertIsInstance(writer, GpxWriter)
+        self.assertEqual((writer.exported, writer.skipped), (2, 1))
+        # The waypoints link to Google Maps, so they are places again
+        self.check(features, BOOKMARKS[:2])
+
+    def test_csv(self):
+        writer, features = self.round_trip("bookmarks.csv")
+        self.assertIsInstance(writer, CsvWriter)
+        self.assertEqual((writer.exported, writer.skipped), (3, 0))
+        self.check(features, BOOKMARKS)
+        self.assertEqual((features[2].lat, features[2].lon), (None, None))
+
+    def test_abort(self):
+        path = os.path.join(self.tmp, "bookmarks.json")
+        with open(path, "wb") as f:
+            f.write(b"previous")
+        writer = GeoJsonWriter(path)
+        writer.write(BOOKMARKS[0])
+        writer.abort()
+        # The previous export is kept
+        with open(path, "rb") as f:
+            self.assertEqual(f.read(), b"previous")
+        self.assertFalse(os.path.exists(writer.tmp_path))
+
+    def test_unknown_format(self):
+        self.assertIsNone(export_format("bookmarks.kml"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,72 @@
+#!/usr/bin/env python2
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from utils.constants import ADD_FEATURE_SUCCESS, ADD_FEATURE_ALREADY_ADDED, ADD_FEATURE_FAILURE, \
+    ADD_FEATURE_UNKNOWN_ERROR
+from utils.journal import Journal, hash_files
+
+
+class JournalTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp(prefix="spi-test-")
+        self.path = os.path.join(self.tmp, "journal.sqlite")
+        self.files = [self.write("a.json", b"a"), self.write("b.gpx", b"b")]
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def write(self, name, data):
+        path = os.path.join(self.tmp, name)
+        with open(path, "wb") as f:
+            f.write(data)
+        return path
+
+    def test_resume(self):
+        journal = Journal(self.path, self.files)
+        journal.record(u"url:1", ADD_FEATURE_SUCCESS)
+        journal.record(u"url:2", ADD_FEATURE_ALREADY_ADDED)
+        journal.record(u"url:3", ADD_FEATURE_FAILURE)
+        journal.record(u"url:4", ADD_FEATURE_UNKNOWN_ERROR)
+        journal.close()
+
+        # A new run of the same files, in another order
+        journal = Journal(self.path, list(reversed(self.files)))
+        self.assertTrue(journal.is_completed(u"url:1"))
+        self.assertTrue(journal.is_completed(u"url:2"))
+        # Failures are repeated
+        self.assertFalse(journal.is_completed(u"url:3"))
+        self.assertFalse(journal.is_completed(u"url:4"))
+        self.assertFalse(journal.is_completed(u"url:5"))
+        self.assertEqual(journal.count_completed(), 2)
+
+        # The latest outcome counts
+        journal.record(u"url:3", ADD_FEATURE_SUCCESS)
+        journal.record(u"url:1", ADD_FEATURE_FAILURE)
+        self.assertTrue(journal.is_completed(u"url:3"))
+        self.assertFalse(journal.is_completed(u"url:1"))
+        journal.close()
+
+    def test_other_files(self):
+        journal = Journal(self.path, self.files)
+        journal.record(u"url:1", ADD_FEATURE_SUCCESS)
+        journal.close()
+
+        # Changed content is another import, even under the same name
+        self.write("a.json", b"changed")
+        journal = Journal(self.path, self.files)
+        self.assertFalse(journal.is_completed(u"url:1"))
+        self.assertEqual(journal.count_completed(), 0)
+        journal.close()
+
+    def test_hash_files(self):
+        self.assertEqual(hash_files(self.files), hash_files(list(reversed(self.files))))
+        self.assertNotEqual(hash_files(self.files), hash_files(self.files[:1]))
+
+
+if __name__ == "__main__":
+    unittest.main()
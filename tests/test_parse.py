@@ -0,0 +1,121 @@
+#!/usr/bin/env python2
+# -*- coding: utf-8 -*-
+
+import io
+import json
+import unittest
+
+import utils.parse
+from utils.parse import GEO_JSON_URL_KEY, read_geo_json
+from utils.store import KIND_PLACE
+
+
+def geo_json(features, **members):
+    """
+    @return: A GeoJSON document with the passed features and top level members as UTF-8
+    """
+    document = dict(members, type="FeatureCollection", features=features)
+    return json.dumps(document, ensure_ascii=False, indent=1).encode("utf-8")
+
+
+def feature(url, lon=None, lat=None, title=None, location=None):
+    """
+    @return: A GeoJSON feature like the ones of Google Takeout
+    """
+    properties = {GEO_JSON_URL_KEY: url}
+    if title is not None:
+        properties["Title"] = title
+    if location is not None:
+        properties["Location"] = location
+    result = {"type": "Feature", "properties": properties}
+    if lon is not None:
+        result["geometry"] = {"type": "Point", "coordinates": [lon, lat]}
+    return result
+
+
+# Strings with escapes and multi-byte characters and numbers of many digits, which
+# are split at every position by some chunk size
+FEATURES = [
+    feature(u"http://maps.google.com/?cid=12345678901234567890", -0.000123456789e-2, 51.50073509, u"Café \"Zur Post\""),
+    feature(u"https://www.google.com/maps/place/M%C3%BCnchen", 11.5819806, 48.1351253, u"Tab\tand \\ backslash ☃"),
+    feature(u"http://maps.google.com/?q=Kyoto&ftid=0x6001:0xa2", location={
+        u"Business Name": u"清水寺", u"Address": u"京都市", u"Latitude": 34.9948561, u"Longitude": 135.7850463,
+    }),
+    feature(u"http://maps.google.com/?q=nowhere", 0, 0),
+]
+
+
+class ReadGeoJsonTest(unittest.TestCase):
+
+    def setUp(self):
+        self.chunk_size = utils.parse.CHUNK_SIZE
+
+    def tearDown(self):
+        utils.parse.CHUNK_SIZE = self.chunk_size
+
+    def read(self, data):
+        return list(read_geo_json(io.BytesIO(data)))
+
+    def test_features(self):
+        places = self.read(geo_json(FEATURES))
+        self.assertEqual([p.kind for p in places], [KIND_PLACE] * 4)
+        self.assertEqual([p.url for p in places], [f["properties"][GEO_JSON_URL_KEY] for f in FEATURES])
+        self.assertEqual(places[0].title, u"Café \"Zur Post\"")
+        self.assertEqual((places[0].lat, places[0].lon), (51.50073509, -0.000123456789e-2))
+        self.assertEqual((places[2].lat, places[2].lon), (34.9948561, 135.7850463))
+        self.assertEqual((places[2].title, places[2].address), (u"清水寺", u"京都市"))
+        # Google Takeout uses [0, 0] for places without coordinates
+        self.assertEqual((places[3].lat, places[3].lon), (None, None))
+
+    def test_chunk_boundaries(self):
+        data = geo_json(FEATURES, name=u"Gespeicherte Orte é \\\"", count=12345.678)
+        expected = self.read(data)
+        for size in range(1, len(data) + 2):
+            utils.parse.CHUNK_SIZE = size
+            self.assertEqual(self.read(data), expected, "chunk size {}".format(size))
+
+    def test_members_after_features(self):
+        data = b'{"features": [], "type": "FeatureCollection"}'
+        self.assertEqual(self.read(data), [])
+        data = b'{"type": "FeatureCollection", "features": []}'
+        self.assertEqual(self.read(data), [])
+
+    def test_missing_features(self):
+        for data in (b'{}', b'{"type": "FeatureCollection"}'):
+            with self.assertRaises(ValueError):
+                read_geo_json(io.BytesIO(data))
+
+    def test_malformed(self):
+        for data in (
+                b'',
+                b'[]',
+                b'{"features": {}}',
+                b'{"type" "FeatureCollection"}',
+        ):
+            with self.assertRaises(ValueError):
+                read_geo_json(io.BytesIO(data))
+
+    def test_malformed_features(self):
+        for data in (
+                b'{"features": [1',
+                b'{"features": [1]}',
+                b'{"features": [{"properties": {}}]}',
+                b'{"features": [{"type": "Feature"}]}',
+                b'{"features": [{"properties": {"Google Maps URL": "x", "Location": 5}}]}',
+                b'{"features": [{"properties": {"Google Maps URL": "x"}, "geometry": {"type": "Point", '
+                b'"coordinates": ["a", "b"]}}]}',
+                b'{"features": [{"properties": {"Google Maps URL": "x"}} {"properties": {}}]}',
+                b'{"features": [{"properties": {"Google Maps URL": "x"}}, {"properti',
+        ):
+            with self.assertRaises(ValueError):
+                self.read(data)
+
+    def test_malformed_feature_number(self):
+        data = geo_json(FEATURES[:2] + [{"type": "Feature"}])
+        with self.assertRaises(ValueError) as context:
+            self.read(data)
+        self.assertIn("feature 3", str(context.exception))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,124 @@
+#!/usr/bin/env python2
+# -*- coding: utf-8 -*-
+
+import unittest
+
+from utils.places import PlaceIndex, is_maps_url, is_search_url, place_key, url_coordinates
+from utils.sources import feature_key
+from utils.store import Feature, KIND_PLACE, KIND_WAYPOINT
+
+
+class PlaceKeyTest(unittest.TestCase):
+
+    def test_cid(self):
+        self.assertEqual(place_key("http://maps.google.com/?cid=123"), u"cid:123")
+        self.assertEqual(place_key("https://www.google.com/maps?ludocid=123&hl=de"), u"cid:123")
+        # Leading zeros and surrounding whitespace don't make another place
+        self.assertEqual(place_key(" http://maps.google.com/?cid=0123 "), u"cid:123")
+
+    def test_ftid(self):
+        # The second half of a feature ID is the customer ID in hex
+        url = "http://maps.google.com/?q=Itsukushima&ftid=0x355ab6cf888dc919:0xc91f62ebee004301"
+        self.assertEqual(place_key(url), u"cid:{}".format(0xc91f62ebee004301))
+        self.assertEqual(place_key(url), place_key("http://maps.google.com/?cid={}".format(0xc91f62ebee004301)))
+        # The same in the data parameter of a place URL
+        url = "https://www.google.com/maps/place/data=!4m2!3m1!1s0x0:0x1a2b"
+        self.assertEqual(place_key(url), u"cid:{}".format(0x1a2b))
+
+    def test_place_id(self):
+        key = u"place_id:ChIJ2V-Mo_l1nkcRfZixfUq4DAE"
+        self.assertEqual(place_key(
+            "https://www.google.com/maps/search/?api=1&query=Gate&query_place_id=ChIJ2V-Mo_l1nkcRfZixfUq4DAE"
+        ), key)
+        self.assertEqual(place_key("https://maps.google.com/?place_id=ChIJ2V-Mo_l1nkcRfZixfUq4DAE"), key)
+
+    def test_cid_before_place_id(self):
+        self.assertEqual(place_key("https://maps.google.com/?cid=7&query_place_id=ChIJ"), u"cid:7")
+
+    def test_coordinates(self):
+        self.assertEqual(place_key("http://maps.google.com/?q=52.516275,13.377704"), u"ll:52.51628,13.37770")
+        # Rounded, so tiny differences still match
+        self.assertEqual(place_key("http://maps.google.com/?q=52.5162751,13.3777041"), u"ll:52.51628,13.37770")
+        # The passed coordinates are preferred over a search query ...
+        self.assertEqual(place_key("http://maps.google.com/?q=Gate", 52.516275, 13.377704), u"ll:52.51628,13.37770")
+        # ... and the map center in the path is the last resort
+        self.assertEqual(
+            place_key("https://www.google.com/maps/place/Brandenburger+Tor/@52.516275,13.377704,17z"),
+            u"ll:52.51628,13.37770"
+        )
+
+    def test_query(self):
+        key = place_key("http://maps.google.com/?q=Brandenburger+Tor,++Berlin")
+        self.assertEqual(key, u"q:brandenburger tor, berlin")
+        self.assertEqual(place_key("https://www.google.com/maps/search/?api=1&query=brandenburger%20tor,%20Berlin"), key)
+        self.assertEqual(place_key(u"http://maps.google.com/?q=M%C3%BCnchen"), u"q:münchen")
+
+    def test_url(self):
+        self.assertEqual(
+            place_key("https://www.google.com/maps/place/Somewhere"),
+            place_key("https://google.com/maps/place/Somewhere")
+        )
+        self.assertNotEqual(
+            place_key("https://www.google.com/maps/place/Somewhere"),
+            place_key("https://www.google.com/maps/place/Elsewhere")
+        )
+
+    def test_feature_key(self):
+        place = Feature(KIND_PLACE, "http://maps.google.com/?cid=5", 1.0, 2.0)
+        self.assertEqual(feature_key(place), u"cid:5")
+        # A waypoint without a link is its coordinates
+        self.assertEqual(feature_key(Feature(KIND_WAYPOINT, None, 1.0, 2.0)), u"ll:1.00000,2.00000")
+
+
+class UrlTest(unittest.TestCase):
+
+    def test_url_coordinates(self):
+        self.assertEqual(url_coordinates("http://maps.google.com/?q=-33.8,151.2"), (-33.8, 151.2))
+        self.assertEqual(url_coordinates("http://maps.google.com/?ll=1,2&q=Cafe"), (1.0, 2.0))
+        self.assertEqual(url_coordinates("https://www.google.com/maps/@48.1,11.5,12z"), (48.1, 11.5))
+        self.assertIsNone(url_coordinates("http://maps.google.com/?cid=1"))
+
+    def test_is_maps_url(self):
+        self.assertTrue(is_maps_url("http://maps.google.com/?cid=1"))
+        self.assertTrue(is_maps_url("https://www.google.de/maps/place/X"))
+        self.assertTrue(is_maps_url("https://maps.app.goo.gl/abc"))
+        self.assertTrue(is_maps_url(u"https://www.google.com/maps/place/Café"))
+        self.assertFalse(is_maps_url("https://www.google.com/search?q=maps"))
+        self.assertFalse(is_maps_url("https://example.com/maps/x"))
+
+    def test_is_search_url(self):
+        self.assertTrue(is_search_url("https://www.google.com/maps/search/?api=1&query=X&query_place_id=Y"))
+        self.assertFalse(is_search_url("https://www.google.com/maps/search/?api=1&query=X"))
+
+
+class PlaceIndexTest(unittest.TestCase):
+
+    def test_url_styles(self):
+        index = PlaceIndex(["http://maps.google.com/?cid={}".format(0xc91f62ebee004301)])
+        self.assertIn("http://maps.google.com/?q=X&ftid=0x355ab6cf888dc919:0xc91f62ebee004301", index)
+        self.assertIn("https://www.google.com/maps?ludocid={}".format(0xc91f62ebee004301), index)
+        self.assertNotIn("http://maps.google.com/?cid=1", index)
+        self.assertEqual(len(index), 1)
+
+    def test_duplicates(self):
+        index = PlaceIndex([
+            "http://maps.google.com/?cid=1", "https://www.google.com/maps?ludocid=1", "http://maps.google.com/?cid=2",
+        ])
+        self.assertEqual(len(index), 2)
+
+    def test_added_place(self):
+        # Like a place saved during the import, see SavedPlacesImporter.record_result()
+        index = PlaceIndex()
+        index.add("http://maps.google.com/?q=Gate", 52.516275, 13.377704)
+        self.assertTrue(index.contains_key(place_key("http://maps.google.com/?q=52.516275,13.377704")))
+        self.assertTrue(index.within(52.5163, 13.3778, 50.0))
+        self.assertFalse(index.within(52.52, 13.38, 50.0))
+
+    def test_coordinates_of_urls(self):
+        index = PlaceIndex(["http://maps.google.com/?q=52.516275,13.377704", "http://maps.google.com/?cid=1"])
+        self.assertAlmostEqual(index.near(52.5163, 13.3777, 50.0), 2.8, places=1)
+        self.assertIsNone(index.near(0.0, 0.0, 50.0))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,50 @@
+#!/usr/bin/env python2
+
+import unittest
+
+from utils.constants import FAILURE_TIMEOUT, FAILURE_DISCONNECT, FAILURE_REFUSED, FAILURE_BUTTON_TEXT
+from utils.retry import RetryQueue
+
+
+class RetryQueueTest(unittest.TestCase):
+
+    def test_rounds(self):
+        queue = RetryQueue(retries=2, backoff=0)
+        self.assertTrue(queue.defer("a", FAILURE_TIMEOUT))
+        self.assertTrue(queue.defer("b", FAILURE_DISCONNECT))
+        self.assertEqual(len(queue), 2)
+        rounds = []
+        for number, features in queue.rounds():
+            rounds.append((number, features))
+            # 'a' fails again, 'b' is saved
+            if "a" in features:
+                queue.defer("a", FAILURE_TIMEOUT)
+        self.assertEqual(rounds, [(1, ["a", "b"]), (2, ["a"])])
+        # The retries are used up, the last failure is final
+        self.assertEqual(len(queue), 0)
+        self.assertEqual(queue.failures[FAILURE_TIMEOUT], 3)
+        self.assertEqual(queue.failures[FAILURE_DISCONNECT], 1)
+
+    def test_last_round(self):
+        queue = RetryQueue(retries=1, backoff=0)
+        queue.defer("a", FAILURE_TIMEOUT)
+        for number, features in queue.rounds():
+            self.assertFalse(queue.defer("a", FAILURE_TIMEOUT))
+        self.assertEqual(queue.round, 1)
+
+    def test_permanent_failures(self):
+        queue = RetryQueue(retries=2, backoff=0)
+        self.assertFalse(queue.defer("a", FAILURE_REFUSED))
+        # An unknown label of the save button doesn't go away by retrying
+        self.assertFalse(queue.defer("b", FAILURE_BUTTON_TEXT))
+        self.assertEqual(list(queue.rounds()), [])
+        self.assertEqual(queue.failures[FAILURE_BUTTON_TEXT], 1)
+
+    def test_disabled(self):
+        queue = RetryQueue(retries=0, backoff=0)
+        self.assertFalse(queue.defer("a", FAILURE_TIMEOUT))
+        self.assertEqual(list(queue.rounds()), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,82 @@
+#!/usr/bin/env python2
+
+import random
+import time
+import unittest
+
+from utils.places import PlaceIndex
+from utils.spatial import SpatialIndex, distance
+
+
+def cluster(rnd, n, lat, lon, size):
+    """
+    @return: n random points in the square of the passed size in degrees
+    """
+    return [(lat + rnd.random() * size, lon + rnd.random() * size) for _ in range(n)]
+
+
+def nearest(points, lat, lon, max_distance):
+    """
+    @return: The distance to the nearest point within the passed distance by a pairwise scan, None if there is none
+    """
+    distances = [d for d in (distance(lat, lon, p[0], p[1]) for p in points) if d <= max_distance]
+    return min(distances) if distances else None
+
+
+class SpatialIndexTest(unittest.TestCase):
+
+    def setUp(self):
+        self.rnd = random.Random(1)
+
+    def check(self, points, queries, max_distance):
+        """
+        Compares the index, unprepared and prepared for the distance, with a pairwise scan.
+        """
+        index = SpatialIndex()
+        for lat, lon in points:
+            index.add(lat, lon)
+        expected = [nearest(points, lat, lon, max_distance) for lat, lon in queries]
+        for prepared in (False, True):
+            if prepared:
+                index.prepare(max_distance)
+            for (lat, lon), d in zip(queries, expected):
+                self.assertEqual(index.within(lat, lon, max_distance), d is not None, (lat, lon, prepared))
+                if d is None:
+                    self.assertIsNone(index.near(lat, lon, max_distance))
+                else:
+                    self.assertAlmostEqual(index.near(lat, lon, max_distance), d)
+
+    def test_city(self):
+        points = cluster(self.rnd, 500, 52.5, 13.3, 0.01)
+        self.check(points, cluster(self.rnd, 500, 52.5, 13.3, 0.01), 50.0)
+
+    def test_antimeridian(self):
+        points = cluster(self.rnd, 300, -17.01, 179.995, 0.01)
+        points = [(lat, lon - 360 if lon > 180 else lon) for lat, lon in points]
+        self.check(points, cluster(self.rnd, 300, -17.01, 179.995, 0.01), 100.0)
+
+    def test_poles(self):
+        for lat in (88.95, 89.95, -89.99):
+            around = lambda n: [(lat + self.rnd.random() * 0.04, self.rnd.uniform(-180, 180)) for _ in range(n)]
+            self.check(around(50), around(200), 500.0)
+
+    def test_larger_distance(self):
+        points = cluster(self.rnd, 300, 60.0, 10.0, 0.5)
+        self.check(points, cluster(self.rnd, 300, 60.0, 10.0, 0.5), 2000.0)
+
+    def test_clustered_compare_time(self):
+        # 10k bookmarks of one city, the pairwise scan of the cells of a fixed
+        # grid took about 35 s for this
+        index = PlaceIndex()
+        for lat, lon in cluster(self.rnd, 10000, 52.5, 13.3, 0.1):
+            index.locations.add(lat, lon)
+        queries = cluster(self.rnd, 100000, 52.5, 13.3, 0.1)
+        start = time.time()
+        matched = sum(1 for lat, lon in queries if index.within(lat, lon, 50.0))
+        elapsed = time.time() - start
+        self.assertGreater(matched, 0)
+        self.assertLess(elapsed, 5.0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,92 @@
+#!/usr/bin/env python2
+
+import logging
+import time
+import unittest
+
+from utils.constants import ADD_FEATURE_SUCCESS, ADD_FEATURE_ALREADY_ADDED, ADD_FEATURE_FAILURE
+from utils.throttle import AdaptiveThrottle, RATE_INITIAL, RATE_START_FACTOR, RATE_INCREASE, \
+    RATE_DECREASE, RATE_MIN, LATENCY_MIN_SAMPLES, SLOW_MIN_LATENCY, BACKOFF_INITIAL
+
+
+class AdaptiveThrottleTest(unittest.TestCase):
+
+    def setUp(self):
+        self.throttle = AdaptiveThrottle(logging.getLogger(), 10.0)
+
+    def test_slow_start(self):
+        self.throttle.report(ADD_FEATURE_SUCCESS, 1.0)
+        self.throttle.report(ADD_FEATURE_SUCCESS, 1.0)
+        self.assertAlmostEqual(self.throttle.rate, RATE_INITIAL * RATE_START_FACTOR ** 2)
+        for _ in range(100):
+            self.throttle.report(ADD_FEATURE_SUCCESS, 1.0)
+        self.assertEqual(self.throttle.rate, 10.0)
+
+    def test_failure(self):
+        self.throttle.report(ADD_FEATURE_SUCCESS, 1.0)
+        rate = self.throttle.rate
+        start = time.time()
+        self.throttle.report(ADD_FEATURE_FAILURE, 1.0)
+        self.assertAlmostEqual(self.throttle.rate, rate * RATE_DECREASE)
+        self.assertGreaterEqual(self.throttle.paused_until, start + BACKOFF_INITIAL)
+        # The pause doubles with every further failure
+        self.throttle.report(ADD_FEATURE_FAILURE, 1.0)
+        self.assertGreaterEqual(self.throttle.paused_until, start + 2 * BACKOFF_INITIAL)
+        # After the first cut the rate rises additively
+        rate = self.throttle.rate
+        self.throttle.report(ADD_FEATURE_SUCCESS, 1.0)
+        self.assertAlmostEqual(self.throttle.rate, rate + RATE_INCREASE)
+        self.assertEqual(self.throttle.failures, 0)
+
+    def test_minimum_rate(self):
+        for _ in range(20):
+            self.throttle.report(ADD_FEATURE_FAILURE, 1.0)
+        self.assertAlmostEqual(self.throttle.rate, RATE_MIN)
+
+    def test_slow_save(self):
+        # Too few saves to tell what's slow
+        for _ in range(LATENCY_MIN_SAMPLES - 1):
+            self.throttle.report(ADD_FEATURE_SUCCESS, 0.1)
+        self.assertIsNone(self.throttle.threshold())
+        self.throttle.report(ADD_FEATURE_SUCCESS, 60.0)
+        self.assertFalse(self.throttle.cut)
+        self.throttle = AdaptiveThrottle(logging.getLogger(), 10.0)
+        for _ in range(LATENCY_MIN_SAMPLES):
+            self.throttle.report(ADD_FEATURE_SUCCESS, 0.1)
+        # Slower than usual but below the absolute minimum is jitter
+        self.assertEqual(self.throttle.threshold(), SLOW_MIN_LATENCY)
+        self.throttle.report(ADD_FEATURE_SUCCESS, SLOW_MIN_LATENCY + 0.5)
+        self.assertTrue(self.throttle.cut)
+        self.assertEqual(self.throttle.failures, 1)
+        # Beyond it the percentile of the recent saves counts
+        for _ in range(LATENCY_MIN_SAMPLES):
+            self.throttle.report(ADD_FEATURE_SUCCESS, 4.0)
+        self.assertEqual(self.throttle.threshold(), 8.0)
+
+    def test_only_saves_measured(self):
+        # A place which was already added returns quickly without saving
+        for _ in range(LATENCY_MIN_SAMPLES):
+            self.throttle.report(ADD_FEATURE_ALREADY_ADDED, 0.01)
+        self.assertIsNone(self.throttle.threshold())
+        self.throttle.report(ADD_FEATURE_SUCCESS, SLOW_MIN_LATENCY + 0.5)
+        self.assertFalse(self.throttle.cut)
+
+    def test_workers(self):
+        throttle = AdaptiveThrottle(logging.getLogger(), 2.0, workers=4)
+        self.assertEqual(throttle.max_rate, 8.0)
+        self.assertAlmostEqual(throttle.rate, RATE_INITIAL * 4)
+        throttle.report(ADD_FEATURE_FAILURE, 1.0)
+        throttle.report(ADD_FEATURE_SUCCESS, 1.0)
+        self.assertAlmostEqual(throttle.rate, RATE_INITIAL * 4 * RATE_DECREASE + RATE_INCREASE * 4)
+
+    def test_acquire(self):
+        throttle = AdaptiveThrottle(logging.getLogger(), 1000.0)
+        throttle.rate = 1000.0
+        start = time.time()
+        for _ in range(20):
+            throttle.acquire()
+        self.assertLess(time.time() - start, 1.0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,109 @@
+#!/usr/bin/env python2
+
+import posixpath
+import tarfile
+import zipfile
+from io import BytesIO
+
+from utils.parse import read_geo_json, read_gpx, read_kml, read_csv
+
+
+# The GeoJSON file of the saved places in a Google Takeout archive ('Takeout/Maps (your places)/')
+TAKEOUT_SAVED_PLACES = "saved places.json"
+# The directory of the CSV files of the saved lists in a Google Takeout archive ('Takeout/Saved/')
+TAKEOUT_SAVED_LISTS = "saved"
+
+# Size (in bytes) up to which an archive inside an archive, e.g. a KMZ file of Google
+# My Maps in Google Takeout, is read into memory, as it can only be opened seekable
+NESTED_ARCHIVE_LIMIT = 32 * 1024 * 1024
+
+
+def member_reader(name):
+    """
+    Picks the reader of an archive member by its name. Archives hold many files, so JSON
+    is only read from the saved places and CSV from the saved lists of Google Takeout,
+    while KML, KMZ and GPX files are read wherever they are.
+    @return: The reader or None if the member isn't read
+    """
+    base = posixpath.basename(name).lower()
+    if base == TAKEOUT_SAVED_PLACES:
+        return read_geo_json
+    if base.endswith(".csv") and posixpath.basename(posixpath.dirname(name)).lower() == TAKEOUT_SAVED_LISTS:
+        return read_csv
+    if base.endswith(".kml"):
+        return read_kml
+    if base.endswith(".kmz"):
+        return read_zip
+    if base.endswith(".gpx"):
+        return read_gpx
+    return None
+
+
+def _read_member(name, f, reader, size):
+    """
+    Yields the features of an archive member, an archive inside is read into memory first.
+    Errors name the member.
+    @return: Generator of features
+    """
+    try:
+        if reader is read_zip:
+            if size > NESTED_ARCHIVE_LIMIT:
+                raise ValueError("Archive too large to be read from inside another one, please extract it")
+            f = BytesIO(f.read())
+        for feature in reader(f):
+            yield feature
+    except ValueError as e:
+        raise ValueError("{}: {}".format(name, e))
+
+
+def read_zip(f):
+    """
+    Reads the features of the members of a ZIP archive (e.g. Google Takeout or KMZ) one
+    after another, see member_reader(). Every member is decompressed while it's parsed,
+    nothing is extracted. The file isn't closed.
+    @return: Generator of features
+    """
+    try:
+        archive = zipfile.ZipFile(f)
+    except zipfile.BadZipfile as e:
+        raise ValueError("Malformed ZIP archive, {}".format(e))
+    with archive:
+        for info in archive.infolist():
+            reader = member_reader(info.filename)
+            if reader is None:
+                continue
+            member = archive.open(info)
+            try:
+                for feature in _read_member(info.filename, member, reader, info.file_size):
+                    yield feature
+            finally:
+                member.close()
+
+
+def read_tar(f):
+    """
+    Reads the features of the members of a, possibly compressed, tar archive (e.g. Google
+    Takeout) one after another, see member_reader(). The archive is read as a stream in
+    one pass, every member is decompressed while it's parsed, nothing is extracted. The
+    file isn't closed.
+    @return: Generator of features
+    """
+    try:
+        archive = tarfile.open(fileobj=f, mode="r|*")
+    except tarfile.TarError as e:
+        raise ValueError("Malformed tar archive, {}".format(e))
+    try:
+        for info in archive:
+            reader = member_reader(info.name) if info.isfile() else None
+            if reader is None:
+                continue
+            member = archive.extractfile(info)
+            try:
+                for feature in _read_member(info.name, member, reader, info.size):
+                    yield feature
+            finally:
+                member.close()
+    except tarfile.TarError as e:
+        raise ValueError("Malformed tar archive, {}".format(e))
+    finally:
+        archive.close()
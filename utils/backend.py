@@ -0,0 +1,123 @@
+#!/usr/bin/env python2
+
+from utils.places import PlaceIndex
+from utils.constants import ADD_FEATURE_UNKNOWN_ERROR, FAILURE_UNKNOWN
+
+
+# Number of bookmarks fetched per page for a complete and an incremental refresh
+BOOKMARKS_PAGE_SIZE = 1000
+BOOKMARKS_DELTA_PAGE_SIZE = 100
+
+BACKEND_BROWSER = "browser"
+BACKEND_HTTP = "http"
+BACKENDS = [BACKEND_BROWSER, BACKEND_HTTP]
+
+
+class Backend:
+    """
+    The interface the importer fetches the existing bookmarks and saves places
+    through. Implementations need a logger and a timing instance and provide
+    iter_bookmark_pages(), add_feature() and add_feature_2(), the handling of
+    the bookmark snapshot is shared. Workers may share one instance only if
+    it's thread-safe, like the HTTP backend, but not the browser. A failed add
+    leaves its reason with fail(), per thread in a threading.local 'failure'.
+    """
+
+    logger = None
+    timing = None
+    failure = None
+
+    def iter_bookmark_pages(self, page_size):
+        """
+        Page through the existing bookmarks, newest first.
+        @return: Generator of pages, i.e. lists of bookmarks
+        """
+        raise NotImplementedError()
+
+    def add_feature(self, url):
+        """
+        Tries to add a feature (bookmark / place) to your Google Maps fav list.
+        @return: The ADD_FEATURE_* result
+        """
+        raise NotImplementedError()
+
+    def add_feature_2(self, url, list_add):
+        """
+        Tries to add a feature (bookmark / place) to the passed list.
+        @return: The ADD_FEATURE_* result
+        """
+        raise NotImplementedError()
+
+    def fail(self, reason, result=ADD_FEATURE_UNKNOWN_ERROR):
+        """
+        Keeps the reason of a failed add for pop_failure() of the same thread.
+        @return: The passed result
+        """
+        self.failure.reason = reason
+        return result
+
+    def pop_failure(self):
+        """
+        Takes the reason of the last failed add of the current thread.
+        @return: The FAILURE_* reason, FAILURE_UNKNOWN if none was left
+        """
+        reason = getattr(self.failure, "reason", None)
+        self.failure.reason = None
+        return reason or FAILURE_UNKNOWN
+
+    def reset(self):
+        """
+        Drops any state left by previous adds before features are retried.
+        @return: -
+        """
+        pass
+
+    def check_health(self, result, latency):
+        """
+        Looks after the backend once a feature was added with the passed
+        ADD_FEATURE_* result and latency (in seconds).
+        @return: -
+        """
+        pass
+
+    def close(self):
+        """
+        Release what the backend holds, e.g. connections.
+        @return: -
+        """
+        pass
+
+    def get_existing_bookmarks(self, snapshot=None, full_refresh=False):
+        """
+        Get the existing bookmarks from the Google Bookmarks API. If a snapshot is
+        passed and still fresh only the bookmarks added since it was taken are
+        fetched, otherwise all of them. The snapshot is updated and saved.
+        @return: Index of the places of the existing bookmarks
+        """
+        with self.timing.span("get_existing_bookmarks"):
+            return self._get_existing_bookmarks(snapshot, full_refresh)
+
+    def _get_existing_bookmarks(self, snapshot, full_refresh):
+        """
+        See get_existing_bookmarks().
+        @return: Index of the places of the existing bookmarks
+        """
+        if snapshot is None:
+            return PlaceIndex(bookmark.url for page in self.iter_bookmark_pages(BOOKMARKS_PAGE_SIZE) for bookmark in page)
+        if not full_refresh and snapshot.is_fresh():
+            # Updating the snapshot raises its newest timestamp, so the pages are compared to the one before
+            cutoff = snapshot.newest
+            self.logger.debug(u" > Refreshing bookmarks newer than {}".format(cutoff))
+            for page in self.iter_bookmark_pages(BOOKMARKS_DELTA_PAGE_SIZE):
+                newer = [bookmark for bookmark in page if bookmark.timestamp > cutoff]
+                snapshot.update(newer)
+                # Bookmarks are returned newest first, so we can stop at the first known one
+                if len(newer) < len(page):
+                    break
+        else:
+            self.logger.debug(u" > Fetching all bookmarks")
+            snapshot.clear()
+            for page in self.iter_bookmark_pages(BOOKMARKS_PAGE_SIZE):
+                snapshot.update(page)
+        snapshot.save()
+        return PlaceIndex(snapshot.urls())
@@ -0,0 +1,128 @@
+#!/usr/bin/env python2
+
+import json
+import os
+import time
+from collections import namedtuple
+
+import xml.etree.ElementTree as ET
+
+
+# A bookmark as returned by the Google Bookmarks API, the timestamp is in microseconds
+Bookmark = namedtuple("Bookmark", ["title", "url", "timestamp", "labels"])
+
+# Snapshots older than this (in seconds) are refreshed completely instead of incrementally
+SNAPSHOT_MAX_AGE = 24 * 60 * 60
+
+
+def iter_bookmarks_xml(source):
+    """
+    Parses a page of the Google Bookmarks XML output incrementally,
+    every bookmark is dropped from the tree as soon as it was read.
+    @return: Generator of bookmarks
+    """
+    container = None
+    fields = {}
+    for event, elem in ET.iterparse(source, events=("start", "end")):
+        if event == "start":
+            if elem.tag == "bookmarks":
+                container = elem
+            elif elem.tag == "bookmark":
+                fields = {"labels": []}
+            continue
+        if elem.tag == "bookmark":
+            yield Bookmark(
+                fields.get("title"), fields.get("url"),
+                int(fields.get("timestamp") or 0), fields["labels"]
+            )
+            elem.clear()
+            if container is not None:
+                container.remove(elem)
+        elif elem.tag in ("title", "url", "timestamp"):
+            fields[elem.tag] = elem.text
+        elif elem.tag == "label":
+            fields["labels"].append(elem.text)
+
+
+class BookmarkSnapshot:
+    """
+    A local on-disk snapshot of the existing bookmarks, it allows
+    to refresh only the bookmarks added since the last run.
+    """
+
+    def __init__(self, path, max_age=SNAPSHOT_MAX_AGE):
+        """
+        Initialise the snapshot, it's loaded from the passed path if it exists.
+        """
+        self.path = path
+        self.max_age = max_age
+        # Time of the last complete fetch in seconds
+        self.fetched = 0
+        # Timestamp of the newest bookmark in microseconds
+        self.newest = 0
+        self.bookmarks = {}
+        self.load()
+
+    def load(self):
+        """
+        Load the snapshot from disk, a missing or broken file results in an empty snapshot.
+        @return: Whether or not the snapshot was loaded
+        """
+        try:
+            with open(self.path, "r") as f:
+                data = json.load(f)
+        except (IOError, ValueError):
+            return False
+        self.fetched = data.get("fetched", 0)
+        self.newest = data.get("newest", 0)
+        self.bookmarks = {}
+        self.update(Bookmark(**bookmark) for bookmark in data.get("bookmarks", []))
+        return True
+
+    def save(self):
+        """
+        Save the snapshot to disk, the file is replaced atomically.
+        @return: -
+        """
+        tmp_path = "{}.tmp".format(self.path)
+        with open(tmp_path, "w") as f:
+            json.dump({
+                "fetched": self.fetched,
+                "newest": self.newest,
+                "bookmarks": [bookmark._asdict() for bookmark in self.bookmarks.values()],
+            }, f)
+        os.rename(tmp_path, self.path)
+
+    def is_fresh(self):
+        """
+        Check if the snapshot is recent enough for an incremental refresh.
+        @return: Whether or not the snapshot can be refreshed incrementally
+        """
+        return self.fetched > 0 and time.time() - self.fetched < self.max_age
+
+    def clear(self):
+        """
+        Drop all bookmarks, e.g. before a complete refresh.
+        @return: -
+        """
+        self.fetched = time.time()
+        self.newest = 0
+        self.bookmarks = {}
+
+    def update(self, bookmarks):
+        """
+        Add or replace the passed bookmarks.
+        @return: -
+        """
+        for bookmark in bookmarks:
+            self.bookmarks[bookmark.url] = bookmark
+            self.newest = max(self.newest, bookmark.timestamp)
+
+    def urls(self):
+        """
+        @return: Set of the URLs of all bookmarks
+        """
+        return set(self.bookmarks)
+
+    def __len__(self):
+        return len(self.bookmarks)
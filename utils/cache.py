@@ -0,0 +1,158 @@
+#!/usr/bin/env python2
+
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+
+# Number of responses kept in memory
+CACHE_SIZE = 1024
+# Time (in seconds) after which a cached response is fetched again
+CACHE_TTL = 30 * 24 * 60 * 60
+
+
+class PlacesCache:
+    """
+    An in-memory LRU cache backed by an on-disk store, every
+    entry expires after the time to live (TTL).
+    """
+
+    def __init__(self, path, ttl=CACHE_TTL, size=CACHE_SIZE):
+        """
+        Open (or create) the on-disk store at the passed path.
+        """
+        self.ttl = ttl
+        self.size = size
+        self.memory = OrderedDict()
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS cache ("
+            "key TEXT PRIMARY KEY, "
+            "value TEXT NOT NULL, "
+            "created REAL NOT NULL)"
+        )
+        self.connection.commit()
+        self.hits = 0
+        self.misses = 0
+
+    def _remember(self, key, value, created):
+        """
+        Put an entry into the in-memory cache, evicting the least recently used one.
+        @return: -
+        """
+        self.memory[key] = (value, created)
+        if len(self.memory) > self.size:
+            self.memory.popitem(last=False)
+
+    def get(self, key):
+        """
+        Look up an entry, first in memory, then on disk.
+        @return: The cached value or None
+        """
+        now = time.time()
+        with self.lock:
+            if key in self.memory:
+                value, created = self.memory.pop(key)
+                if now - created < self.ttl:
+                    # Re-insert as most recently used
+                    self.memory[key] = (value, created)
+                    self.hits += 1
+                    return value
+            row = self.connection.execute(
+                "SELECT value, created FROM cache WHERE key = ?", (key,)
+            ).fetchone()
+            if row is not None and now - row[1] < self.ttl:
+                value = json.loads(row[0])
+                self._remember(key, value, row[1])
+                self.hits += 1
+                return value
+            self.misses += 1
+            return None
+
+    def put(self, key, value):
+        """
+        Store an entry in memory and on disk.
+        @return: -
+        """
+        now = time.time()
+        with self.lock:
+            self._remember(key, value, now)
+            self.connection.execute(
+                "INSERT OR REPLACE INTO cache (key, value, created) VALUES (?, ?, ?)",
+                (key, json.dumps(value), now)
+            )
+            self.connection.commit()
+
+    def close(self):
+        """
+        Close the on-disk store.
+        @return: -
+        """
+        with self.lock:
+            self.connection.close()
+
+
+class CachedPlacesClient:
+    """
+    Wraps a googlemaps.Client, lookups are answered from the cache if the same
+    query (with the same type and language) was made before.
+    """
+
+    def __init__(self, client, cache):
+        """
+        Initialise the wrapper, it expects a googlemaps.Client and a PlacesCache.
+        """
+        self.client = client
+        self.cache = cache
+
+    def _cached(self, method, **kwargs):
+        """
+        Call a method of the client unless its response is cached.
+        @return: The response
+        """
+        key = json.dumps([method, kwargs], sort_keys=True)
+        value = self.cache.get(key)
+        if value is None:
+            value = getattr(self.client, method)(**kwargs)
+            self.cache.put(key, value)
+        return value
+
+    def places(self, query, type=None, language=None):
+        """
+        Cached text search, see googlemaps.Client.places().
+        @return: The response
+        """
+        return self._cached("places", query=query, type=type, language=language)
+
+    def places_autocomplete(self, input_text, types=None, language=None):
+        """
+        Cached autocompletion, see googlemaps.Client.places_autocomplete().
+        @return: The response
+        """
+        return self._cached("places_autocomplete", input_text=input_text, types=types, language=language)
+
+    def find_place(self, input, input_type, fields=None, location_bias=None, language=None):
+        """
+        Cached place search, see googlemaps.Client.find_place().
+        @return: The response
+        """
+        return self._cached(
+            "find_place", input=input, input_type=input_type, fields=fields,
+            location_bias=location_bias, language=language
+        )
+
+    def places_nearby(self, location, radius=None, keyword=None, type=None, language=None):
+        """
+        Cached nearby search, see googlemaps.Client.places_nearby().
+        @return: The response
+        """
+        return self._cached(
+            "places_nearby", location=location, radius=radius, keyword=keyword, type=type, language=language
+        )
+
+    def __getattr__(self, name):
+        # Everything else goes to the client uncached
+        return getattr(self.client, name)
@@ -2,6 +2,9 @@
 
 APP_NAME = "Saved Places Importer"
 
+MARIONETTE_HOST = "localhost"
+MARIONETTE_PORT = 2828
+
 LIST_STARRED_PLACES = "LIST_STARRED_PLACES"
 LIST_WANT_TO_GO = "LIST_WANT_TO_GO"
 
@@ -9,8 +12,42 @@ ADD_FEATURE_SUCCESS = 0
 ADD_FEATURE_FAILURE = 1
 ADD_FEATURE_ALREADY_ADDED = 2
 ADD_FEATURE_UNKNOWN_ERROR = 3
+ADD_FEATURE_SKIPPED = 4
 
-MODE_GPX = "GPX"
-MODE_GEO_JSON = "GEO_JSON"
 MODE_BATCH = "BATCH"
 MODE_INTERACTIVE = "INTERACTIVE"
+MODE_EXPORT = "EXPORT"
+
+JOURNAL_FILE = "spi-journal.sqlite"
+BOOKMARKS_SNAPSHOT_FILE = "spi-bookmarks.json"
+PLACES_CACHE_FILE = "spi-places-cache.sqlite"
+REVIEW_FILE = "spi-review.jsonl"
+
+# Places per second
+DEFAULT_MAX_RATE = 2.0
+
+# Metres within which a bookmark matches a feature when comparing
+DEFAULT_MATCH_DISTANCE = 50.0
+
+# Why adding a feature failed
+FAILURE_TIMEOUT = "timeout"
+FAILURE_MISSING_BUTTON = "missing_button"
+FAILURE_BUTTON_TEXT = "button_text"
+FAILURE_DISCONNECT = "disconnect"
+FAILURE_SERVER = "server_error"
+FAILURE_REFUSED = "refused"
+FAILURE_UNKNOWN = "unknown"
+# Failures which are likely transient, the feature is retried at the end of the import. An unknown
+# label of the save button (FAILURE_BUTTON_TEXT), e.g. of a localized UI, doesn't go away by retrying
+RETRYABLE_FAILURES = (
+    FAILURE_TIMEOUT, FAILURE_MISSING_BUTTON, FAILURE_DISCONNECT, FAILURE_SERVER, FAILURE_UNKNOWN,
+)
+
+# Number of times failed features are retried and the pause (in seconds) before the first retry
+DEFAULT_RETRIES = 2
+DEFAULT_RETRY_BACKOFF = 5.0
+
+# Places after which the browser tab is replaced and the memory (in MB) of Firefox beyond
+# which it's replaced early, see utils.watchdog, 0 disables either
+DEFAULT_RECYCLE_EVERY = 500
+DEFAULT_MEMORY_LIMIT = 2048
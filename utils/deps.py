@@ -0,0 +1,16 @@
+#!/usr/bin/env python2
+
+import importlib
+import sys
+
+
+def require(module, package=None):
+    """
+    Imports an optional dependency when it's first needed, so modes
+    which don't need it neither load it nor need it installed.
+    @return: The module
+    """
+    try:
+        return importlib.import_module(module)
+    except ImportError:
+        sys.exit("Please install '{0}', e.g. with 'pip install {0}'.".format(package or module))
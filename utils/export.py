@@ -0,0 +1,228 @@
+#!/usr/bin/env python2
+
+import csv
+import io
+import json
+import os
+import sys
+import time
+from xml.sax.saxutils import escape, quoteattr
+
+from utils.parse import GEO_JSON_URL_KEY
+from utils.places import url_coordinates
+from utils.constants import APP_NAME
+
+
+# Separator of the labels of a bookmark in a single text field
+LABEL_SEPARATOR = u", "
+
+# Columns of an exported CSV file, the import picks them by the same headers (see CSV_COLUMNS)
+CSV_HEADER = (u"Title", u"URL", u"Latitude", u"Longitude", u"Labels", u"Published")
+
+
+def _text(value):
+    """
+    @return: A field of a bookmark as text, None as empty text
+    """
+    if value is None:
+        return u""
+    if isinstance(value, bytes):
+        return value.decode("utf-8")
+    return value
+
+
+def published(bookmark):
+    """
+    @return: The time a bookmark was added as ISO 8601 (UTC), None if it's unknown
+    """
+    if not bookmark.timestamp:
+        return None
+    return time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(bookmark.timestamp / 1000000.0))
+
+
+class ExportWriter:
+    """
+    Writes bookmarks to an export file one by one, so memory usage doesn't depend on their number.
+    The file is written under a temporary name and only replaces the export file once it's
+    complete. Subclasses implement begin(), write_bookmark() and end() for their format.
+    """
+
+    def __init__(self, path):
+        """
+        Opens the temporary file, IOError is raised if that fails.
+        """
+        self.path = path
+        self.tmp_path = "{}.tmp".format(path)
+        self.f = open(self.tmp_path, "wb")
+        # Number of bookmarks written and skipped, the ones the format can't hold
+        self.exported = 0
+        self.skipped = 0
+        self.begin()
+
+    def begin(self):
+        """
+        Writes what precedes the first bookmark.
+        @return: -
+        """
+        pass
+
+    def write_bookmark(self, bookmark, coordinates):
+        """
+        Writes a bookmark with the coordinates of its URL, a tuple of latitude and longitude or None.
+        @return: Whether or not the bookmark was written
+        """
+        raise NotImplementedError()
+
+    def end(self):
+        """
+        Writes what follows the last bookmark.
+        @return: -
+        """
+        pass
+
+    def write(self, bookmark):
+        """
+        Writes a bookmark, see write_bookmark().
+        @return: -
+        """
+        if self.write_bookmark(bookmark, url_coordinates(bookmark.url) if bookmark.url else None):
+            self.exported += 1
+        else:
+            self.skipped += 1
+
+    def close(self):
+        """
+        Completes the export file and moves it into place.
+        @return: -
+        """
+        self.end()
+        self.f.close()
+        os.rename(self.tmp_path, self.path)
+
+    def abort(self):
+        """
+        Drops the incomplete export file, an existing one is kept.
+        @return: -
+        """
+        self.f.close()
+        os.remove(self.tmp_path)
+
+
+class GeoJsonWriter(ExportWriter):
+    """
+    Writes a feature collection like the saved places of Google Takeout, the labels
+    are kept in the 'Labels' property. Bookmarks without coordinates get the
+    coordinates [0, 0] like in Google Takeout, which the import ignores.
+    """
+
+    def begin(self):
+        self.f.write(b'{\n  "type": "FeatureCollection",\n  "features": [')
+
+    def write_bookmark(self, bookmark, coordinates):
+        lat, lon = coordinates or (0, 0)
+        properties = {
+            GEO_JSON_URL_KEY: _text(bookmark.url),
+            "Title": _text(bookmark.title),
+            "Labels": [_text(label) for label in bookmark.labels],
+        }
+        if bookmark.timestamp:
+            properties["Published"] = published(bookmark)
+        feature = {
+            "geometry": {"coordinates": [lon, lat], "type": "Point"},
+            "properties": properties,
+            "type": "Feature",
+        }
+        separator = b",\n    " if self.exported > 0 else b"\n    "
+        # Non-ASCII characters are escaped, so the output is ASCII on Python 2 and 3
+        self.f.write(separator + json.dumps(feature, sort_keys=True).encode("ascii"))
+        return True
+
+    def end(self):
+        self.f.write(b"\n  ]\n}\n")
+
+
+class GpxWriter(ExportWriter):
+    """
+    Writes a GPX 1.1 waypoint per bookmark with its title as name, its URL as link and its
+    labels as type. A waypoint needs coordinates, so bookmarks without are skipped.
+    """
+
+    def begin(self):
+        self.f.write(u'<?xml version="1.0" encoding="UTF-8"?>\n<gpx version="1.1" creator={} '
+                     u'xmlns="http://www.topografix.com/GPX/1/1">\n'.format(quoteattr(APP_NAME)).encode("utf-8"))
+
+    def write_bookmark(self, bookmark, coordinates):
+        if coordinates is None:
+            return False
+        fields = []
+        if bookmark.timestamp:
+            fields.append(u"<time>{}</time>".format(published(bookmark)))
+        if bookmark.title:
+            fields.append(u"<name>{}</name>".format(escape(_text(bookmark.title))))
+        fields.append(u"<link href={}/>".format(quoteattr(_text(bookmark.url))))
+        if bookmark.labels:
+            fields.append(u"<type>{}</type>".format(escape(LABEL_SEPARATOR.join(_text(label) for label in bookmark.labels))))
+        self.f.write(u'  <wpt lat="{}" lon="{}">{}</wpt>\n'.format(
+            repr(coordinates[0]), repr(coordinates[1]), u"".join(fields)
+        ).encode("utf-8"))
+        return True
+
+    def end(self):
+        self.f.write(b"</gpx>\n")
+
+
+class CsvWriter(ExportWriter):
+    """
+    Writes a row per bookmark, see CSV_HEADER, the labels are joined into one cell.
+    """
+
+    def begin(self):
+        if sys.version_info[0] >= 3:
+            self.text = io.TextIOWrapper(self.f, encoding="utf-8", newline="")
+            self.rows = csv.writer(self.text)
+        else:
+            self.text = None
+            self.rows = csv.writer(self.f)
+        self.write_row(CSV_HEADER)
+
+    def write_row(self, cells):
+        """
+        Writes a row of text cells, on Python 2 the csv module only handles bytes.
+        @return: -
+        """
+        if self.text is None:
+            cells = [cell.encode("utf-8") for cell in cells]
+        self.rows.writerow(cells)
+
+    def write_bookmark(self, bookmark, coordinates):
+        lat, lon = (repr(coordinates[0]), repr(coordinates[1])) if coordinates else (u"", u"")
+        self.write_row((
+            _text(bookmark.title), _text(bookmark.url), _text(lat), _text(lon),
+            LABEL_SEPARATOR.join(_text(label) for label in bookmark.labels), published(bookmark) or u"",
+        ))
+        return True
+
+    def end(self):
+        if self.text is not None:
+            # Detached, so closing the writer closes the file once
+            self.text.flush()
+            self.text.detach()
+
+
+# Writers of the export formats by file suffix, the suffixes are the ones the import reads
+EXPORT_FORMATS = (
+    (".json", GeoJsonWriter),
+    (".gpx", GpxWriter),
+    (".csv", CsvWriter),
+)
+
+
+def export_format(path):
+    """
+    Picks the writer of an export file by its suffix, see EXPORT_FORMATS.
+    @return: The writer class or None if the format is unknown
+    """
+    for suffix, writer in EXPORT_FORMATS:
+        if path.lower().endswith(suffix):
+            return writer
+    return None
@@ -0,0 +1,172 @@
+#!/usr/bin/env python2
+
+import sys
+import threading
+from io import BytesIO
+
+try:
+    import requests
+    from requests.adapters import HTTPAdapter
+except ImportError:
+    sys.exit("Please install 'requests', e.g. with 'pip install requests'.")
+
+import xml.etree.ElementTree as ET
+
+from utils.backend import Backend
+from utils.bookmarks import iter_bookmarks_xml
+import utils.constants
+
+
+GOOGLE_URL = "https://www.google.com"
+BOOKMARKS_PATH = "/bookmarks/"
+# Adds (or updates) a bookmark, it expects the signature of the RSS output
+MARK_PATH = "/bookmarks/mark"
+# Timeout (in seconds) of a single request
+REQUEST_TIMEOUT = 30
+
+
+class HttpBackend(Backend):
+    """
+    The HTTP backend, it talks to the Google Bookmarks API directly instead of
+    rendering pages in Firefox. The session cookies are lifted from Firefox once,
+    afterwards every request goes over a pool of keep-alive connections which
+    is shared by the workers.
+    """
+
+    def __init__(self, logger, timing, cookies, user_agent=None, base_url=GOOGLE_URL, pool_size=1):
+        """
+        Initialise the backend with the cookies of a Google session, i.e. a list
+        of dictionaries with 'name' and 'value' as returned by Marionette.
+        """
+        self.logger = logger
+        self.timing = timing
+        self.base_url = base_url.rstrip("/")
+        self.session = requests.Session()
+        # One pool of connections, as many as there are workers
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        # The cookies are sent as they are, whichever domain Firefox stored them for
+        self.session.headers["Cookie"] = "; ".join(
+            "{}={}".format(cookie["name"], cookie["value"]) for cookie in cookies
+        )
+        if user_agent:
+            self.session.headers["User-Agent"] = user_agent
+        self.signature = None
+        self.lock = threading.Lock()
+        self.failure = threading.local()
+
+    def get(self, params):
+        """
+        Request the Google Bookmarks API.
+        @return: The body of the response
+        @raise IOError: If the request failed, e.g. because the session expired
+        """
+        try:
+            response = self.session.get(
+                self.base_url + BOOKMARKS_PATH, params=params, timeout=REQUEST_TIMEOUT, allow_redirects=False
+            )
+        except requests.RequestException as e:
+            raise IOError("Unable to request the Google Bookmarks API: {}".format(e))
+        if response.status_code != 200:
+            # A redirect leads to the login page
+            raise IOError("Unable to request the Google Bookmarks API: HTTP {}".format(response.status_code))
+        return response.content
+
+    def iter_bookmark_pages(self, page_size):
+        """
+        Page through the existing bookmarks of the Google Bookmarks API, newest first.
+        @return: Generator of pages, i.e. lists of bookmarks
+        """
+        start = 0
+        while True:
+            with self.timing.span("request"):
+                content = self.get({"output": "xml", "num": page_size, "start": start})
+            with self.timing.span("parse"):
+                page = list(iter_bookmarks_xml(BytesIO(content)))
+            yield page
+            if len(page) < page_size:
+                return
+            start += page_size
+
+    def get_signature(self, refresh=False):
+        """
+        Get the signature bookmarks are added with, it's part of the RSS output.
+        It's fetched once and shared by the workers.
+        @return: The signature
+        """
+        with self.lock:
+            if self.signature is None or refresh:
+                content = self.get({"output": "rss", "num": 1})
+                for elem in ET.fromstring(content).iter():
+                    if elem.tag.rsplit("}", 1)[-1] == "signature":
+                        self.signature = elem.text
+                        break
+                else:
+                    raise IOError("No signature in the Google Bookmarks API output found")
+            return self.signature
+
+    def mark(self, url, signature):
+        """
+        Add a bookmark.
+        @return: The response
+        """
+        return self.session.post(self.base_url + MARK_PATH, data={
+            "bkmk": url,
+            "title": url,
+            "labels": "",
+            "annotation": "",
+            "prev": "/lookup",
+            "sig": signature,
+        }, timeout=REQUEST_TIMEOUT, allow_redirects=False)
+
+    def add_feature(self, url):
+        """
+        Tries to add a feature (bookmark / place) to your Google Maps fav list.
+        @return:
+        - ADD_FEATURE_FAILURE if the API refused the bookmark
+        - ADD_FEATURE_SUCCESS if everything went fine
+        - ADD_FEATURE_UNKNOWN_ERROR if the request failed
+        """
+        with self.timing.span("add_feature"):
+            try:
+                with self.timing.span("save"):
+                    response = self.mark(url, self.get_signature())
+                    if response.status_code == 403:
+                        # The signature expired
+                        response = self.mark(url, self.get_signature(refresh=True))
+            except requests.Timeout as e:
+                self.logger.error(u" > [HTTP] {}".format(e))
+                return self.fail(utils.constants.FAILURE_TIMEOUT)
+            except (IOError, requests.RequestException) as e:
+                self.logger.error(u" > [HTTP] {}".format(e))
+                return self.fail(utils.constants.FAILURE_DISCONNECT)
+            if response.status_code != 200:
+                self.logger.error(u" > [HTTP] Saving failed with HTTP {}".format(response.status_code))
+                # Overload and server errors pass, anything else is a refusal
+                if response.status_code == 429 or response.status_code >= 500:
+                    return self.fail(utils.constants.FAILURE_SERVER, utils.constants.ADD_FEATURE_FAILURE)
+                return self.fail(utils.constants.FAILURE_REFUSED, utils.constants.ADD_FEATURE_FAILURE)
+            return utils.constants.ADD_FEATURE_SUCCESS
+
+    def add_feature_2(self, url, list_add):
+        """
+        Bookmarks are starred places, so this saves to LIST_STARRED_PLACES only.
+        @return: See add_feature()
+        """
+        return self.add_feature(url)
+
+    def reset(self):
+        """
+        Fetches a fresh signature with the next add.
+        @return: -
+        """
+        with self.lock:
+            self.signature = None
+
+    def close(self):
+        """
+        Close the pooled connections.
+        @return: -
+        """
+        self.session.close()
@@ -0,0 +1,115 @@
+#!/usr/bin/env python2
+
+import hashlib
+import sqlite3
+import threading
+import time
+
+import utils.constants
+
+
+# Outcomes which don't need to be repeated when resuming
+COMPLETED_RESULTS = (
+    utils.constants.ADD_FEATURE_SUCCESS,
+    utils.constants.ADD_FEATURE_ALREADY_ADDED,
+)
+
+
+def hash_file(import_file, chunk_size=64 * 1024):
+    """
+    Hashes the content of a file in chunks.
+    @return: SHA-1 hex digest of the file
+    """
+    sha1 = hashlib.sha1()
+    with open(import_file, "rb") as f:
+        while True:
+            chunk = f.read(chunk_size)
+            if not chunk:
+                return sha1.hexdigest()
+            sha1.update(chunk)
+
+
+def hash_files(import_files):
+    """
+    Hashes the content of several files, independent of their order.
+    @return: SHA-1 hex digest of the files, the one of the file itself for a single file
+    """
+    hashes = sorted(hash_file(import_file) for import_file in import_files)
+    if len(hashes) == 1:
+        return hashes[0]
+    return hashlib.sha1("".join(hashes).encode("ascii")).hexdigest()
+
+
+class Journal:
+    """
+    A persistent journal of the outcome of every feature, keyed by the
+    hash of the import files and the feature URL. It allows an interrupted
+    batch run to be resumed where it stopped.
+    """
+
+    def __init__(self, path, import_files):
+        """
+        Open (or create) the journal at the passed path for the passed import files.
+        """
+        self.path = path
+        self.file_hash = hash_files(import_files)
+        # Workers record from their own threads, so access is serialised
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS journal ("
+            "file_hash TEXT NOT NULL, "
+            "url TEXT NOT NULL, "
+            "result INTEGER NOT NULL, "
+            "updated REAL NOT NULL, "
+            "PRIMARY KEY (file_hash, url))"
+        )
+        self.connection.commit()
+
+    def record(self, url, result):
+        """
+        Record the outcome of a feature, it's committed right away so
+        nothing is lost if the run crashes or is interrupted.
+        @return: -
+        """
+        with self.lock:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO journal (file_hash, url, result, updated) VALUES (?, ?, ?, ?)",
+                (self.file_hash, url, result, time.time())
+            )
+            self.connection.commit()
+
+    def is_completed(self, url):
+        """
+        Check if a feature was already handled successfully in a previous run.
+        @return: Whether or not the feature can be skipped
+        """
+        with self.lock:
+            row = self.connection.execute(
+                "SELECT result FROM journal WHERE file_hash = ? AND url = ?",
+                (self.file_hash, url)
+            ).fetchone()
+        return row is not None and row[0] in COMPLETED_RESULTS
+
+    def count_completed(self):
+        """
+        Count the features of the import files which were already handled successfully.
+        @return: Number of completed features
+        """
+        with self.lock:
+            return self.connection.execute(
+                "SELECT COUNT(*) FROM journal WHERE file_hash = ? AND result IN ({})".format(
+                    ", ".join("?" * len(COMPLETED_RESULTS))
+                ),
+                (self.file_hash,) + COMPLETED_RESULTS
+            ).fetchone()[0]
+
+    def close(self):
+        """
+        Close the journal.
+        @return: -
+        """
+        with self.lock:
+            self.connection.close()
@@ -0,0 +1,72 @@
+#!/usr/bin/env python2
+
+import sys
+
+if sys.version_info[0] < 3:
+    from urllib import quote
+else:
+    from urllib.parse import quote
+
+
+# Hosts serving what saving a place doesn't need: photos, Street View, fonts, telemetry and ads
+BLOCKED_HOSTS = [
+    "*.googleusercontent.com",
+    "*.ggpht.com",
+    "streetviewpixels-pa.googleapis.com",
+    "khms*.google.com",
+    "fonts.gstatic.com",
+    "fonts.googleapis.com",
+    "csi.gstatic.com",
+    "play.google.com",
+    "www.google-analytics.com",
+    "*.doubleclick.net",
+]
+
+# Requests to blocked hosts are sent to a proxy which doesn't exist, so they fail right away
+BLACKHOLE_PROXY = "PROXY 127.0.0.1:9"
+
+PAC_SCRIPT = """function FindProxyForURL(url, host) {{
+  var blocked = {hosts};
+  for (var i = 0; i < blocked.length; i++) {{
+    if (shExpMatch(host, blocked[i])) {{
+      return "{proxy}";
+    }}
+  }}
+  return "DIRECT";
+}}"""
+
+
+def pac_url(hosts=BLOCKED_HOSTS):
+    """
+    Builds a proxy auto-config script which blocks the passed hosts, as data URL.
+    @return: The URL
+    """
+    script = PAC_SCRIPT.format(hosts="[{}]".format(", ".join('"{}"'.format(host) for host in hosts)), proxy=BLACKHOLE_PROXY)
+    return "data:application/x-ns-proxy-autoconfig," + quote(script)
+
+
+# Preferences of a lean session: no images, fonts, WebGL (Google Maps falls back to
+# the lite mode), media, prefetching or telemetry, and the blocked hosts above
+LEAN_PREFS = {
+    "permissions.default.image": 2,
+    "gfx.downloadable_fonts.enabled": False,
+    "browser.display.use_document_fonts": 0,
+    "webgl.disabled": True,
+    "media.autoplay.default": 5,
+    "media.video_stats.enabled": False,
+    "network.prefetch-next": False,
+    "network.dns.disablePrefetch": True,
+    "network.http.speculative-parallel-limit": 0,
+    "toolkit.telemetry.enabled": False,
+    "datareporting.healthreport.uploadEnabled": False,
+    "datareporting.policy.dataSubmissionEnabled": False,
+    "network.proxy.type": 2,
+    "network.proxy.autoconfig_url": pac_url(),
+}
+
+# Bytes transferred for the current page so far, the document and every resource
+# it loaded (Resource Timing API, cached resources count as 0)
+PAGE_WEIGHT_SCRIPT = """
+let entries = performance.getEntriesByType("navigation").concat(performance.getEntriesByType("resource"));
+return entries.reduce((total, entry) => total + (entry.transferSize || 0), 0);
+"""
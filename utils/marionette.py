@@ -1,76 +1,551 @@
 #!/usr/bin/env python2
 
+import socket
 import sys
+import threading
+import time
+from collections import deque
 
 try:
     from marionette_driver.marionette import Marionette
-    from marionette_driver import By, Wait, expected
-    from marionette_driver.errors import NoSuchElementException, TimeoutException
+    from marionette_driver import By
+    from marionette_driver.errors import NoSuchElementException, MarionetteException, JavascriptException, \
+        TimeoutException, ScriptTimeoutException
 except ImportError:
     sys.exit("Please install 'marionette_driver', e.g. with 'pip install marionette_driver'.")
 
-from xml.etree.cElementTree import XML
+from io import BytesIO
 
+from utils.backend import Backend
+from utils.bookmarks import iter_bookmarks_xml
+from utils.lean import LEAN_PREFS, PAGE_WEIGHT_SCRIPT
 from utils.net import check_socket
+from utils.places import place_key
+from utils.waits import WaitEngine, condition
+from utils.watchdog import RECYCLE_MEMORY
 import utils.constants
+from utils.constants import MARIONETTE_HOST, MARIONETTE_PORT
 
 
-MARIONETTE_HOST = "localhost"
-MARIONETTE_PORT = 2828
+BOOKMARKS_URL = "https://www.google.com/bookmarks/?output=xml&num={}&start={}"
 
+SAVE_BUTTON_SELECTOR = ".section-entity-action-save-button"
+# Matches only elements of the place shown last, see IN_APP_SCRIPT
+FRESH = ":not([data-spi-stale])"
+# Default timeouts (in seconds), they adapt to the observed latencies during a run
+SAVE_BUTTON_TIMEOUT = 10
+SAVED_TIMEOUT = 6
+ACTION_MENU_TIMEOUT = 5
+# Time (in seconds) a prefetched page may take until its document replaced the previous one
+PREFETCH_TIMEOUT = 10
+PREFETCH_POLL_INTERVAL = 0.05
+# Time (in seconds) the running app may take to show another place before it's navigated to
+IN_APP_TIMEOUT = 5
 
-class MarionetteHelper:
+# Starts loading a page without waiting for it. The current document is marked,
+# so it can be told apart from the new one until that replaced it.
+PREFETCH_SCRIPT = """
+document.documentElement.setAttribute("data-spi-stale", "1");
+window.location.href = arguments[0];
+"""
+USER_AGENT_SCRIPT = "return navigator.userAgent;"
+# Elements of a place page the add paths interact with
+PLACE_SELECTORS = [SAVE_BUTTON_SELECTOR, "[data-value='Save']", "[data-value='Saved']", "#action-menu [data-index]"]
+# Moves the running Google Maps app to another place without reloading it: the URL is
+# pushed to the history and the app's router reacts to the popstate event like it does
+# on "Back". The elements of the current place are marked, so they can be told apart
+# from the ones of the next place. Legacy URLs, e.g. 'maps.google.com/?cid=...', are
+# served by '/maps' of the app. Returns false if no app is loaded.
+IN_APP_SCRIPT = """
+if (location.pathname.indexOf("/maps") !== 0) {
+  return false;
+}
+let target = new URL(arguments[0]);
+let path = target.pathname;
+if (target.hostname.indexOf("maps.") === 0) {
+  path = "/maps" + (path === "/" ? "" : path);
+}
+for (let element of document.querySelectorAll(arguments[1].join(","))) {
+  element.setAttribute("data-spi-stale", "1");
+}
+try {
+  history.pushState(null, "", path + target.search + target.hash);
+} catch (e) {
+  return false;
+}
+window.dispatchEvent(new PopStateEvent("popstate", {state: null}));
+return true;
+"""
+LOCATION_SCRIPT = "return location.href;"
+READY_STATE_SCRIPT = "return document.readyState;"
+BLANK_URL = "about:blank"
+# A place page loaded to measure the weight of a page without the lean preferences
+LEAN_SAMPLE_URL = "https://www.google.com/maps/search/?api=1&query=Brandenburg+Gate"
+# Whether or not the document of a prefetched page replaced the previous one
+LOADED_SCRIPT = """
+return document.documentElement !== null && !document.documentElement.hasAttribute("data-spi-stale");
+"""
+# Resident memory (in bytes) of Firefox, i.e. the main and all content processes, it runs
+# in the chrome context. Older versions without process info only report the main process.
+MEMORY_SCRIPT = """
+let resolve = arguments[arguments.length - 1];
+let manager = Components.classes["@mozilla.org/memory-reporter-manager;1"]
+  .getService(Components.interfaces.nsIMemoryReporterManager);
+if (typeof ChromeUtils.requestProcInfo !== "function") {
+  resolve(manager.resident);
+} else {
+  ChromeUtils.requestProcInfo().then(
+    info => resolve(info.children.reduce((total, child) => total + (child.memory || 0), info.memory || manager.resident)),
+    () => resolve(manager.resident)
+  );
+}
+"""
+# Frees what Firefox can, like "Minimize memory usage" in 'about:memory', it runs in the chrome context
+MINIMIZE_MEMORY_SCRIPT = """
+let resolve = arguments[arguments.length - 1];
+Components.classes["@mozilla.org/memory-reporter-manager;1"]
+  .getService(Components.interfaces.nsIMemoryReporterManager)
+  .minimizeMemoryUsage(() => resolve(true));
+"""
+# Time (in seconds) Firefox may take to listen again once the connection dropped
+RECONNECT_TIMEOUT = 30
+RECONNECT_INTERVAL = 1
 
-    def __init__(self, logger, success_symbol, failure_symbol):
+
+class MarionetteHelper(Backend):
+    """
+    The browser backend, it drives Firefox via Marionette and saves
+    places by clicking through the Google Maps place pages.
+    """
+
+    def __init__(self, logger, success_symbol, failure_symbol, timing, host=MARIONETTE_HOST, port=MARIONETTE_PORT):
         """
-        Initialise the helper class.
+        Initialise the helper class, the timing instance records the phases of every action.
         """
         self.client = None
+        self.timing = timing
+        # Tabs are only used when pipelining: the free ones, the ones
+        # loading a page ahead by URL and the one currently in use
+        self.free_tabs = None
+        self.prefetched = {}
+        self.current_tab = None
+        # Values of the preferences the lean mode changed, to restore them afterwards
+        self.lean_restore = None
+        # Whether or not places are shown in the running app instead of loading their pages
+        self.in_app = False
+        # The watchdog telling when the tab is due to be replaced, None disables recycling
+        self.watchdog = None
+        # Whether or not the connection is up, after it dropped it's restored on the next action
+        self.connected = False
+        self.reconnects = 0
+        self.waits = None
+        self.failure = threading.local()
+        self.host = host
+        self.port = port
         self.logger = logger
         self.success_symbol = success_symbol
         self.failure_symbol = failure_symbol
 
-    def init_ff(self):
+    def connect(self):
         """
-        Initialises the connection to Firefox and starts a session.
-        @return: -
+        Connects to Firefox, the benchmarks override this with a stand-in.
+        @return: The Marionette client
         """
-        if not check_socket(MARIONETTE_HOST, MARIONETTE_PORT):
+        if not self.reachable():
             self.logger.error(
                 u" > [ERROR] Please check if you started Firefox with the '-marionette' "
-                "option or set 'marionette.enabled' to 'true' in 'about:config'. {}".format(self.failure_symbol)
+                "option or set 'marionette.enabled' to 'true' in 'about:config' (port {}). {}".format(
+                    self.port, self.failure_symbol
+                )
             )
             sys.exit(1)
-        self.client = Marionette(host=MARIONETTE_HOST, port=MARIONETTE_PORT)
+        return Marionette(host=self.host, port=self.port)
+
+    def reachable(self):
+        """
+        @return: Whether or not Marionette listens at the host and port
+        """
+        return check_socket(self.host, self.port)
+
+    def init_ff(self):
+        """
+        Initialises the connection to Firefox and starts a session.
+        @return: -
+        """
+        self.client = self.connect()
         self.client.start_session()
+        self.waits = WaitEngine(self.client, self.logger)
+        self.connected = True
 
-    def get_existing_bookmarks(self):
+    def reconnect(self, timeout=RECONNECT_TIMEOUT):
+        """
+        Connects to Firefox again after the connection dropped, e.g. because Firefox was
+        restarted, and starts a new session. Marionette may take up to the timeout to listen
+        again. The tabs which didn't survive are opened anew and the lean preferences set again.
+        @return: Whether or not it reconnected
         """
-        Get the existing bookmarks from the Google Bookmarks API.
+        end = time.time() + timeout
+        with self.timing.span("reconnect"):
+            while not self.reachable():
+                if time.time() >= end:
+                    self.logger.error(u" > [WATCHDOG] Firefox (port {}) is unreachable {}".format(
+                        self.port, self.failure_symbol
+                    ))
+                    return False
+                time.sleep(RECONNECT_INTERVAL)
+            try:
+                self.client.delete_session(send_request=False)
+            except (MarionetteException, socket.error, IOError):
+                pass
+            try:
+                self.client = self.connect()
+                self.client.start_session()
+                self.waits = WaitEngine(self.client, self.logger)
+                if self.free_tabs is not None:
+                    self.restore_tabs()
+                if self.lean_restore is not None:
+                    self.client.set_prefs(LEAN_PREFS)
+            except (MarionetteException, socket.error, IOError) as e:
+                self.logger.error(u" > [WATCHDOG] Reconnecting to Firefox (port {}) failed: {} {}".format(
+                    self.port, e, self.failure_symbol
+                ))
+                return False
+        self.reconnects += 1
+        self.logger.info(u" > [WATCHDOG] Reconnected to Firefox (port {}) {}".format(self.port, self.success_symbol))
+        return True
+
+    def ensure_connected(self):
+        """
+        Tries to reconnect, without waiting, if the connection couldn't be restored before.
+        @return: Whether or not Firefox is connected
+        """
+        if not self.connected:
+            self.connected = self.reconnect(timeout=0)
+        return self.connected
+
+    def iter_bookmark_pages(self, page_size):
+        """
+        Page through the existing bookmarks of the Google Bookmarks API, newest first.
         We need to do this in Firefox to have the cookie set which authorities us with the API.
+        @return: Generator of pages, i.e. lists of bookmarks
+        """
+        start = 0
+        while True:
+            with self.timing.span("navigate"):
+                self.client.navigate(BOOKMARKS_URL.format(page_size, start))
+            with self.timing.span("parse"):
+                page = list(iter_bookmarks_xml(BytesIO(self.client.page_source.encode("utf-8"))))
+            yield page
+            if len(page) < page_size:
+                return
+            start += page_size
+
+    def get_session_cookies(self):
+        """
+        Lifts the cookies of the Google session from Firefox, so the
+        Google Bookmarks API can be requested without it.
+        @return: Tuple of the list of cookies and the user agent
+        """
+        self.client.navigate(BOOKMARKS_URL.format(1, 0))
+        return self.client.get_cookies(), self.client.execute_script(USER_AGENT_SCRIPT)
+
+    def enable_lean(self):
+        """
+        Sets the preferences of a lean session, i.e. images, fonts and other resources which
+        aren't needed to save a place aren't loaded. The previous values are kept.
         @return: -
         """
-        self.client.navigate("https://www.google.com/bookmarks/?output=xml&num=10000")
-        # Initialise XML object
-        root = XML(self.client.page_source.encode("utf-8"))
-        # Return set of bookmarks
-        return set([bookmark[1].text for bookmark in root[0]])
+        if self.lean_restore is None:
+            self.lean_restore = dict((pref, self.client.get_pref(pref)) for pref in LEAN_PREFS)
+        self.client.set_prefs(LEAN_PREFS)
 
-    def save_button_contains_correct_text_save(self, *args):
+    def disable_lean(self):
         """
-        Helper method for Marionette, here: check if fav button contains text "SAVE"
-        @return: Whether or not the fav button contains the text "SAVE"
+        Restores the preferences the lean mode changed, they are stored in the profile.
+        @return: -
         """
-        save_button = self.client.find_element(By.CLASS_NAME, "section-entity-action-save-button")
-        return save_button.text == "SAVE"
+        if self.lean_restore is None:
+            return
+        for pref, value in self.lean_restore.items():
+            if value is None:
+                self.client.clear_pref(pref)
+            else:
+                self.client.set_pref(pref, value)
+        self.lean_restore = None
 
-    def save_button_contains_correct_text_saved(self, *args):
+    def page_weight(self):
         """
-        Helper method for Marionette, here: check if fav button contains text "SAVED"
-        @return: Whether or not the fav button contains the text "SAVED"
+        Measures the bytes transferred for the current page, see PAGE_WEIGHT_SCRIPT.
+        @return: Number of bytes or None if they couldn't be measured
         """
-        save_button = self.client.find_element(By.CLASS_NAME, "section-entity-action-save-button")
-        return save_button.text == "SAVED"
+        try:
+            return self.client.execute_script(PAGE_WEIGHT_SCRIPT)
+        except JavascriptException:
+            return None
+
+    def record_page_weight(self):
+        """
+        Records the weight of the current page if the lean mode is enabled.
+        @return: -
+        """
+        if self.lean_restore is not None:
+            weight = self.page_weight()
+            if weight is not None:
+                self.timing.record_size("page_bytes", weight)
+
+    def sample_page_weight(self, url=LEAN_SAMPLE_URL):
+        """
+        Measures the weight of a place page as it's loaded during an import, i.e. it's loaded
+        twice and the second, cached, load is measured once the save button showed up.
+        @return: Number of bytes or None if they couldn't be measured
+        """
+        for _ in range(2):
+            self.client.navigate(url)
+            self.waits.until("sample", [
+                condition(SAVE_BUTTON_SELECTOR, visible=True),
+                condition("[data-value='Save']", visible=True),
+                condition("[data-value='Saved']"),
+            ], SAVE_BUTTON_TIMEOUT)
+        return self.page_weight()
+
+    def init_tabs(self, count):
+        """
+        Opens tabs, so the pages of the next features can be loaded
+        in the background while the current one is being saved.
+        @return: -
+        """
+        self.free_tabs = deque([self.client.current_window_handle])
+        for _ in range(count - 1):
+            self.free_tabs.append(self.client.open(type="tab", focus=False)["handle"])
+        self.prefetched = {}
+
+    def restore_tabs(self):
+        """
+        Takes over the tabs which survived a reconnect and opens the missing ones,
+        the pages which were loading ahead are dropped.
+        @return: -
+        """
+        tabs = list(self.free_tabs) + list(self.prefetched.values())
+        if self.current_tab is not None:
+            tabs.append(self.current_tab)
+        handles = set(self.client.window_handles)
+        self.free_tabs = deque(handle for handle in tabs if handle in handles)
+        self.prefetched = {}
+        self.current_tab = None
+        if not self.free_tabs:
+            self.free_tabs.append(self.client.current_window_handle)
+        self.client.switch_to_window(self.free_tabs[0])
+        for _ in range(len(tabs) - len(self.free_tabs)):
+            self.free_tabs.append(self.client.open(type="tab", focus=False)["handle"])
+
+    def replace_tab(self, handle):
+        """
+        Opens a new tab in place of the passed one, which is closed.
+        @return: The handle of the new tab
+        """
+        self.client.switch_to_window(handle, focus=False)
+        new_handle = self.client.open(type="tab", focus=False)["handle"]
+        self.client.close()
+        self.client.switch_to_window(new_handle, focus=False)
+        return new_handle
+
+    def recycle(self, reason):
+        """
+        Replaces the tab with a new one, which drops whatever the pages it showed left behind, with
+        prefetching every tab, the pages loading ahead are loaded again. If the memory crossed the
+        limit, Firefox frees what it can as well. Marionette can't restart a Firefox it didn't
+        start itself, a new tab is as fresh as it gets.
+        @return: -
+        """
+        with self.timing.span("recycle"):
+            if self.free_tabs is None:
+                self.replace_tab(self.client.current_window_handle)
+            else:
+                tabs = list(self.free_tabs) + list(self.prefetched.values())
+                self.prefetched = {}
+                self.free_tabs = deque(self.replace_tab(handle) for handle in tabs)
+            if reason == RECYCLE_MEMORY:
+                self.minimize_memory()
+        self.logger.info(u" > [WATCHDOG] Recycled the tab after {} places ({}) {}".format(
+            self.watchdog.places, reason, self.success_symbol
+        ))
+
+    def memory_usage(self):
+        """
+        Measures the memory of Firefox, see MEMORY_SCRIPT. That needs the chrome context,
+        which recent versions only allow with the '--remote-allow-system-access' option,
+        without it the memory isn't measured any more.
+        @return: Memory in MB or None if it couldn't be measured
+        """
+        try:
+            with self.client.using_context(self.client.CONTEXT_CHROME):
+                memory = self.client.execute_async_script(MEMORY_SCRIPT)
+        except MarionetteException as e:
+            self.logger.info(u" > [WATCHDOG] Unable to measure the memory of Firefox, it's ignored: {}".format(e))
+            self.watchdog.memory_limit = 0
+            return None
+        return memory / (1024.0 * 1024.0) if memory else None
+
+    def minimize_memory(self):
+        """
+        Lets Firefox free what it can, see MINIMIZE_MEMORY_SCRIPT.
+        @return: -
+        """
+        try:
+            with self.client.using_context(self.client.CONTEXT_CHROME):
+                self.client.execute_async_script(MINIMIZE_MEMORY_SCRIPT)
+        except MarionetteException as e:
+            self.logger.debug(u" > [WATCHDOG] Unable to minimize the memory of Firefox: {}".format(e))
+
+    def check_health(self, result, latency):
+        """
+        Counts the place for the watchdog and replaces the tab if it's due. A connection
+        which dropped meanwhile is restored.
+        @return: -
+        """
+        if self.watchdog is None or not self.connected:
+            return
+        self.watchdog.record(latency if result == utils.constants.ADD_FEATURE_SUCCESS else None)
+        try:
+            memory = self.memory_usage() if self.watchdog.needs_memory() else None
+            reason = self.watchdog.check(memory)
+            if reason is None:
+                return
+            try:
+                self.recycle(reason)
+            finally:
+                self.watchdog.recycled(reason)
+        except (socket.error, IOError):
+            self.connected = self.reconnect()
+        except MarionetteException as e:
+            self.logger.error(u" > [WATCHDOG] Recycling the tab failed: {} {}".format(e, self.failure_symbol))
+
+    def prefetch(self, url):
+        """
+        Starts loading the page of the URL in a free background tab.
+        @return: Whether or not a free tab was available
+        """
+        if self.free_tabs is None or url in self.prefetched:
+            return url in self.prefetched
+        if not self.free_tabs:
+            return False
+        handle = self.free_tabs.popleft()
+        with self.timing.span("prefetch"):
+            self.client.switch_to_window(handle, focus=False)
+            self.client.execute_script(PREFETCH_SCRIPT, script_args=[url])
+        self.prefetched[url] = handle
+        return True
+
+    def discard_prefetch(self, url):
+        """
+        Frees the tab of a prefetched page which won't be used, e.g. because
+        the feature turned out to be already added.
+        @return: -
+        """
+        handle = self.prefetched.pop(url, None)
+        if handle is not None:
+            self.free_tabs.append(handle)
+
+    def release_tab(self):
+        """
+        Frees the tab currently in use, so it can load the next page.
+        @return: -
+        """
+        if self.current_tab is not None:
+            self.free_tabs.append(self.current_tab)
+            self.current_tab = None
+
+    def wait_until_loaded(self, timeout):
+        """
+        Waits until the document of a prefetched page replaced the previous one.
+        @return: Whether or not it did within the timeout
+        """
+        end = time.time() + timeout
+        while time.time() < end:
+            try:
+                if self.client.execute_script(LOADED_SCRIPT):
+                    return True
+            except MarionetteException:
+                # The document was replaced while the script ran
+                pass
+            time.sleep(PREFETCH_POLL_INTERVAL)
+        return False
+
+    def is_expected_place(self, url, previous):
+        """
+        Checks if the app shows the place of the URL. Google Maps rewrites the URL of the place
+        it shows to one with its feature ID, i.e. its CID. That's compared to URLs with a CID,
+        for others (e.g. place IDs) the app has to have moved on from the previous place.
+        Until the URL was rewritten the place can't be verified.
+        @return: Whether or not the place is shown
+        """
+        shown = place_key(self.client.execute_script(LOCATION_SCRIPT))
+        if not shown.startswith("cid:"):
+            return False
+        expected = place_key(url)
+        if expected.startswith("cid:"):
+            return expected == shown
+        return shown != previous
+
+    def navigate_in_app(self, url, ready):
+        """
+        Shows the place of the URL in the running app, see IN_APP_SCRIPT. It reached
+        the place once one of the ready conditions is met by an element of the new place.
+        @return: Whether or not the app reached the place
+        """
+        with self.timing.span("navigate_in_app"):
+            try:
+                previous = place_key(self.client.execute_script(LOCATION_SCRIPT))
+                if not self.client.execute_script(IN_APP_SCRIPT, script_args=[url, PLACE_SELECTORS]):
+                    return False
+            except JavascriptException:
+                return False
+            if self.waits.until("in_app", ready, IN_APP_TIMEOUT) is None:
+                self.logger.debug(u" > Showing '{}' in the app timed out, navigating".format(url))
+                return False
+            if not self.is_expected_place(url, previous):
+                self.logger.debug(u" > The app didn't show '{}', navigating".format(url))
+                return False
+            return True
+
+    def show(self, url, ready=None):
+        """
+        Shows the page of the URL. Without tabs it's shown in the running app if the in-app
+        mode is enabled (the ready conditions tell when it's shown) or simply navigated to,
+        otherwise the tab it was prefetched in is used or, if it wasn't, a free one.
+        @return: -
+        """
+        if self.free_tabs is None:
+            if self.in_app and ready is not None and self.navigate_in_app(url, ready):
+                return
+            with self.timing.span("navigate"):
+                self.client.navigate(url)
+            return
+        handle = self.prefetched.pop(url, None)
+        if handle is not None:
+            self.current_tab = handle
+            with self.timing.span("wait_prefetched"):
+                self.client.switch_to_window(handle)
+                if self.wait_until_loaded(PREFETCH_TIMEOUT):
+                    return
+            self.logger.debug(u" > Prefetching '{}' timed out, navigating".format(url))
+        else:
+            self.take_tab()
+        with self.timing.span("navigate"):
+            self.client.navigate(url)
+
+    def take_tab(self):
+        """
+        Switches to a free tab, it's in use until release_tab().
+        @return: -
+        """
+        if self.free_tabs:
+            handle = self.free_tabs.popleft()
+        else:
+            # Every tab is loading ahead, take over one of them
+            handle = self.prefetched.popitem()[1]
+        self.current_tab = handle
+        self.client.switch_to_window(handle)
 
     def interactive_add_feature(self, coordinates):
         """
@@ -79,54 +554,120 @@ class MarionetteHelper:
         """
         url = "https://www.google.com/maps/search/?api=1&query={},{}"
 
-        # This navigates Firefox to the passed URL
-        self.client.navigate(url.format(coordinates[0], coordinates[1]))
+        # The tabs may be loading the next places, so the waypoint gets its own
+        if self.free_tabs is not None:
+            self.take_tab()
+        try:
+            # This navigates Firefox to the passed URL
+            self.client.navigate(url.format(coordinates[0], coordinates[1]))
+
+            # Wait for input
+            if sys.version_info[0] < 3:
+                raw_input("Press Enter to continue...")
+            else:
+                input("Press Enter to continue...")
+        finally:
+            self.release_tab()
 
-        # Wait for input
-        if sys.version_info[0] < 3:
-            raw_input("Press Enter to continue...")
+    def fail_with(self, url, e):
+        """
+        Classifies an error of Marionette or its connection raised while adding
+        a feature, so it doesn't end the import.
+        @return: ADD_FEATURE_UNKNOWN_ERROR
+        """
+        if isinstance(e, NoSuchElementException):
+            reason = utils.constants.FAILURE_MISSING_BUTTON
+        elif isinstance(e, (TimeoutException, ScriptTimeoutException)):
+            reason = utils.constants.FAILURE_TIMEOUT
+        elif isinstance(e, (socket.error, IOError)):
+            reason = utils.constants.FAILURE_DISCONNECT
         else:
-            input("Press Enter to continue...")
+            reason = utils.constants.FAILURE_UNKNOWN
+        self.logger.error(u" > [ERROR] Feature: '{}' {}".format(url, e))
+        if reason == utils.constants.FAILURE_DISCONNECT:
+            # The feature is retried once the connection is up again
+            self.connected = self.reconnect()
+        return self.fail(reason)
 
-    def add_feature_2(self, url, list_add):
+    def fail_waiting(self):
         """
-        Tries to add a feature (bookmark / place) to your Google Maps fav list.
+        Classifies a wait for the save button which timed out: the page may still be
+        loading or it loaded but the button isn't there.
+        @return: ADD_FEATURE_UNKNOWN_ERROR
+        """
+        if self.client.execute_script(READY_STATE_SCRIPT) != "complete":
+            return self.fail(utils.constants.FAILURE_TIMEOUT)
+        return self.fail(utils.constants.FAILURE_MISSING_BUTTON)
+
+    def reset(self):
+        """
+        Leaves the current page, so retried features start from a fresh page
+        and the running app is loaded again.
         @return: -
         """
-        self.client.navigate(url)
+        if not self.ensure_connected():
+            return
         try:
-            saved_button = Wait(self.client, timeout=1).until(
-                expected.element_present(By.CSS_SELECTOR, "[data-value='Saved']")
-            )
+            self.client.navigate(BLANK_URL)
+        except (socket.error, IOError):
+            self.connected = self.reconnect()
+
+    def add_feature_2(self, url, list_add):
+        """
+        Tries to add a feature (bookmark / place) to your Google Maps fav list.
+        @return:
+        - ADD_FEATURE_ALREADY_ADDED if the feature was already saved
+        - ADD_FEATURE_SUCCESS if everything went fine
+        - ADD_FEATURE_UNKNOWN_ERROR if we don't know what happened
+        """
+        with self.timing.span("add_feature_2"):
+            if not self.ensure_connected():
+                return self.fail(utils.constants.FAILURE_DISCONNECT)
+            try:
+                return self._add_feature_2(url, list_add)
+            except (MarionetteException, socket.error, IOError) as e:
+                return self.fail_with(url, e)
+            finally:
+                self.release_tab()
+
+    def _add_feature_2(self, url, list_add):
+        """
+        See add_feature_2().
+        @return: The ADD_FEATURE_* result
+        """
+        # Wait for whichever shows up first, the "Saved" marker or the save button
+        ready = [
+            condition("[data-value='Saved']" + FRESH),
+            condition("[data-value='Save']" + FRESH, visible=True),
+        ]
+        self.show(url, ready)
+        with self.timing.span("wait_save_button"):
+            result = self.waits.until("save_button_2", ready, SAVE_BUTTON_TIMEOUT)
+        if result is None:
+            self.logger.error(" > Unable to find save button")
+            return self.fail_waiting()
+        self.record_page_weight()
+        if result[0] == 0:
             self.logger.info(" > Feature was already saved")
             return utils.constants.ADD_FEATURE_ALREADY_ADDED
-        except TimeoutException:
-            pass
-        try:
-            save_button = Wait(self.client, timeout=5).until(
-                expected.element_present(By.CSS_SELECTOR, "[data-value='Save']")
-            )
-            Wait(self.client, timeout=5).until(
-                expected.element_displayed(save_button)
-            )
-        except TimeoutException:
-            self.logger.error(" > Unable to find save button")
-            return utils.constants.ADD_FEATURE_UNKNOWN_ERROR
-        save_button.click()
+        with self.timing.span("click_save"):
+            self.client.find_element(By.CSS_SELECTOR, "[data-value='Save']" + FRESH).click()
+
         if list_add == utils.constants.LIST_STARRED_PLACES:
             data_index = 2
         elif list_add == utils.constants.LIST_WANT_TO_GO:
             data_index = 1
         else:
             data_index = -1
-        css_selector = "#action-menu [data-index='{}']".format(data_index)
-        sub_save_item = Wait(self.client, timeout=5).until(
-            expected.element_present(By.CSS_SELECTOR, css_selector)
-        )
-        Wait(self.client, timeout=5).until(
-            expected.element_displayed(sub_save_item)
-        )
-        sub_save_item.click()
+        css_selector = "#action-menu [data-index='{}']{}".format(data_index, FRESH)
+        with self.timing.span("wait_action_menu"):
+            result = self.waits.until("action_menu", [condition(css_selector, visible=True)], ACTION_MENU_TIMEOUT)
+        if result is None:
+            self.logger.error(" > Unable to find list in save menu")
+            return self.fail(utils.constants.FAILURE_TIMEOUT)
+        with self.timing.span("click_list"):
+            self.client.find_element(By.CSS_SELECTOR, css_selector).click()
+        return utils.constants.ADD_FEATURE_SUCCESS
 
     def add_feature(self, url):
         """
@@ -136,44 +677,66 @@ class MarionetteHelper:
         - ADD_FEATURE_SUCCESS if everything went fine
         - ADD_FEATURE_UNKNOWN_ERROR if we don't know what happened
         """
+        with self.timing.span("add_feature"):
+            if not self.ensure_connected():
+                return self.fail(utils.constants.FAILURE_DISCONNECT)
+            try:
+                return self._add_feature(url)
+            except (MarionetteException, socket.error, IOError) as e:
+                return self.fail_with(url, e)
+            finally:
+                self.release_tab()
 
-        # This navigates Firefox to the passed URL
-        self.client.navigate(url)
-
-        # We wait for the fav button to be present...
-        save_button = Wait(self.client, timeout=10).until(expected.element_present(By.CLASS_NAME, "section-entity-action-save-button"))
+    def _add_feature(self, url):
+        """
+        See add_feature().
+        @return: The ADD_FEATURE_* result
+        """
 
-        # ... and to be displayed
-        displayed = Wait(self.client, timeout=10).until(expected.element_displayed(save_button))
+        # We wait for the fav button to be displayed with its label, the button
+        # renders before the label is set
+        ready = [
+            condition(SAVE_BUTTON_SELECTOR + FRESH, text="SAVE", visible=True),
+            condition(SAVE_BUTTON_SELECTOR + FRESH, text="SAVED", visible=True),
+        ]
 
-        try:
-            # Now we look for the correct text, it should say "SAVE"
-            Wait(self.client, timeout=6).until(self.save_button_contains_correct_text_save)
+        # This navigates Firefox to the passed URL, unless it was prefetched or is shown in the app
+        self.show(url, ready)
+        with self.timing.span("wait_save_button"):
+            result = self.waits.until("save_button", ready, SAVE_BUTTON_TIMEOUT)
+        if result is None:
+            self.logger.error(" > [ERROR] Feature: '{}'".format(url))
             try:
-                # Click it to add the feature (bookmark / place) to the Google Maps fav list
-                save_button.click()
+                save_button = self.client.find_element(By.CSS_SELECTOR, SAVE_BUTTON_SELECTOR + FRESH)
             except NoSuchElementException:
-                pass
+                self.logger.error(" > [ERROR] Unable to find save button")
+                return self.fail_waiting()
+            # The button is there but never got a known label, e.g. in a localized UI
+            self.logger.error(" > [ERROR] Save button contains unknown text '{}'".format(save_button.text))
+            return self.fail(utils.constants.FAILURE_BUTTON_TEXT)
+        self.record_page_weight()
 
-            try:
-                # Now the text should be "SAVED" and this indicates it was saved
-                Wait(self.client, timeout=6).until(self.save_button_contains_correct_text_saved)
-            except TimeoutException:
-                # We clicked but the fav button text didn't change, i.e. the click went wrong or timed out
-                self.logger.error(" > [ERROR] Feature: '{}'".format(url))
-                save_button = self.client.find_element(By.CLASS_NAME, "section-entity-action-save-button")
-                self.logger.error(" > [ERROR] Save button didn't switch to 'SAVED', it contains '{}'".format(save_button.text))
-                return ADD_FEATURE_FAILURE
-
-            return ADD_FEATURE_SUCCESS
-
-        except TimeoutException:
-            # This is the case if the fave button didn't contain the text "SAVE".
-            # This can happen if it contains "SAVED", but this shouldn't happen in the
-            # first place because we don't try to add features if we know that they're
-            # already added.
-            # So most likely something truly went wrong here.
+        if result[0] != 0:
+            # The fave button contains "SAVED", the place was saved after the bookmarks were
+            # fetched, e.g. by an earlier attempt whose confirmation timed out
+            self.logger.info(" > Feature was already saved")
+            return utils.constants.ADD_FEATURE_ALREADY_ADDED
+
+        try:
+            # Click it to add the feature (bookmark / place) to the Google Maps fav list
+            with self.timing.span("click"):
+                self.client.find_element(By.CSS_SELECTOR, SAVE_BUTTON_SELECTOR + FRESH).click()
+        except NoSuchElementException:
+            pass
+
+        # Now the text should be "SAVED" and this indicates it was saved
+        with self.timing.span("wait_saved"):
+            result = self.waits.until("saved", [condition(SAVE_BUTTON_SELECTOR + FRESH, text="SAVED")], SAVED_TIMEOUT)
+        if result is None:
+            # We clicked but the fav button text didn't change, i.e. the click went wrong or timed out
             self.logger.error(" > [ERROR] Feature: '{}'".format(url))
-            save_button = self.client.find_element(By.CLASS_NAME, "section-entity-action-save-button")
-            self.logger.error(" > [ERROR] Save button contained unknown text '{}'".format(save_button.text))
-            return ADD_FEATURE_UNKNOWN_ERROR
+            save_button = self.client.find_element(By.CSS_SELECTOR, SAVE_BUTTON_SELECTOR + FRESH)
+            self.logger.error(" > [ERROR] Save button didn't switch to 'SAVED', it contains '{}'".format(save_button.text))
+            return self.fail(utils.constants.FAILURE_TIMEOUT, utils.constants.ADD_FEATURE_FAILURE)
+
+        return utils.constants.ADD_FEATURE_SUCCESS
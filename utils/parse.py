@@ -1,33 +1,360 @@
 #!/usr/bin/env python2
 
+import csv
+import io
 import json
+import re
+import sys
 
 import xml.etree.ElementTree as ET
 
+from utils.places import is_maps_url
+from utils.store import Feature, KIND_PLACE, KIND_WAYPOINT
 
-def parse_geo_json(import_file):
+
+# Number of bytes read from an import file at once when streaming it
+CHUNK_SIZE = 64 * 1024
+
+# The property holding the URL of a feature in a Google Takeout GeoJSON file
+GEO_JSON_URL_KEY = "Google Maps URL"
+
+WHITESPACE = re.compile(r"[ \t\n\r]*")
+
+# Characters a JSON number may continue with
+NUMBER_TAIL = re.compile(r"[0-9+\-.eE]*")
+
+
+class _JsonStream:
+    """
+    A minimal pull reader on top of a file object, it decodes one
+    JSON value at a time and only keeps a small buffer in memory.
+    """
+
+    def __init__(self, f):
+        self.f = f
+        self.decoder = json.JSONDecoder()
+        self.buf = ""
+        self.pos = 0
+        self.eof = False
+
+    def fill(self):
+        """
+        Read the next chunk of the file into the buffer.
+        @return: Whether or not more data could be read
+        """
+        chunk = self.f.read(CHUNK_SIZE)
+        if not chunk:
+            self.eof = True
+            return False
+        self.buf = self.buf[self.pos:] + chunk
+        self.pos = 0
+        return True
+
+    def peek(self):
+        """
+        Skip whitespace and return the next character without consuming it.
+        @return: The next character or an empty string at the end of the file
+        """
+        while True:
+            self.pos = WHITESPACE.match(self.buf, self.pos).end()
+            if self.pos < len(self.buf) or not self.fill():
+                return self.buf[self.pos:self.pos + 1]
+
+    def expect(self, chars):
+        """
+        Consume the next character, it has to be one of the passed characters.
+        @return: The consumed character
+        """
+        char = self.peek()
+        if not char or char not in chars:
+            raise ValueError("Malformed GeoJSON, expected one of '{}' but found '{}'".format(chars, char))
+        self.pos += 1
+        return char
+
+    def value(self):
+        """
+        Decode the next JSON value, reading more data until it is complete.
+        @return: The decoded value
+        """
+        self.peek()
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buf, self.pos)
+                # A number could continue in the next chunk, e.g. '12' or '12.' of '12.5', so
+                # something else has to follow it
+                if self.eof or NUMBER_TAIL.match(self.buf, end).end() < len(self.buf):
+                    self.pos = end
+                    return value
+            except ValueError:
+                if self.eof:
+                    raise ValueError("Malformed GeoJSON, unable to decode value")
+            self.fill()
+
+
+def _seek_features(stream):
     """
-    Parses a GeoJSON file and extracts the Google Maps URLs.
-    @return: List of Google Maps URLs
+    Consumes the top level object up to the start of the 'features' array.
+    @return: -
     """
-    with open(import_file, "r") as f:
-        data = json.load(f)
-    if "features" in data:
-        urls = []
-        for feature in data["features"]:
-            assert "properties" in feature
-            assert "Google Maps URL" in feature["properties"]
-            urls.append(feature["properties"]["Google Maps URL"])
-        return urls
-    else:
+    stream.expect("{")
+    if stream.peek() == "}":
         raise ValueError("No 'features' key in GeoJSON found")
+    while True:
+        key = stream.value()
+        stream.expect(":")
+        if key == "features":
+            stream.expect("[")
+            return
+        # Skip any other member, e.g. "type"
+        stream.value()
+        if stream.expect(",}") == "}":
+            raise ValueError("No 'features' key in GeoJSON found")
+
+
+def _feature_coordinates(feature):
+    """
+    Extracts the coordinates of a feature, from its point geometry ('[lon, lat]')
+    or from the 'Location' property of Google Takeout.
+    @return: Tuple of latitude and longitude, (None, None) if it has none
+    """
+    geometry = feature.get("geometry") or {}
+    if geometry.get("type") == "Point" and len(geometry.get("coordinates") or []) >= 2:
+        lon, lat = geometry["coordinates"][:2]
+        if lat or lon:
+            return float(lat), float(lon)
+    location = feature["properties"].get("Location") or {}
+    if "Latitude" in location and "Longitude" in location:
+        return float(location["Latitude"]), float(location["Longitude"])
+    return None, None
+
+
+def _build_feature(feature):
+    """
+    Raises ValueError if the feature isn't an object with the URL of a place in its
+    properties or has invalid coordinates.
+    @return: The place of a GeoJSON feature
+    """
+    if not isinstance(feature, dict) or not isinstance(feature.get("properties"), dict):
+        raise ValueError("not an object with 'properties'")
+    properties = feature["properties"]
+    if GEO_JSON_URL_KEY not in properties:
+        raise ValueError("no '{}' property".format(GEO_JSON_URL_KEY))
+    try:
+        location = properties.get("Location") or {}
+        lat, lon = _feature_coordinates(feature)
+        title = properties.get("Title") or location.get("Business Name")
+        address = location.get("Address")
+    except (AttributeError, TypeError, ValueError):
+        raise ValueError("invalid 'geometry' or 'Location'")
+    return Feature(KIND_PLACE, properties[GEO_JSON_URL_KEY], lat, lon, title, address)
+
+
+def _iter_features(stream):
+    """
+    Yields the features following the current position.
+    @return: Generator of features
+    """
+    if stream.peek() == "]":
+        return
+    number = 0
+    while True:
+        number += 1
+        feature = stream.value()
+        try:
+            feature = _build_feature(feature)
+        except ValueError as e:
+            raise ValueError("Malformed GeoJSON, feature {}: {}".format(number, e))
+        yield feature
+        if stream.expect(",]") == "]":
+            return
+
+
+def read_geo_json(f):
+    """
+    Parses GeoJSON from a file object incrementally, only one feature is held in memory at
+    a time. Locating the 'features' key happens immediately, so ValueError is raised by this
+    call and not on first iteration. The file isn't closed.
+    @return: Generator of features (places)
+    """
+    stream = _JsonStream(f)
+    _seek_features(stream)
+    return _iter_features(stream)
+
+
+def _local_name(tag):
+    """
+    Strips the namespace from a tag, GPX 1.0 and 1.1 use different ones.
+    @return: The tag without namespace
+    """
+    return tag.rsplit("}", 1)[-1]
+
+
+def _iter_elements(events, tag, build, name):
+    """
+    Yields what build() makes of every complete element with the passed tag, unless
+    it's None. Every element is removed from the tree as soon as it was read, so
+    memory usage stays flat. Malformed XML raises ValueError naming the format.
+    @return: Generator of features
+    """
+    # Stack of open elements, needed to detach finished ones from their parent
+    stack = []
+    depth = 0
+    try:
+        for event, elem in events:
+            if event == "start":
+                stack.append(elem)
+                if _local_name(elem.tag) == tag:
+                    depth += 1
+                continue
+            stack.pop()
+            if _local_name(elem.tag) == tag:
+                depth -= 1
+                feature = build(elem)
+                if feature is not None:
+                    yield feature
+            elif depth > 0:
+                # Children of the element are needed until it's complete
+                continue
+            # Everything else is dropped straight away
+            elem.clear()
+            if stack:
+                stack[-1].remove(elem)
+    except ET.ParseError as e:
+        raise ValueError("Malformed {}, {}".format(name, e))
+
+
+def _link_kind(link):
+    """
+    A waypoint linking to Google Maps, like the ones of an export, is the place of its link.
+    @return: KIND_PLACE or KIND_WAYPOINT
+    """
+    return KIND_PLACE if link and is_maps_url(link) else KIND_WAYPOINT
+
+
+def _build_waypoint(elem):
+    """
+    @return: The feature of a GPX waypoint element, a place if it links to Google Maps
+    """
+    fields = {}
+    for child in elem:
+        child_tag = _local_name(child.tag)
+        if child_tag in ("name", "desc", "url"):
+            fields[child_tag] = child.text
+        elif child_tag == "link":
+            fields["link"] = child.attrib.get("href")
+    try:
+        lat, lon = float(elem.attrib["lat"]), float(elem.attrib["lon"])
+    except (KeyError, ValueError):
+        raise ValueError("Malformed GPX, waypoint without valid 'lat' and 'lon'")
+    link = fields.get("link", fields.get("url"))
+    return Feature(_link_kind(link), link, lat, lon, fields.get("name"), fields.get("desc"))
+
+
+def read_gpx(f):
+    """
+    Parses GPX from a file object incrementally and yields its waypoints ('wpt'),
+    tracks and routes are skipped. The file isn't closed.
+    @return: Generator of features (waypoints and places)
+    """
+    return _iter_elements(ET.iterparse(f, events=("start", "end")), "wpt", _build_waypoint, "GPX")
+
+
+def _build_placemark(elem):
+    """
+    @return: The feature of a KML placemark element, None if it isn't a point, a place if it
+    links to Google Maps
+    """
+    fields = {}
+    for child in elem.iter():
+        child_tag = _local_name(child.tag)
+        if child_tag in ("name", "description", "address", "coordinates") and child_tag not in fields:
+            fields[child_tag] = child.text
+        elif child_tag == "link" and child.attrib.get("href"):
+            fields["link"] = child.attrib["href"]
+        elif child_tag in ("LineString", "LinearRing", "Polygon"):
+            return None
+    # Coordinates are 'lon,lat[,alt]', several tuples belong to lines and polygons
+    coordinates = (fields.get("coordinates") or "").split()
+    if len(coordinates) != 1:
+        return None
+    try:
+        lon, lat = [float(value) for value in coordinates[0].split(",")[:2]]
+    except ValueError:
+        raise ValueError("Malformed KML, invalid coordinates '{}'".format(coordinates[0]))
+    return Feature(
+        _link_kind(fields.get("link")), fields.get("link"), lat, lon, fields.get("name"),
+        fields.get("address") or fields.get("description")
+    )
+
+
+def read_kml(f):
+    """
+    Parses KML (e.g. exported from Google My Maps) from a file object incrementally and
+    yields its point placemarks like GPX waypoints, lines and polygons are skipped.
+    The file isn't closed.
+    @return: Generator of features (waypoints and places)
+    """
+    return _iter_elements(ET.iterparse(f, events=("start", "end")), "Placemark", _build_placemark, "KML")
+
+
+# Columns of a CSV file by lower case header, e.g. of the saved lists of Google Takeout
+# ('Title', 'Note', 'URL') or of a spreadsheet with coordinates
+CSV_COLUMNS = {
+    "url": ("url", "google maps url", "link"),
+    "title": ("title", "name"),
+    "address": ("address",),
+    "lat": ("latitude", "lat"),
+    "lon": ("longitude", "lon", "lng"),
+}
+BOM = u"\ufeff"
+
+
+def _csv_text(value):
+    """
+    @return: A cell of a CSV file as text, None if it's empty
+    """
+    if isinstance(value, bytes):
+        value = value.decode("utf-8")
+    value = value.strip()
+    return value or None
+
+
+def _iter_rows(rows, columns):
+    """
+    Yields a place for every row with a URL and a waypoint for every row
+    with coordinates only, rows without either are skipped.
+    @return: Generator of features
+    """
+    for number, row in enumerate(rows, 2):
+        fields = dict((name, _csv_text(row[index])) for name, index in columns.items() if index < len(row))
+        try:
+            lat = float(fields["lat"]) if fields.get("lat") else None
+            lon = float(fields["lon"]) if fields.get("lon") else None
+        except ValueError:
+            raise ValueError("Malformed CSV, invalid coordinates in line {}".format(number))
+        if fields.get("url"):
+            yield Feature(KIND_PLACE, fields["url"], lat, lon, fields.get("title"), fields.get("address"))
+        elif lat is not None and lon is not None:
+            yield Feature(KIND_WAYPOINT, None, lat, lon, fields.get("title"), fields.get("address"))
 
 
-def parse_gpx(import_file):
+def read_csv(f):
     """
-    Parses a GPX file.
-    @return: List of Lat/Lon.
+    Parses CSV from a binary file object row by row. The columns are picked by the
+    header, see CSV_COLUMNS, which is read immediately, so ValueError is raised by
+    this call if neither a URL nor coordinates can be found. The file isn't closed.
+    @return: Generator of features (places and waypoints)
     """
-    tree = ET.parse(import_file)
-    name_tag = "{http://www.topografix.com/GPX/1/1}name"
-    return [(wpt.attrib["lat"], wpt.attrib["lon"], wpt.find(name_tag).text) for wpt in tree.getroot()]
+    if sys.version_info[0] >= 3:
+        f = io.TextIOWrapper(f, encoding="utf-8", newline="")
+    rows = csv.reader(f)
+    header = [(_csv_text(cell) or u"").lstrip(BOM).lower() for cell in next(rows, [])]
+    columns = {}
+    for name, candidates in CSV_COLUMNS.items():
+        for candidate in candidates:
+            if candidate in header:
+                columns[name] = header.index(candidate)
+                break
+    if "url" not in columns and ("lat" not in columns or "lon" not in columns):
+        raise ValueError("Malformed CSV, no 'URL' or 'Latitude' and 'Longitude' columns")
+    return _iter_rows(rows, columns)
@@ -0,0 +1,30 @@
+#!/usr/bin/env python2
+
+from collections import deque
+
+
+def prefetch_pipeline(helper, features, depth, needs_browser):
+    """
+    Yields the features in order, while the pages of the current and the
+    next 'depth' features are loaded ahead in the tabs of the helper.
+    Features for which needs_browser() is False aren't loaded.
+    @return: Generator of features
+    """
+    window = deque()
+    features = iter(features)
+    exhausted = False
+    while True:
+        while not exhausted and len(window) <= depth:
+            try:
+                window.append(next(features))
+            except StopIteration:
+                exhausted = True
+        if not window:
+            return
+        for upcoming in window:
+            if needs_browser(upcoming):
+                helper.prefetch(upcoming.url)
+        feature = window.popleft()
+        yield feature
+        # The tab is freed if the feature didn't use it after all
+        helper.discard_prefetch(feature.url)
@@ -0,0 +1,190 @@
+#!/usr/bin/env python2
+
+import re
+import sys
+
+from utils.spatial import SpatialIndex
+
+if sys.version_info[0] < 3:
+    from urlparse import urlparse, parse_qs
+    text_type = unicode  # noqa: F821
+else:
+    from urllib.parse import urlparse, parse_qs
+    text_type = str
+
+
+# Digits after the decimal point coordinates are rounded to, 5 digits are about a metre
+COORDINATE_PRECISION = 5
+
+# Feature ID, e.g. "0x355ab6cf888dc919:0xc91f62ebee004301", in query strings and in "data=!1s..." paths
+FTID = re.compile(r"0x[0-9a-fA-F]+:(0x[0-9a-fA-F]+)")
+# Coordinates, e.g. "34.3915027,132.4531578"
+COORDINATES = re.compile(r"^\s*(-?\d+(?:\.\d+)?)\s*,\s*(-?\d+(?:\.\d+)?)\s*$")
+# Map center in a path, e.g. "/maps/place/.../@34.3915027,132.4531578,17z"
+PATH_COORDINATES = re.compile(r"@(-?\d+(?:\.\d+)?),(-?\d+(?:\.\d+)?)")
+# Hosts of Google Maps, e.g. 'maps.google.com' or 'maps.app.goo.gl', and of Google, where it's under '/maps'
+MAPS_HOST = re.compile(r"^maps\.(google\.[a-z.]+|app\.goo\.gl)$")
+GOOGLE_HOST = re.compile(r"^(www\.)?(google\.[a-z.]+|goo\.gl)$")
+
+
+def _text(value):
+    """
+    Decodes a value to text, on Python 2 URLs are parsed as UTF-8 encoded bytes.
+    @return: The value as text
+    """
+    if isinstance(value, text_type):
+        return value
+    return value.decode("utf-8", "replace")
+
+
+def coordinates_key(lat, lon):
+    """
+    Builds the key of a pair of coordinates, rounded so tiny differences still match.
+    @return: The key
+    """
+    return u"ll:{:.{precision}f},{:.{precision}f}".format(
+        float(lat), float(lon), precision=COORDINATE_PRECISION
+    )
+
+
+def url_coordinates(url):
+    """
+    Extracts the coordinates a Google Maps URL points to, i.e. the ones of a
+    coordinate query ('q' / 'query' / 'll') or of the map center in the path.
+    @return: Tuple of latitude and longitude or None if the URL has none
+    """
+    if sys.version_info[0] < 3 and isinstance(url, text_type):
+        url = url.encode("utf-8")
+    parsed = urlparse(url.strip())
+    params = parse_qs(parsed.query)
+    for name in ("q", "query", "ll"):
+        coordinates = COORDINATES.match(params[name][0]) if name in params else None
+        if coordinates:
+            return float(coordinates.group(1)), float(coordinates.group(2))
+    coordinates = PATH_COORDINATES.search(parsed.path)
+    if coordinates:
+        return float(coordinates.group(1)), float(coordinates.group(2))
+    return None
+
+
+def place_key(url, lat=None, lon=None):
+    """
+    Extracts a stable key for the place a Google Maps URL points to, so different
+    URL styles for the same place match. In order of preference the key is built from
+    - the customer ID ('cid' / 'ludocid', or the second half of an 'ftid' which is the same number)
+    - the place ID ('query_place_id' / 'place_id')
+    - the coordinates in the URL or, if there are none, the passed ones
+    - the search query or the URL itself
+    @return: The key
+    """
+    if sys.version_info[0] < 3 and isinstance(url, text_type):
+        # Percent-encoded UTF-8 is only unquoted correctly from bytes
+        url = url.encode("utf-8")
+    parsed = urlparse(url.strip())
+    params = parse_qs(parsed.query)
+    for name in ("cid", "ludocid"):
+        if name in params and params[name][0].isdigit():
+            return u"cid:{}".format(int(params[name][0]))
+    ftid = FTID.search(url)
+    if ftid:
+        return u"cid:{}".format(int(ftid.group(1), 16))
+    for name in ("query_place_id", "place_id"):
+        if name in params:
+            return u"place_id:{}".format(_text(params[name][0]))
+    query = params.get("q", params.get("query", [None]))[0]
+    coordinates = COORDINATES.match(query) if query else None
+    if coordinates:
+        return coordinates_key(coordinates.group(1), coordinates.group(2))
+    if lat is not None and lon is not None:
+        return coordinates_key(lat, lon)
+    if query:
+        return u"q:{}".format(u" ".join(_text(query).lower().split()))
+    coordinates = PATH_COORDINATES.search(parsed.path)
+    if coordinates:
+        return coordinates_key(coordinates.group(1), coordinates.group(2))
+    return u"url:{}{}?{}".format(
+        _text(parsed.netloc.lower().replace("www.", "", 1)), _text(parsed.path), _text(parsed.query)
+    )
+
+
+def is_maps_url(url):
+    """
+    Checks if a URL points to Google Maps, e.g. the link of a GPX waypoint of an export.
+    @return: Whether or not it's a Google Maps URL
+    """
+    if sys.version_info[0] < 3 and isinstance(url, text_type):
+        url = url.encode("utf-8")
+    parsed = urlparse(url.strip())
+    host = parsed.netloc.lower().split(":")[0]
+    if MAPS_HOST.match(host):
+        return True
+    return GOOGLE_HOST.match(host) is not None and (parsed.path == "/maps" or parsed.path.startswith("/maps/"))
+
+
+def is_search_url(url):
+    """
+    Checks if a URL is a Google Maps search for a place ID ('api=1&query_place_id=...'),
+    like the ones built for places looked up with the Google Maps API.
+    @return: Whether or not it's a place search URL
+    """
+    if sys.version_info[0] < 3 and isinstance(url, text_type):
+        url = url.encode("utf-8")
+    params = parse_qs(urlparse(url.strip()).query)
+    return "api" in params and "query_place_id" in params
+
+
+class PlaceIndex:
+    """
+    A hash index of place keys, membership checks work with
+    any URL style for the same place and are O(1). Places with
+    known coordinates are indexed spatially as well.
+    """
+
+    def __init__(self, urls=()):
+        """
+        Initialise the index with the passed URLs.
+        """
+        self.keys = set()
+        self.locations = SpatialIndex()
+        for url in urls:
+            self.add(url)
+
+    def add(self, url, lat=None, lon=None):
+        """
+        Add the place of the passed URL, the coordinates are taken
+        from the URL if none are passed.
+        @return: -
+        """
+        self.keys.add(place_key(url, lat, lon))
+        coordinates = (lat, lon) if lat is not None and lon is not None else url_coordinates(url)
+        if coordinates is not None:
+            self.locations.add(*coordinates)
+
+    def contains_key(self, key):
+        """
+        @return: Whether or not a place with the passed key, see place_key(), was added
+        """
+        return key in self.keys
+
+    def near(self, lat, lon, max_distance):
+        """
+        Looks for a place within the passed distance in metres of the coordinates.
+        @return: The distance to the nearest place or None if there is none
+        """
+        return self.locations.near(lat, lon, max_distance)
+
+    def within(self, lat, lon, max_distance):
+        """
+        Checks if a place lies within the passed distance in metres of the coordinates, the
+        spatial index is prepared for the distance by the first call, see SpatialIndex.prepare().
+        @return: Whether or not there is such a place
+        """
+        if max_distance != self.locations.prepared:
+            self.locations.prepare(max_distance)
+        return self.locations.within(lat, lon, max_distance)
+
+    def __contains__(self, url):
+        return place_key(url) in self.keys
+
+    def __len__(self):
+        return len(self.keys)
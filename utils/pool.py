@@ -0,0 +1,88 @@
+#!/usr/bin/env python2
+
+import sys
+import threading
+import time
+
+if sys.version_info[0] < 3:
+    from Queue import Queue, Empty
+else:
+    from queue import Queue, Empty
+
+
+class WorkerPool:
+    """
+    A pool of worker threads, every worker owns one helper (e.g. a
+    Marionette session) and pulls tasks from a shared queue.
+    """
+
+    def __init__(self, logger, helpers):
+        """
+        Initialise the pool, it expects a logger instance and one helper per worker.
+        """
+        self.logger = logger
+        self.helpers = helpers
+
+    def _feed(self, tasks, task_queue, errors):
+        """
+        Feeds the tasks into the queue and signals the end to every worker.
+        The queue is bounded, so the tasks are consumed lazily.
+        @return: -
+        """
+        try:
+            for task in tasks:
+                task_queue.put(task)
+        except Exception as e:
+            # Reading the tasks failed, e.g. a malformed import file
+            errors.append(e)
+        finally:
+            for _ in self.helpers:
+                task_queue.put(None)
+
+    def _work(self, helper, func, task_queue, result_queue):
+        """
+        Runs the passed function for every task until the end is signalled.
+        @return: -
+        """
+        try:
+            while True:
+                task = task_queue.get()
+                if task is None:
+                    return
+                start = time.time()
+                try:
+                    result, error = func(helper, task), None
+                except Exception as e:
+                    result, error = None, e
+                result_queue.put((task, result, error, time.time() - start))
+        finally:
+            result_queue.put(None)
+
+    def map(self, func, tasks):
+        """
+        Runs func(helper, task) for every task on the workers.
+        @return: Generator of (task, result, error, duration) in order of completion
+        """
+        task_queue = Queue(maxsize=2 * len(self.helpers))
+        result_queue = Queue()
+        errors = []
+        threads = [threading.Thread(target=self._feed, args=(tasks, task_queue, errors))]
+        for helper in self.helpers:
+            threads.append(threading.Thread(target=self._work, args=(helper, func, task_queue, result_queue)))
+        for thread in threads:
+            # Don't keep the process alive on Ctrl-C
+            thread.daemon = True
+            thread.start()
+        running = len(self.helpers)
+        while running > 0:
+            try:
+                # Blocking without a timeout would swallow Ctrl-C on Python 2
+                item = result_queue.get(True, 1)
+            except Empty:
+                continue
+            if item is None:
+                running -= 1
+            else:
+                yield item
+        if errors:
+            raise errors[0]
@@ -0,0 +1,271 @@
+#!/usr/bin/env python2
+
+import json
+import sys
+import threading
+from collections import namedtuple
+
+if sys.version_info[0] < 3:
+    from urllib import urlencode
+else:
+    from urllib.parse import urlencode
+
+from utils.places import is_search_url, url_coordinates
+from utils.pool import WorkerPool
+from utils.spatial import distance
+from utils.store import Feature, KIND_PLACE
+
+
+# Candidates farther away from a waypoint than this (in metres) are never accepted
+RESOLVE_RADIUS = 100
+
+# Number of concurrent lookups
+RESOLVE_WORKERS = 8
+
+# Fields requested for the candidates of a named waypoint
+PLACE_FIELDS = ["place_id", "name", "geometry/location"]
+
+# The URL a resolved place is saved with, it opens the place page like the interactive mode
+SEARCH_URL = "https://www.google.com/maps/search/?{}"
+
+# A place found near a waypoint, the distance is in metres
+Candidate = namedtuple("Candidate", ["place_id", "name", "distance"])
+
+# The outcome of resolving a waypoint or a place, either the place or the reason it wasn't resolved
+Resolution = namedtuple("Resolution", ["feature", "place", "reason", "candidates"])
+
+
+def search_url(query, place_id):
+    """
+    Builds the Google Maps URL of a place.
+    @return: The URL
+    """
+    if sys.version_info[0] < 3 and isinstance(query, unicode):  # noqa: F821
+        query = query.encode("utf-8")
+    return SEARCH_URL.format(urlencode([("api", "1"), ("query", query), ("query_place_id", place_id)]))
+
+
+def waypoint_label(waypoint):
+    """
+    @return: The name of a waypoint or, if it has none, its coordinates
+    """
+    return waypoint.title or u"{},{}".format(waypoint.lat, waypoint.lon)
+
+
+def _normalise(name):
+    """
+    @return: The name in lower case with collapsed whitespace
+    """
+    return u" ".join((name or u"").lower().split())
+
+
+def names_match(a, b):
+    """
+    Compares two place names loosely, one has to contain the other.
+    @return: Whether or not the names match
+    """
+    a, b = _normalise(a), _normalise(b)
+    return bool(a) and bool(b) and (a in b or b in a)
+
+
+def feature_coordinates(feature):
+    """
+    @return: The coordinates of a feature or, if it has none, the ones in its URL, None if neither has any
+    """
+    if feature.has_coordinates:
+        return feature.lat, feature.lon
+    return url_coordinates(feature.url) if feature.url else None
+
+
+class PlaceResolver:
+    """
+    Resolves GPX waypoints (name and coordinates) to places with the Google Maps API,
+    so they can be saved unattended. A waypoint is only resolved if exactly one place
+    near it fits, every other one is written to a review file instead. Optionally the
+    legacy URLs of places ('?cid=...', '?q=...&ftid=...'), which only reach the place
+    page after redirects and a search, are resolved to place ID URLs by the title and
+    coordinates of the place the same way. A place which isn't resolved keeps its URL.
+    """
+
+    def __init__(self, logger, client, review_file, radius=RESOLVE_RADIUS, workers=RESOLVE_WORKERS,
+                 waypoints=True, places=False, needs_lookup=None):
+        """
+        Initialise the resolver, it expects a logger instance, a (cached) googlemaps.Client
+        and the path of the review file. Places are only looked up if needs_lookup() is
+        True for them, e.g. not if they were already added.
+        """
+        self.logger = logger
+        self.client = client
+        self.review_file = review_file
+        self.radius = radius
+        self.workers = workers
+        self.waypoints = waypoints
+        self.places = places
+        self.needs_lookup = needs_lookup
+        self.lock = threading.Lock()
+        self.review = None
+        self.resolved = 0
+        self.reviews = 0
+        # Places with a legacy URL which were looked up and the ones resolved of them
+        self.place_lookups = 0
+        self.places_resolved = 0
+
+    def candidates(self, waypoint):
+        """
+        Looks up the places near a waypoint (or a place), by its name if it has one.
+        @return: List of candidates within the radius, nearest first
+        """
+        lat, lon = feature_coordinates(waypoint)
+        if waypoint.title:
+            response = self.client.find_place(
+                waypoint.title, "textquery", fields=PLACE_FIELDS,
+                location_bias="circle:{}@{},{}".format(self.radius, lat, lon)
+            )
+            results = response.get("candidates", [])
+        else:
+            response = self.client.places_nearby(location=(lat, lon), radius=self.radius)
+            results = response.get("results", [])
+        candidates = []
+        for result in results:
+            location = result.get("geometry", {}).get("location")
+            if not location or "place_id" not in result:
+                continue
+            d = distance(lat, lon, location["lat"], location["lng"])
+            if d <= self.radius:
+                candidates.append(Candidate(result["place_id"], result.get("name"), d))
+        return sorted(candidates, key=lambda candidate: candidate.distance)
+
+    def resolve(self, waypoint):
+        """
+        Resolves a waypoint. A named one needs exactly one candidate with a matching
+        name, one without a name needs exactly one candidate at all.
+        @return: The resolution
+        """
+        candidates = self.candidates(waypoint)
+        if not candidates:
+            return Resolution(waypoint, None, "no place within {} m".format(self.radius), candidates)
+        if waypoint.title:
+            matching = [candidate for candidate in candidates if names_match(waypoint.title, candidate.name)]
+            if len(matching) != 1:
+                return Resolution(waypoint, None, "{} places named alike within {} m".format(
+                    len(matching), self.radius
+                ), candidates)
+            match = matching[0]
+        else:
+            if len(candidates) != 1:
+                return Resolution(waypoint, None, "{} places within {} m".format(len(candidates), self.radius), candidates)
+            match = candidates[0]
+        name = match.name or waypoint.title
+        place = Feature(KIND_PLACE, search_url(name, match.place_id), waypoint.lat, waypoint.lon, name)
+        return Resolution(waypoint, place, None, candidates)
+
+    def is_legacy_place(self, feature):
+        """
+        Checks if a place has a URL other than a place ID one and can be looked up, i.e.
+        it has a title and coordinates.
+        @return: Whether or not the place should be resolved
+        """
+        if feature.is_waypoint or not feature.title or is_search_url(feature.url):
+            return False
+        if feature_coordinates(feature) is None:
+            return False
+        return self.needs_lookup is None or self.needs_lookup(feature)
+
+    def resolve_place(self, feature):
+        """
+        Resolves the legacy URL of a place, it needs exactly one candidate with a matching name.
+        The resolved place keeps the title, address and coordinates of the feature.
+        @return: The resolution
+        """
+        candidates = self.candidates(feature)
+        matching = [candidate for candidate in candidates if names_match(feature.title, candidate.name)]
+        if len(matching) != 1:
+            return Resolution(feature, None, "{} places named alike within {} m".format(
+                len(matching), self.radius
+            ), candidates)
+        place = Feature(
+            KIND_PLACE, search_url(matching[0].name or feature.title, matching[0].place_id),
+            feature.lat, feature.lon, feature.title, feature.address
+        )
+        return Resolution(feature, place, None, candidates)
+
+    def _resolve_feature(self, helper, feature):
+        """
+        Worker function of resolve_all(), features which aren't resolved are kept.
+        @return: The resolution or None
+        """
+        if feature.is_waypoint:
+            return self.resolve(feature) if self.waypoints else None
+        if self.places and self.is_legacy_place(feature):
+            return self.resolve_place(feature)
+        return None
+
+    def write_review(self, waypoint, reason, candidates):
+        """
+        Append a waypoint which couldn't be resolved to the review file, one JSON object per line.
+        @return: -
+        """
+        with self.lock:
+            if self.review is None:
+                self.review = open(self.review_file, "w")
+            self.review.write(json.dumps({
+                "name": waypoint.title,
+                "lat": waypoint.lat,
+                "lon": waypoint.lon,
+                "desc": waypoint.address,
+                "reason": reason,
+                "candidates": [{
+                    "place_id": candidate.place_id,
+                    "name": candidate.name,
+                    "distance": round(candidate.distance, 1),
+                    "url": search_url(candidate.name or waypoint.title or u"", candidate.place_id),
+                } for candidate in candidates],
+            }, sort_keys=True) + "\n")
+            self.review.flush()
+            self.reviews += 1
+
+    def resolve_all(self, features):
+        """
+        Replaces the waypoints among the features by their places and, if enabled, the
+        legacy URLs of places by place ID URLs. The lookups run concurrently ahead of the
+        consumer, waypoints which couldn't be resolved are written to the review file and
+        dropped, places which couldn't be resolved are kept as they are.
+        @return: Generator of features, in order of completion
+        """
+        pool = WorkerPool(self.logger, [self.client] * self.workers)
+        for feature, resolution, error, duration in pool.map(self._resolve_feature, features):
+            if not feature.is_waypoint:
+                if error is not None:
+                    self.place_lookups += 1
+                    self.logger.error(u" > [RESOLVE] {}: {}".format(feature, error))
+                elif resolution is not None:
+                    self.place_lookups += 1
+                    if resolution.place is not None:
+                        self.places_resolved += 1
+                        self.logger.debug(u" > [RESOLVE] {}: {}".format(feature, resolution.place.url))
+                        yield resolution.place
+                        continue
+                    self.logger.debug(u" > [RESOLVE] {}: {}, keeping the URL".format(feature, resolution.reason))
+                yield feature
+            elif error is not None:
+                self.logger.error(u" > [RESOLVE] {}: {}".format(waypoint_label(feature), error))
+                self.write_review(feature, u"lookup failed: {}".format(error), [])
+            elif resolution is None:
+                yield feature
+            elif resolution.place is None:
+                self.logger.debug(u" > [RESOLVE] {}: {}".format(waypoint_label(feature), resolution.reason))
+                self.write_review(feature, resolution.reason, resolution.candidates)
+            else:
+                self.resolved += 1
+                self.logger.debug(u" > [RESOLVE] {}: {}".format(waypoint_label(feature), resolution.place.url))
+                yield resolution.place
+
+    def close(self):
+        """
+        Close the review file.
+        @return: -
+        """
+        with self.lock:
+            if self.review is not None:
+                self.review.close()
+                self.review = None
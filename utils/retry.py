@@ -0,0 +1,60 @@
+#!/usr/bin/env python2
+
+import threading
+import time
+from collections import Counter
+
+from utils.constants import RETRYABLE_FAILURES, DEFAULT_RETRIES, DEFAULT_RETRY_BACKOFF
+
+
+class RetryQueue:
+    """
+    Collects the features which failed for a transient reason, so they are retried once
+    the import is through instead of failing for good. Retries happen in rounds, the
+    pause before each round doubles, and a feature failing again is deferred to the next
+    round until the retries are used up. Every failure is counted by its reason.
+    """
+
+    def __init__(self, retries=DEFAULT_RETRIES, backoff=DEFAULT_RETRY_BACKOFF):
+        self.retries = retries
+        self.backoff = backoff
+        self.lock = threading.Lock()
+        self.pending = []
+        # The current round, 0 is the import itself
+        self.round = 0
+        self.failures = Counter()
+        # Number of features which were saved by a retry
+        self.recovered = 0
+
+    def defer(self, feature, reason):
+        """
+        Counts a failure and defers the feature to the next round, if the
+        reason is transient and the retries aren't used up yet.
+        @return: Whether or not the feature was deferred
+        """
+        with self.lock:
+            self.failures[reason] += 1
+            if reason not in RETRYABLE_FAILURES or self.round >= self.retries:
+                return False
+            self.pending.append(feature)
+            return True
+
+    def rounds(self):
+        """
+        Hands out the deferred features round by round, after the backoff. It's meant
+        to be iterated once the import is through, the caller retries every feature
+        of a round and defers the ones which failed again before asking for the next.
+        @return: Generator of (round, list of features) tuples
+        """
+        while True:
+            with self.lock:
+                if not self.pending or self.round >= self.retries:
+                    return
+                features, self.pending = self.pending, []
+                self.round += 1
+                pause = self.backoff * 2 ** (self.round - 1)
+            time.sleep(pause)
+            yield self.round, features
+
+    def __len__(self):
+        return len(self.pending)
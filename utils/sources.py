@@ -0,0 +1,149 @@
+#!/usr/bin/env python2
+
+import glob
+import hashlib
+import os
+import struct
+
+from utils.archives import read_zip, read_tar
+from utils.parse import read_geo_json, read_gpx, read_kml, read_csv
+from utils.places import place_key, coordinates_key
+
+
+# Readers of the import formats by file suffix, every one takes a binary file object
+# and yields its features, archives are read member by member
+IMPORT_FORMATS = (
+    (".json", read_geo_json),
+    (".gpx", read_gpx),
+    (".kml", read_kml),
+    (".csv", read_csv),
+    (".zip", read_zip),
+    (".kmz", read_zip),
+    (".tgz", read_tar),
+    (".tar.gz", read_tar),
+    (".tar", read_tar),
+)
+
+# Characters which make an argument a glob pattern
+GLOB_CHARACTERS = "*?["
+
+
+def import_format(path):
+    """
+    Picks the reader of a file by its suffix, see IMPORT_FORMATS.
+    @return: The reader or None if the format is unknown
+    """
+    for suffix, reader in IMPORT_FORMATS:
+        if path.lower().endswith(suffix):
+            return reader
+    return None
+
+
+def expand_import_files(arguments):
+    """
+    Expands the passed files, directories and glob patterns to the files to import.
+    Directories are searched recursively for files of a known format, files found
+    twice (e.g. by overlapping patterns) are only imported once.
+    @return: List of (path, reader) tuples in the order they were passed
+    @raise ValueError: If an argument matches nothing or a file has an unknown format
+    """
+    files = []
+    seen = set()
+    for argument in arguments:
+        if any(c in argument for c in GLOB_CHARACTERS):
+            paths = sorted(glob.glob(argument))
+            if not paths:
+                raise ValueError("No files match '{}'".format(argument))
+        else:
+            paths = [argument]
+        for path in paths:
+            if os.path.isdir(path):
+                candidates = []
+                for root, dirs, names in os.walk(path):
+                    dirs.sort()
+                    candidates.extend(os.path.join(root, name) for name in sorted(names) if import_format(name))
+            elif os.path.exists(path):
+                if import_format(path) is None:
+                    raise ValueError("Unknown file format supplied: '{}'".format(path))
+                candidates = [path]
+            else:
+                raise ValueError("No such file or directory: '{}'".format(path))
+            for candidate in candidates:
+                # The files are only opened once they are read, so they are checked here
+                if not os.access(candidate, os.R_OK):
+                    raise ValueError("Unable to read file '{}'".format(candidate))
+                real_path = os.path.realpath(candidate)
+                if real_path not in seen:
+                    seen.add(real_path)
+                    files.append((candidate, import_format(candidate)))
+    return files
+
+
+def feature_key(feature):
+    """
+    Builds the key of the place a feature points to, see utils.places.place_key().
+    Waypoints without a link are keyed by their coordinates.
+    @return: The key
+    """
+    if feature.is_waypoint:
+        if feature.url:
+            return place_key(feature.url, feature.lat, feature.lon)
+        return coordinates_key(feature.lat, feature.lon)
+    return place_key(feature.url)
+
+
+def key_digest(key):
+    """
+    Shortens a key to 64 bits, the chance of two of a million keys colliding is below 1e-7.
+    @return: The digest as integer
+    """
+    return struct.unpack("<q", hashlib.md5(key.encode("utf-8")).digest()[:8])[0]
+
+
+class ImportStream:
+    """
+    Reads the features of several import files lazily, file by file, while they are
+    imported. A feature pointing to a place which already came up, in the same or an
+    earlier file, is dropped. Only the digests of the keys of the places are kept in
+    memory, features are counted as they are read.
+    """
+
+    def __init__(self, files):
+        """
+        Initialise the stream with the passed (path, reader) files, every file is
+        only opened once it's read, so any number of files can be imported.
+        """
+        self.files = files
+        self.digests = set()
+        # Number of features per file read so far, after dropping the duplicates
+        self.counts = []
+        self.duplicates = 0
+        self.waypoints = 0
+
+    def __len__(self):
+        return sum(self.counts)
+
+    def __iter__(self):
+        """
+        Reads the files, malformed and unreadable files raise ValueError
+        naming the file once they are reached.
+        @return: Generator of features
+        """
+        for path, reader in self.files:
+            self.counts.append(0)
+            try:
+                with open(path, "rb") as f:
+                    for feature in reader(f):
+                        digest = key_digest(feature_key(feature))
+                        if digest in self.digests:
+                            self.duplicates += 1
+                            continue
+                        self.digests.add(digest)
+                        if feature.is_waypoint:
+                            self.waypoints += 1
+                        self.counts[-1] += 1
+                        yield feature
+            except IOError as e:
+                raise ValueError("{}: Unable to read file: {}".format(path, e.strerror or e))
+            except ValueError as e:
+                raise ValueError("{}: {}".format(path, e))
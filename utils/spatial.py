@@ -0,0 +1,241 @@
+#!/usr/bin/env python2
+
+import math
+
+
+# Mean radius of the earth in metres
+EARTH_RADIUS = 6371000.0
+
+# Metres per degree of latitude
+METRES_PER_DEGREE = math.pi * EARTH_RADIUS / 180
+
+# Size of a grid cell in degrees, about 1.1 km of latitude
+GRID_CELL_SIZE = 0.01
+
+# Smallest size of a grid cell in degrees (about 11 m), see cell_size()
+MIN_CELL_SIZE = 0.0001
+
+# The equirectangular distance of points is trusted to rule them out or in beyond this
+# factor, for the short distances the index is queried for it's off by far less
+EQUIRECTANGULAR_MARGIN = 1.02
+
+# Closer to the poles than this all longitudes are scanned, the
+# cells of a row shrink to nothing there
+MAX_SCAN_LATITUDE = 89.0
+
+# Points closer to the poles than this are kept by row as well, so scanning all
+# longitudes doesn't look at every cell of a row
+POLAR_LATITUDE = 88.0
+
+
+def distance(lat1, lon1, lat2, lon2):
+    """
+    Calculates the great-circle distance between two coordinates (haversine formula).
+    @return: The distance in metres
+    """
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    d_phi = phi2 - phi1
+    d_lambda = math.radians(lon2 - lon1)
+    a = math.sin(d_phi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(d_lambda / 2) ** 2
+    return 2 * EARTH_RADIUS * math.asin(min(1.0, math.sqrt(a)))
+
+
+def cell_size(max_distance):
+    """
+    Picks the size of the grid cells for queries within the passed distance in metres.
+    @return: The size of a cell in degrees
+    """
+    if max_distance <= 0:
+        return GRID_CELL_SIZE
+    return max(max_distance / METRES_PER_DEGREE, MIN_CELL_SIZE)
+
+
+class SpatialIndex:
+    """
+    A uniform grid of coordinates, points are bucketed by the cell they lie in.
+    A proximity query only looks at the cells within the passed distance, so it
+    doesn't depend on the number of points but on how dense they are. Prepared for
+    a distance, see prepare(), a query for it looks at a single cell.
+    """
+
+    def __init__(self, cell_size=GRID_CELL_SIZE):
+        """
+        Initialise an empty index with cells of the passed size in degrees.
+        """
+        self.cell_size = cell_size
+        # Number of cells around the globe, longitudes wrap around
+        self.columns = int(round(360 / cell_size))
+        self.cells = {}
+        self.count = 0
+        # The points close to the poles by row, see POLAR_LATITUDE
+        self.polar_rows = {}
+        # The distance in metres the index is prepared for and the points within it of every cell
+        self.prepared = None
+        self.neighbourhoods = {}
+        # Bounds of the rows for the prepared distance, see bounds()
+        self.row_bounds = {}
+
+    def cell(self, lat, lon):
+        """
+        @return: The row and column of the cell the coordinates lie in
+        """
+        return int(math.floor(lat / self.cell_size)), int(math.floor(lon / self.cell_size)) % self.columns
+
+    def add(self, lat, lon):
+        """
+        Add a point.
+        @return: -
+        """
+        lat, lon = float(lat), float(lon)
+        row, column = self.cell(lat, lon)
+        self.cells.setdefault(row * self.columns + column, []).append((lat, lon))
+        self.count += 1
+        if abs(lat) >= POLAR_LATITUDE:
+            self.polar_rows.setdefault(row, []).append((lat, lon))
+        if self.prepared is None:
+            return
+        d_lat = self.prepared / METRES_PER_DEGREE
+        scan_lat = abs(lat) + d_lat
+        if scan_lat >= MAX_SCAN_LATITUDE:
+            # Only queries close to the poles reach it, they scan the cells
+            return
+        # The rows and columns of the cells whose coordinates may lie within the distance
+        span = int(math.ceil(d_lat / math.cos(math.radians(scan_lat)) / self.cell_size))
+        width = self.columns
+        for r in range(row - 1, row + 2):
+            offset = r * width
+            for c in range(column - span, column + span + 1):
+                self.neighbourhoods.setdefault(offset + c % width, []).append((lat, lon))
+
+    def prepare(self, max_distance):
+        """
+        Rebuilds the grid with cells of about the passed distance in metres, see cell_size(),
+        and keeps the points within reach of every cell with it. A query for this distance
+        only looks at the cell of its coordinates then, at the price of a few times the memory.
+        @return: -
+        """
+        if max_distance == self.prepared:
+            return
+        points = [point for points in self.cells.values() for point in points]
+        self.cell_size = cell_size(max_distance)
+        self.columns = int(round(360 / self.cell_size))
+        self.cells = {}
+        self.count = 0
+        self.polar_rows = {}
+        self.prepared = max_distance if max_distance > 0 else None
+        self.neighbourhoods = {}
+        self.row_bounds = {}
+        for lat, lon in points:
+            self.add(lat, lon)
+
+    def candidates(self, lat, lon, max_distance):
+        """
+        @return: The points which may lie within the passed distance in metres of the coordinates
+        """
+        if not self.cells:
+            return ()
+        size = self.cell_size
+        width = self.columns
+        d_lat = max_distance / METRES_PER_DEGREE
+        scan_lat = abs(lat) + d_lat
+        if max_distance == self.prepared and scan_lat + d_lat < MAX_SCAN_LATITUDE:
+            return self.neighbourhoods.get(int(math.floor(lat / size)) * width + int(math.floor(lon / size)) % width, ())
+        # A degree of longitude gets shorter towards the poles, close to them every column is scanned
+        d_lon = 180.0 if scan_lat >= MAX_SCAN_LATITUDE else min(d_lat / math.cos(math.radians(scan_lat)), 180.0)
+        # Only the cells overlapping the bounding box of the distance are scanned,
+        # for short distances that's mostly the cell of the coordinates alone
+        first_column = int(math.floor((lon - d_lon) / size))
+        last_column = min(int(math.floor((lon + d_lon) / size)), first_column + width - 1)
+        rows = range(int(math.floor((lat - d_lat) / size)), int(math.floor((lat + d_lat) / size)) + 1)
+        if last_column - first_column + 1 >= width and abs(lat) - d_lat >= POLAR_LATITUDE:
+            # Every longitude is within reach, the points of the rows are the candidates
+            return [point for r in rows for point in self.polar_rows.get(r, ())]
+        # Cells are keyed by a single number, it's cheaper to hash than a tuple
+        cells = self.cells
+        points = []
+        for r in rows:
+            offset = r * width
+            for c in range(first_column, last_column + 1):
+                points.extend(cells.get(offset + c % width, ()))
+        return points
+
+    def bounds(self, row, max_distance):
+        """
+        Most points are told apart by their squared equirectangular distance, which is much
+        cheaper than the haversine formula. For queries from the passed row of the grid,
+        longitudes are scaled with the shortest degree of longitude within reach to rule points
+        out and with the longest one to take them in, so neither is done wrongly. Close to the
+        poles points are ruled out by their latitude only and none is taken in. The bounds of
+        the rows are kept for the distance the index is prepared for.
+        @return: The squared scales of longitudes to rule points out and in, the squared limits
+        in degrees of latitude to rule them out and in, and whether or not the points within reach
+        of every cell of the row are kept, see prepare()
+        """
+        bounds = self.row_bounds.get(row) if max_distance == self.prepared else None
+        if bounds is not None:
+            return bounds
+        d_lat = max_distance / METRES_PER_DEGREE
+        limit = d_lat * d_lat
+        low, high = sorted((abs(row * self.cell_size), abs((row + 1) * self.cell_size)))
+        if high + d_lat >= MAX_SCAN_LATITUDE:
+            bounds = (0.0, 0.0, limit * EQUIRECTANGULAR_MARGIN, -1.0, False)
+        else:
+            bounds = (
+                math.cos(math.radians(high + d_lat)) ** 2, math.cos(math.radians(max(low - d_lat, 0.0))) ** 2,
+                limit * EQUIRECTANGULAR_MARGIN, limit / EQUIRECTANGULAR_MARGIN,
+                max_distance == self.prepared and high + 2 * d_lat < MAX_SCAN_LATITUDE
+            )
+        if max_distance == self.prepared:
+            self.row_bounds[row] = bounds
+        return bounds
+
+    def near(self, lat, lon, max_distance):
+        """
+        Looks for the nearest point within the passed distance in metres.
+        @return: The distance to the nearest point or None if there is none
+        """
+        lat, lon = float(lat), float(lon)
+        points = self.candidates(lat, lon, max_distance)
+        if not points:
+            return None
+        outer, inner, outer_limit, inner_limit, _ = self.bounds(int(math.floor(lat / self.cell_size)), max_distance)
+        nearest = None
+        for point in points:
+            dy = point[0] - lat
+            # Longitudes wrap around at the antimeridian
+            dx = (point[1] - lon + 180.0) % 360.0 - 180.0
+            if dy * dy + dx * dx * outer > outer_limit:
+                continue
+            d = distance(lat, lon, point[0], point[1])
+            if d <= max_distance and (nearest is None or d < nearest):
+                nearest = d
+        return nearest
+
+    def within(self, lat, lon, max_distance):
+        """
+        Checks if any point lies within the passed distance in metres, it stops at the first one.
+        @return: Whether or not there is such a point
+        """
+        lat, lon = float(lat), float(lon)
+        size = self.cell_size
+        row = int(math.floor(lat / size))
+        outer, inner, outer_limit, inner_limit, kept = self.bounds(row, max_distance)
+        if kept:
+            # The common case of compare_features(), a single lookup
+            points = self.neighbourhoods.get(row * self.columns + int(math.floor(lon / size)) % self.columns, ())
+        else:
+            points = self.candidates(lat, lon, max_distance)
+        for point in points:
+            dy = point[0] - lat
+            dy *= dy
+            dx = (point[1] - lon + 180.0) % 360.0 - 180.0
+            dx *= dx
+            if dy + dx * outer > outer_limit:
+                continue
+            # Only the points in between need the haversine formula
+            if dy + dx * inner < inner_limit or distance(lat, lon, point[0], point[1]) <= max_distance:
+                return True
+        return False
+
+    def __len__(self):
+        return self.count
@@ -0,0 +1,193 @@
+#!/usr/bin/env python2
+
+import mmap
+import tempfile
+from array import array
+
+
+# Kinds of features: a place with a Google Maps URL and a GPX waypoint
+KIND_PLACE = 0
+KIND_WAYPOINT = 1
+
+# Size (in bytes) of the text buffer up to which it's kept in memory, a larger one is
+# moved to a temporary file and memory-mapped once the store is complete
+SPILL_SIZE = 64 * 1024 * 1024
+
+# Missing coordinates are stored as NaN
+NAN = float("nan")
+
+
+class Feature(object):
+    """
+    A feature of an import file: a place (Google Maps URL, coordinates, title and address)
+    or a GPX waypoint (link, coordinates, name and description). Coordinates are floats or
+    None. It's a new-style class, as only those support slots, which keep an instance at
+    the size of a tuple.
+    """
+
+    __slots__ = ("kind", "url", "lat", "lon", "title", "address")
+
+    def __init__(self, kind, url, lat=None, lon=None, title=None, address=None):
+        self.kind = kind
+        self.url = url
+        self.lat = lat
+        self.lon = lon
+        self.title = title
+        self.address = address
+
+    @property
+    def is_waypoint(self):
+        return self.kind == KIND_WAYPOINT
+
+    @property
+    def has_coordinates(self):
+        return self.lat is not None and self.lon is not None
+
+    def label(self):
+        """
+        @return: The URL of a place, the name or coordinates of a waypoint
+        """
+        if self.kind == KIND_PLACE:
+            return self.url
+        return self.title or u"{},{}".format(self.lat, self.lon)
+
+    def __unicode__(self):
+        label = self.label()
+        return label.decode("utf-8") if isinstance(label, bytes) else label
+
+    def __str__(self):
+        label = self.label()
+        return label if isinstance(label, str) else label.encode("utf-8")
+
+    def __repr__(self):
+        return "Feature({!r}, {!r}, {!r}, {!r}, {!r}, {!r})".format(
+            self.kind, self.url, self.lat, self.lon, self.title, self.address
+        )
+
+    def __eq__(self, other):
+        return isinstance(other, Feature) and all(
+            getattr(self, name) == getattr(other, name) for name in self.__slots__
+        )
+
+    def __ne__(self, other):
+        return not self == other
+
+
+def _encode(text):
+    """
+    @return: The UTF-8 bytes of a text, None is stored as empty text
+    """
+    if text is None:
+        return b""
+    if isinstance(text, bytes):
+        return text
+    return text.encode("utf-8")
+
+
+class FeatureStore:
+    """
+    Columnar storage of features: kinds and coordinates are kept in arrays and the URLs,
+    titles and addresses in one UTF-8 buffer, every text is addressed by its end offset.
+    A feature takes about 41 bytes plus its text, instead of several hundred as objects.
+    Once the buffer grows beyond the spill size it's moved to a temporary file, which is
+    memory-mapped for reading, so the operating system pages it in and out as needed.
+    """
+
+    # Number of texts per feature: URL, title and address
+    TEXTS = 3
+
+    def __init__(self, spill_size=SPILL_SIZE):
+        self.spill_size = spill_size
+        self.kinds = array("b")
+        self.lats = array("d")
+        self.lons = array("d")
+        # End offsets of the texts in the buffer, TEXTS per feature
+        self.offsets = array("L")
+        self.size = 0
+        self.buffer = bytearray()
+        self.file = None
+        self.map = None
+
+    def append(self, feature):
+        """
+        Adds a feature, the store mustn't be sealed yet.
+        @return: The index of the feature
+        """
+        assert self.map is None, "The store is sealed"
+        self.kinds.append(feature.kind)
+        self.lats.append(NAN if feature.lat is None else feature.lat)
+        self.lons.append(NAN if feature.lon is None else feature.lon)
+        url, title, address = _encode(feature.url), _encode(feature.title), _encode(feature.address)
+        end_url = self.size + len(url)
+        end_title = end_url + len(title)
+        self.size = end_title + len(address)
+        self.offsets.extend((end_url, end_title, self.size))
+        data = url + title + address
+        if self.file is not None:
+            self.file.write(data)
+        else:
+            self.buffer.extend(data)
+        if self.file is None and len(self.buffer) > self.spill_size:
+            self.spill()
+        return len(self.kinds) - 1
+
+    def spill(self):
+        """
+        Moves the text buffer to a temporary file, it's deleted once closed.
+        @return: -
+        """
+        self.file = tempfile.TemporaryFile(prefix="spi-store-")
+        self.file.write(self.buffer)
+        self.buffer = bytearray()
+
+    def seal(self):
+        """
+        Finishes writing, a spilled buffer is memory-mapped for reading.
+        @return: -
+        """
+        if self.file is not None and self.map is None and self.size > 0:
+            self.file.flush()
+            self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def _text(self, index):
+        """
+        @return: The text with the passed offset index or None if it's empty
+        """
+        start = self.offsets[index - 1] if index > 0 else 0
+        end = self.offsets[index]
+        if start == end:
+            return None
+        data = self.map[start:end] if self.map is not None else bytes(self.buffer[start:end])
+        return data.decode("utf-8")
+
+    def __len__(self):
+        return len(self.kinds)
+
+    def __getitem__(self, i):
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError("Feature index out of range")
+        lat, lon = self.lats[i], self.lons[i]
+        # NaN is the only value which isn't equal to itself
+        if lat != lat or lon != lon:
+            lat, lon = None, None
+        first = i * self.TEXTS
+        return Feature(self.kinds[i], self._text(first), lat, lon, self._text(first + 1), self._text(first + 2))
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+    def close(self):
+        """
+        Releases the buffer and, if it was spilled, deletes the temporary file.
+        @return: -
+        """
+        if self.map is not None:
+            self.map.close()
+            self.map = None
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+        self.buffer = bytearray()
@@ -0,0 +1,131 @@
+#!/usr/bin/env python2
+
+import threading
+import time
+from collections import deque
+
+import utils.constants
+
+
+# Rates are in places per second and per worker
+RATE_INITIAL = 0.5
+RATE_MIN = 0.05
+# Increase of the rate after every fast success, by this factor until the rate was cut
+# for the first time (slow start) and by this step afterwards ...
+RATE_START_FACTOR = 1.5
+RATE_INCREASE = 0.05
+# ... and the factor the rate is cut by on a failure or a slow save
+RATE_DECREASE = 0.5
+# Number of tokens per worker which can be saved up, i.e. the maximum burst
+BUCKET_CAPACITY = 2.0
+# A save counts as slow if it takes longer than this factor of the percentile of the
+# recent saves, but never below the minimum latency (in seconds), so jitter isn't pushback
+SLOW_FACTOR = 2.0
+SLOW_PERCENTILE = 0.95
+SLOW_MIN_LATENCY = 5.0
+# Number of recent saves the percentile is taken over and how many it needs at least
+LATENCY_WINDOW = 50
+LATENCY_MIN_SAMPLES = 10
+# Pause (in seconds) after the first failure, it doubles with every further one
+BACKOFF_INITIAL = 5.0
+BACKOFF_MAX = 300.0
+
+# Results which indicate that Google may be pushing back
+FAILURE_RESULTS = (
+    utils.constants.ADD_FEATURE_FAILURE,
+    utils.constants.ADD_FEATURE_UNKNOWN_ERROR,
+)
+
+
+class AdaptiveThrottle:
+    """
+    A token bucket between the features and the browser. Its rate rises
+    multiplicatively until the first cut, then additively, while saves
+    succeed quickly and is cut multiplicatively,
+    together with an exponential pause, when saves fail or slow down.
+    It's shared by all workers, its rates are the ones of a worker
+    times the number of workers.
+    """
+
+    def __init__(self, logger, max_rate, workers=1):
+        """
+        Initialise the throttle, it expects a logger instance, the maximum
+        rate of a worker and the number of workers.
+        """
+        self.logger = logger
+        self.workers = workers
+        self.max_rate = max_rate * workers
+        self.rate = min(RATE_INITIAL * workers, self.max_rate)
+        self.capacity = BUCKET_CAPACITY * workers
+        self.tokens = 1.0
+        self.updated = time.time()
+        self.paused_until = 0.0
+        self.failures = 0
+        # Whether or not the rate was cut yet, until then it rises quickly
+        self.cut = False
+        # Latencies (in seconds) of the recent saves which weren't slow
+        self.latencies = deque(maxlen=LATENCY_WINDOW)
+        self.lock = threading.Lock()
+
+    def _refill(self, now):
+        """
+        Add the tokens accrued since the last refill.
+        @return: -
+        """
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def acquire(self):
+        """
+        Block until the next browser action may start.
+        @return: -
+        """
+        while True:
+            with self.lock:
+                now = time.time()
+                self._refill(now)
+                if now >= self.paused_until and self.tokens >= 1.0:
+                    self.tokens -= 1.0
+                    return
+                delay = max(self.paused_until - now, (1.0 - self.tokens) / self.rate)
+            time.sleep(delay)
+
+    def threshold(self):
+        """
+        @return: The latency (in seconds) beyond which a save counts as slow,
+                 None while there are too few recent saves to tell
+        """
+        if len(self.latencies) < LATENCY_MIN_SAMPLES:
+            return None
+        latencies = sorted(self.latencies)
+        percentile = latencies[min(len(latencies) - 1, int(len(latencies) * SLOW_PERCENTILE))]
+        return max(SLOW_MIN_LATENCY, percentile * SLOW_FACTOR)
+
+    def report(self, result, latency):
+        """
+        Adapt the rate to the result and latency of a browser action. Only saves
+        define what normal latency is, e.g. a place which turned out to be
+        already added returns without saving.
+        @return: -
+        """
+        with self.lock:
+            threshold = self.threshold() if result == utils.constants.ADD_FEATURE_SUCCESS else None
+            slow = threshold is not None and latency > threshold
+            if result in FAILURE_RESULTS or slow:
+                self.failures += 1
+                self.cut = True
+                self.rate = max(RATE_MIN * self.workers, self.rate * RATE_DECREASE)
+                backoff = min(BACKOFF_MAX, BACKOFF_INITIAL * 2 ** (self.failures - 1))
+                self.paused_until = time.time() + backoff
+                self.tokens = 0.0
+                self.logger.info(u" > [THROTTLE] {}, pausing for {:.1f}s at {:.2f} places/s".format(
+                    "Slow save ({:.2f}s)".format(latency) if slow else "Failed save", backoff, self.rate
+                ))
+            else:
+                self.failures = 0
+                if self.cut:
+                    self.rate = min(self.max_rate, self.rate + RATE_INCREASE * self.workers)
+                else:
+                    self.rate = min(self.max_rate, self.rate * RATE_START_FACTOR)
+                if result == utils.constants.ADD_FEATURE_SUCCESS:
+                    self.latencies.append(latency)
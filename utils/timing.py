@@ -1,14 +1,97 @@
 #!/usr/bin/env python2
 
+import json
+import math
+import threading
 import time
+from contextlib import contextmanager
 
-from functools import reduce
+
+# Neighbouring histogram buckets differ by this factor, i.e. percentiles
+# are accurate to within 5%
+BUCKET_RATIO = 1.05
+LOG_BUCKET_RATIO = math.log(BUCKET_RATIO)
+# Bucket for values of 0 (or below), they have no logarithm
+ZERO_BUCKET = -(10 ** 6)
+
+# Percentiles reported in the summary and in the exports
+PERCENTILES = (50, 95, 99)
+
+# Name of the histogram of the interims
+INTERIM = "interim"
+
+
+class Histogram:
+    """
+    A streaming histogram with logarithmic buckets. It uses constant memory
+    (one counter per occupied bucket), no matter how many values are added.
+    """
+
+    def __init__(self):
+        self.buckets = {}
+        self.count = 0
+        self.total = 0.0
+        self.min = None
+        self.max = None
+
+    def add(self, value):
+        """
+        Add a value to the histogram.
+        @return: -
+        """
+        index = int(math.floor(math.log(value) / LOG_BUCKET_RATIO)) if value > 0 else ZERO_BUCKET
+        self.buckets[index] = self.buckets.get(index, 0) + 1
+        self.count += 1
+        self.total += value
+        self.min = value if self.min is None else min(self.min, value)
+        self.max = value if self.max is None else max(self.max, value)
+
+    def mean(self):
+        """
+        @return: The mean of all values
+        """
+        return self.total / self.count if self.count > 0 else 0
+
+    def percentile(self, percentile):
+        """
+        Estimate a percentile from the buckets.
+        @return: The estimated percentile
+        """
+        if self.count == 0:
+            return 0
+        rank = percentile / 100.0 * self.count
+        seen = 0
+        for index in sorted(self.buckets):
+            seen += self.buckets[index]
+            if seen >= rank:
+                if index == ZERO_BUCKET:
+                    return 0
+                # The geometric middle of the bucket, but never outside of what was seen
+                return min(max(BUCKET_RATIO ** (index + 0.5), self.min), self.max)
+        return self.max
+
+    def summary(self):
+        """
+        @return: A dictionary containing count, sum, mean, min, max and the percentiles
+        """
+        summary = {
+            "count": self.count,
+            "sum": self.total,
+            "mean": self.mean(),
+            "min": self.min if self.min is not None else 0,
+            "max": self.max if self.max is not None else 0,
+        }
+        for percentile in PERCENTILES:
+            summary["p{}".format(percentile)] = self.percentile(percentile)
+        return summary
 
 
 class Timing:
     """
     A class to help us time operations in the main program.
-    It's able to track overall and interim times.
+    It's able to track overall and interim times as well as named,
+    nestable spans (e.g. 'add_feature/navigate'), which all feed
+    streaming histograms. Sizes (in bytes) are tracked apart from them.
     """
 
     def __init__(self, logger):
@@ -17,40 +100,164 @@ class Timing:
         """
         self.start = time.time()
         self.interim_counter = 0
-        self.interim_times = {0: 0}
+        self.interim_start = None
+        self.histograms = {}
+        self.sizes = {}
+        self.lock = threading.Lock()
+        # Every thread has its own stack of open spans
+        self.local = threading.local()
         self.logger = logger
         self.logger.debug(u" > [TIMING] Start: {:.6f}".format(self.start))
 
+    def record(self, name, value):
+        """
+        Add a value to the named histogram.
+        @return: -
+        """
+        with self.lock:
+            if name not in self.histograms:
+                self.histograms[name] = Histogram()
+            self.histograms[name].add(value)
+
+    def record_size(self, name, value):
+        """
+        Add a size in bytes to the named histogram of sizes.
+        @return: -
+        """
+        with self.lock:
+            if name not in self.sizes:
+                self.sizes[name] = Histogram()
+            self.sizes[name].add(value)
+
+    @contextmanager
+    def span(self, name):
+        """
+        Time the enclosed block. Spans opened inside of it are recorded
+        with this span's name as prefix, e.g. 'add_feature/navigate'.
+        @return: Context manager
+        """
+        stack = getattr(self.local, "stack", None)
+        if stack is None:
+            stack = self.local.stack = []
+        stack.append(name)
+        full_name = "/".join(stack)
+        start = time.time()
+        try:
+            yield
+        finally:
+            self.record(full_name, time.time() - start)
+            stack.pop()
+
     def start_interim(self):
         """
         Start a new interim timer.
         @return: -
         """
-        self.interim_times[self.interim_counter] = time.time()
+        self.interim_start = time.time()
 
     def stop_interim(self):
         """
         Stop the interim timer. It automatically increments the number of
-        interims. Nested interims are currently _not_ supported.
+        interims. Nested interims are currently _not_ supported, use spans.
         @return: -
         """
-        self.interim_times[self.interim_counter] = time.time() - self.interim_times[self.interim_counter]
-        self.logger.debug(u" > [TIMING] Interim: {:.6f}".format(self.interim_times[self.interim_counter]))
-        self.interim_counter += 1
+        self.add_interim(time.time() - self.interim_start)
+
+    def add_interim(self, duration):
+        """
+        Record an interim duration which was measured elsewhere, e.g.
+        by a worker thread. It increments the number of interims.
+        @return: -
+        """
+        self.record(INTERIM, duration)
+        with self.lock:
+            self.interim_counter += 1
+        self.logger.debug(u" > [TIMING] Interim: {:.6f}".format(duration))
 
     def get_summary(self):
         """
         Stop the overall timer and print out a summary.
         @return: A dictionary containing the overall duration, an
-                 average of the interims and the number of interims.
+                 average of the interims, the number of interims and
+                 a summary of every span and of every size.
         """
         self.stop = time.time()
         self.logger.debug(u" > [TIMING] Stop: {:.6f}".format(self.stop))
+        with self.lock:
+            spans = dict((name, histogram.summary()) for name, histogram in self.histograms.items())
+            sizes = dict((name, histogram.summary()) for name, histogram in self.sizes.items())
+        interim = spans.get(INTERIM, Histogram().summary())
         times = {
             "total": self.stop - self.start,
-            "interim_average": reduce((lambda x, y: x + y), self.interim_times.values()) / self.interim_counter if self.interim_counter > 0 else 0,
-            "interim_counter": self.interim_counter
+            "interim_average": interim["mean"],
+            "interim_counter": self.interim_counter,
+            "spans": spans,
+            "sizes": sizes,
         }
+        for name in sorted(spans):
+            if name == INTERIM:
+                continue
+            summary = spans[name]
+            self.logger.info(
+                u" > [TIMING] {}: {} x, p50 {:.3f}, p95 {:.3f}, p99 {:.3f}, min {:.3f}, max {:.3f}".format(
+                    name, summary["count"], summary["p50"], summary["p95"], summary["p99"], summary["min"], summary["max"]
+                )
+            )
+        for name in sorted(sizes):
+            summary = sizes[name]
+            self.logger.info(u" > [SIZE] {}: {} x, p50 {:.1f} KB, p95 {:.1f} KB, mean {:.1f} KB".format(
+                name, summary["count"], summary["p50"] / 1024.0, summary["p95"] / 1024.0, summary["mean"] / 1024.0
+            ))
         self.logger.info(u" > [TIMING] {:.6f} total time [s] elapsed".format(times["total"]))
         self.logger.info(u" > [TIMING] {:.6f} time [s] per bookmark / place".format(times["interim_average"]))
         return times
+
+    def export(self, path, times):
+        """
+        Export a summary as returned by get_summary(), the format is chosen
+        by the suffix of the path: '.prom' for a Prometheus textfile and
+        JSON otherwise.
+        @return: -
+        """
+        with open(path, "w") as f:
+            if path.endswith(".prom"):
+                f.write(self.to_prometheus(times))
+            else:
+                json.dump(times, f, indent=2, sort_keys=True)
+        self.logger.info(u" > [TIMING] Metrics written to '{}'".format(path))
+
+    @staticmethod
+    def to_prometheus(times):
+        """
+        Format a summary as returned by get_summary() in the Prometheus text format.
+        @return: The formatted summary
+        """
+        lines = [
+            "# TYPE spi_run_seconds gauge",
+            "spi_run_seconds {:.6f}".format(times["total"]),
+            "# TYPE spi_span_seconds summary",
+        ]
+        for name in sorted(times["spans"]):
+            summary = times["spans"][name]
+            for percentile in PERCENTILES:
+                lines.append('spi_span_seconds{{span="{}",quantile="{}"}} {:.6f}'.format(
+                    name, percentile / 100.0, summary["p{}".format(percentile)]
+                ))
+            lines.append('spi_span_seconds_sum{{span="{}"}} {:.6f}'.format(name, summary["sum"]))
+            lines.append('spi_span_seconds_count{{span="{}"}} {}'.format(name, summary["count"]))
+        for stat in ("min", "max"):
+            lines.append("# TYPE spi_span_seconds_{} gauge".format(stat))
+            for name in sorted(times["spans"]):
+                lines.append('spi_span_seconds_{}{{span="{}"}} {:.6f}'.format(stat, name, times["spans"][name][stat]))
+        sizes = times.get("sizes", {})
+        if sizes:
+            lines.append("# TYPE spi_size_bytes summary")
+        for name in sorted(sizes):
+            summary = sizes[name]
+            for percentile in PERCENTILES:
+                lines.append('spi_size_bytes{{size="{}",quantile="{}"}} {:.0f}'.format(
+                    name, percentile / 100.0, summary["p{}".format(percentile)]
+                ))
+            lines.append('spi_size_bytes_sum{{size="{}"}} {:.0f}'.format(name, summary["sum"]))
+            lines.append('spi_size_bytes_count{{size="{}"}} {}'.format(name, summary["count"]))
+        return "\n".join(lines) + "\n"
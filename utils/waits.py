@@ -0,0 +1,144 @@
+#!/usr/bin/env python2
+
+import time
+from collections import deque
+
+from marionette_driver.errors import JavascriptException, ScriptTimeoutException
+
+
+# Number of recent latencies kept per wait to derive its timeout from
+LATENCY_SAMPLES = 200
+# Number of latencies needed before the default timeout is replaced
+LATENCY_MIN_SAMPLES = 20
+# Percentile of the observed latencies a timeout is based on ...
+LATENCY_PERCENTILE = 99
+# ... and the factor applied to it to allow for outliers
+TIMEOUT_FACTOR = 3.0
+# Timeouts never drop below this (in seconds) ...
+TIMEOUT_MIN = 1.0
+# ... and never grow beyond this factor of the default timeout
+TIMEOUT_MAX_FACTOR = 2.0
+
+# Resolves as soon as one of the conditions is met. It checks right away and then
+# on every DOM mutation, so no time is lost polling. A condition consists of a
+# CSS selector, an optional text (compared case-insensitively, as displayed) and
+# whether or not the element has to be visible.
+WAIT_SCRIPT = """
+let conditions = arguments[0];
+let timeout = arguments[1];
+let resolve = arguments[arguments.length - 1];
+function check() {
+  for (let i = 0; i < conditions.length; i++) {
+    let condition = conditions[i];
+    for (let element of document.querySelectorAll(condition.selector)) {
+      if (condition.visible && !element.getClientRects().length) {
+        continue;
+      }
+      let text = (element.innerText || "").trim();
+      if (condition.text !== null && text.toUpperCase() !== condition.text.toUpperCase()) {
+        continue;
+      }
+      return [i, text];
+    }
+  }
+  return null;
+}
+let result = check();
+if (result !== null) {
+  resolve(result);
+} else {
+  let timer;
+  let observer = new MutationObserver(() => {
+    let result = check();
+    if (result !== null) {
+      observer.disconnect();
+      clearTimeout(timer);
+      resolve(result);
+    }
+  });
+  observer.observe(document, {childList: true, subtree: true, attributes: true, characterData: true});
+  timer = setTimeout(() => {
+    observer.disconnect();
+    resolve(null);
+  }, timeout);
+}
+"""
+
+
+def condition(selector, text=None, visible=False):
+    """
+    Builds a condition for WaitEngine.until().
+    @return: The condition
+    """
+    return {"selector": selector, "text": text, "visible": visible}
+
+
+class LatencyTracker:
+    """
+    Keeps the recent latencies of every wait and derives timeouts from them.
+    """
+
+    def __init__(self):
+        self.samples = {}
+
+    def record(self, name, latency):
+        """
+        Record the latency of a wait which succeeded.
+        @return: -
+        """
+        if name not in self.samples:
+            self.samples[name] = deque(maxlen=LATENCY_SAMPLES)
+        self.samples[name].append(latency)
+
+    def timeout(self, name, default):
+        """
+        Derive the timeout of a wait from its observed latencies, the default
+        is used until enough latencies were observed.
+        @return: Timeout in seconds
+        """
+        samples = self.samples.get(name)
+        if not samples or len(samples) < LATENCY_MIN_SAMPLES:
+            return default
+        ordered = sorted(samples)
+        percentile = ordered[min(len(ordered) - 1, int(len(ordered) * LATENCY_PERCENTILE / 100.0))]
+        return min(max(percentile * TIMEOUT_FACTOR, TIMEOUT_MIN), default * TIMEOUT_MAX_FACTOR)
+
+
+class WaitEngine:
+    """
+    Waits for elements with a MutationObserver installed in the page instead
+    of polling with Marionette round trips.
+    """
+
+    def __init__(self, client, logger):
+        """
+        Initialise the wait engine, it expects a Marionette client and a logger instance.
+        """
+        self.client = client
+        self.logger = logger
+        self.latencies = LatencyTracker()
+
+    def until(self, name, conditions, default_timeout):
+        """
+        Wait until one of the conditions is met.
+        @return: A tuple of the index of the met condition and the text of
+                 the matching element, or None if the wait timed out
+        """
+        timeout = self.latencies.timeout(name, default_timeout)
+        start = time.time()
+        try:
+            result = self.client.execute_async_script(
+                WAIT_SCRIPT,
+                script_args=[conditions, int(timeout * 1000)],
+                # Leave the script some time to resolve by itself
+                script_timeout=int((timeout + 5) * 1000),
+            )
+        except (JavascriptException, ScriptTimeoutException) as e:
+            # E.g. the document was replaced while waiting
+            self.logger.debug(u" > [WAIT] {} failed: {}".format(name, e))
+            return None
+        if result is None:
+            self.logger.debug(u" > [WAIT] {} timed out after {:.2f}s".format(name, timeout))
+            return None
+        self.latencies.record(name, time.time() - start)
+        return result[0], result[1]
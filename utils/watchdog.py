@@ -0,0 +1,95 @@
+#!/usr/bin/env python2
+
+from collections import Counter, deque
+
+from utils.constants import DEFAULT_RECYCLE_EVERY, DEFAULT_MEMORY_LIMIT
+
+
+# Number of places whose latencies form the baseline and the recent window
+LATENCY_WINDOW = 50
+# A median latency of the recent window beyond this factor of the baseline counts as drift
+DRIFT_FACTOR = 1.5
+# Places between two measurements of the memory
+MEMORY_CHECK_EVERY = 50
+
+# Why a tab is recycled
+RECYCLE_PERIODIC = "periodic"
+RECYCLE_MEMORY = "memory"
+RECYCLE_DRIFT = "drift"
+
+
+def median(values):
+    """
+    @return: The median of the values
+    """
+    ordered = sorted(values)
+    middle = len(ordered) // 2
+    if len(ordered) % 2:
+        return ordered[middle]
+    return (ordered[middle - 1] + ordered[middle]) / 2.0
+
+
+class SessionWatchdog:
+    """
+    Keeps an eye on the health of a browser session. Every page leaves something behind,
+    so Firefox grows and saving gets slower the more places a tab showed. The watchdog
+    tells when the tab is due to be replaced: every so many places, once the memory of
+    Firefox crossed the limit or once the median latency of the recent saves drifted
+    away from the one of the first saves. One watchdog belongs to one session.
+    """
+
+    def __init__(self, recycle_every=DEFAULT_RECYCLE_EVERY, memory_limit=DEFAULT_MEMORY_LIMIT):
+        self.recycle_every = recycle_every
+        # Memory (in MB), 0 disables measuring it
+        self.memory_limit = memory_limit
+        # Median latency of the first saves of the session
+        self.baseline = None
+        self.recent = deque(maxlen=LATENCY_WINDOW)
+        # Places shown since the tab was replaced
+        self.places = 0
+        # Last measured memory (in MB)
+        self.memory = None
+        self.recycles = Counter()
+
+    def record(self, latency=None):
+        """
+        Counts a place, the latency of a successful save is kept.
+        @return: -
+        """
+        self.places += 1
+        if latency is None:
+            return
+        self.recent.append(latency)
+        if self.baseline is None and len(self.recent) == LATENCY_WINDOW:
+            self.baseline = median(self.recent)
+
+    def needs_memory(self):
+        """
+        @return: Whether or not the memory should be measured now
+        """
+        return self.memory_limit > 0 and self.places > 0 and self.places % MEMORY_CHECK_EVERY == 0
+
+    def check(self, memory=None):
+        """
+        Decides if the tab is due to be replaced, the memory (in MB) is passed if it was measured.
+        @return: The RECYCLE_* reason or None
+        """
+        if memory is not None:
+            self.memory = memory
+            if memory > self.memory_limit > 0:
+                return RECYCLE_MEMORY
+        if 0 < self.recycle_every <= self.places:
+            return RECYCLE_PERIODIC
+        if self.baseline is not None and len(self.recent) == LATENCY_WINDOW and \
+                median(self.recent) > self.baseline * DRIFT_FACTOR:
+            return RECYCLE_DRIFT
+        return None
+
+    def recycled(self, reason):
+        """
+        Starts over after the tab was replaced, the baseline is kept.
+        @return: -
+        """
+        self.recycles[reason] += 1
+        self.places = 0
+        self.recent.clear()